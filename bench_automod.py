@@ -0,0 +1,61 @@
+"""Benchmark the automod engine on a synthetic message corpus and report messages per second."""
+import argparse
+import random
+import string
+import time
+
+from modules.automod import AutomodEngine
+
+
+def random_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+
+def build_corpus(rng, vocabulary, blocked_words, messages, users):
+    corpus = []
+    for _ in range(messages):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(3, 30))]
+        if rng.random() < 0.02:
+            words.insert(rng.randrange(len(words)), rng.choice(blocked_words))
+        corpus.append((rng.randrange(users), " ".join(words)))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--words", type=int, default=1_000, help="Number of blocked words")
+    parser.add_argument("--regexes", type=int, default=20, help="Number of regex rules")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [random_word(rng) for _ in range(20_000)]
+    blocked_words = [random_word(rng) + "x" for _ in range(args.words)]
+    rules = [(i, "word", word) for i, word in enumerate(blocked_words)]
+    rules += [(args.words + i, "regex", rf"discord\.gg/{random_word(rng)}\w*") for i in range(args.regexes)]
+    corpus = build_corpus(rng, vocabulary, blocked_words, args.messages, args.users)
+
+    # Advance a synthetic clock per message so the spam counters see a realistic message rate
+    clock = [0.0]
+    engine = AutomodEngine(clock=lambda: clock[0])
+    started = time.perf_counter()
+    engine.set_rules(1, rules)
+    compile_time = time.perf_counter() - started
+
+    flagged = 0
+    started = time.perf_counter()
+    for user_id, content in corpus:
+        clock[0] += 0.01
+        if engine.check(1, user_id, content) is not None:
+            flagged += 1
+    elapsed = time.perf_counter() - started
+
+    print(f"Rules: {args.words} words + {args.regexes} regexes (compiled in {compile_time * 1000:.1f} ms)")
+    print(f"Messages: {args.messages} from {args.users} users, flagged {flagged}")
+    print(f"Elapsed: {elapsed:.2f} s, {args.messages / elapsed:,.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
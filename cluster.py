@@ -0,0 +1,128 @@
+# Run the bot as several worker processes, each owning a contiguous range of shards
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+READY_TIMEOUT = 600
+RESTART_DELAY = 5
+
+
+def recommended_shard_count(token):
+    request = urllib.request.Request(GATEWAY_URL, headers={"Authorization": f"Bot {token}", "User-Agent": "discord-modular-bot"})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)["shards"]
+
+
+def shard_ranges(shard_count, clusters):
+    """Split shard ids into `clusters` contiguous, nearly equal ranges."""
+    clusters = min(clusters, shard_count)
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for cluster in range(clusters):
+        end = start + size + (1 if cluster < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Cluster:
+    def __init__(self, cluster_id, shard_ids, shard_count, fake_gateway, ready_file=None):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.fake_gateway = fake_gateway
+        self.ready_file = ready_file
+        self.process = None
+
+    def environment(self):
+        env = dict(os.environ)
+        env["BOT_CLUSTER_ID"] = str(self.cluster_id)
+        env["BOT_SHARD_IDS"] = ",".join(map(str, self.shard_ids))
+        env["BOT_SHARD_COUNT"] = str(self.shard_count)
+        if self.cluster_id == 0:
+            env.pop("BOT_CLUSTER_WORKER", None)
+            env["BOT_CLUSTER_READY_FILE"] = self.ready_file
+        else:
+            env["BOT_CLUSTER_WORKER"] = "1"
+        if self.fake_gateway:
+            env["BOT_FAKE_GATEWAY"] = "1"
+        return env
+
+    def start(self):
+        print(f"Starting cluster {self.cluster_id} with shards {self.shard_ids[0]}-{self.shard_ids[-1]} of {self.shard_count}")
+        self.process = subprocess.Popen([sys.executable, "main.py"], env=self.environment())
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+def wait_for_ready(primary, ready_file, timeout):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(ready_file):
+        if primary.process.poll() is not None:
+            raise RuntimeError(f"Primary cluster exited with code {primary.process.returncode} before it was ready")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Primary cluster was not ready after {timeout}s")
+        time.sleep(0.5)
+
+
+def supervise(clusters, fake_gateway):
+    while True:
+        running = False
+        for cluster in clusters:
+            code = cluster.process.poll()
+            if code is None:
+                running = True
+            elif code != 0 and not fake_gateway:
+                print(f"Cluster {cluster.cluster_id} exited with code {code}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                cluster.start()
+                running = True
+        if not running:
+            return
+        time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as a cluster of sharded worker processes.")
+    parser.add_argument("--shards", type=int, help="Total shard count (default: config shard_count, else Discord's recommendation)")
+    parser.add_argument("--clusters", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--fake-gateway", action="store_true", help="Load extensions and replay shard events without connecting to Discord")
+    args = parser.parse_args()
+
+    with open("config.json", "r") as file:
+        config = json.load(file)
+
+    shard_count = args.shards or config.get("shard_count")
+    if not shard_count or shard_count == "auto":
+        shard_count = args.clusters if args.fake_gateway else recommended_shard_count(config["bot_token"])
+
+    ready_file = os.path.join(tempfile.gettempdir(), f"bot-cluster-ready-{os.getpid()}")
+    clusters = [Cluster(cluster_id, shard_ids, shard_count, args.fake_gateway, ready_file)
+                for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, args.clusters))]
+
+    try:
+        # The primary applies database migrations (and may restart itself for them) before anyone else starts
+        clusters[0].start()
+        wait_for_ready(clusters[0], ready_file, READY_TIMEOUT)
+        for cluster in clusters[1:]:
+            cluster.start()
+        supervise(clusters, args.fake_gateway)
+    except KeyboardInterrupt:
+        print("Stopping clusters...")
+    finally:
+        for cluster in clusters:
+            cluster.stop()
+        if os.path.exists(ready_file):
+            os.remove(ready_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+# Feed synthetic or recorded gateway events into the real cogs against fake guilds and report throughput, latency and DB growth
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord.ext import commands
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+LAUNCH_DIR = os.getcwd()
+GUILD_BASE = 900_000_000_000_000_000
+USER_BASE = 100_000_000_000_000_000
+WORDS = ["hello", "raid", "pokemon", "trade", "invite", "welcome", "gg", "lol", "server", "event", "giveaway", "nice"]
+
+# Slash commands the interaction stream picks from, with a generator for their options
+COMMANDS = {
+    "leaderboard": lambda rng, guild, users: {"period": rng.choice(["today", "week", "all_time"]), "limit": 10},
+    "join_stats": lambda rng, guild, users: {},
+    "invite_chain": lambda rng, guild, users: {"user": rng.choice(users)},
+    "modlog": lambda rng, guild, users: {"user": rng.choice(users), "limit": 10},
+    "get_pokemon": lambda rng, guild, users: {"pokemon_id": rng.randint(1, 151)},
+    "add_pokemon": lambda rng, guild, users: {"pokemon_id": rng.randint(1, 151), "name": "Missingno", "type": "normal"},
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class FakeRest:
+    """Emulates Discord REST latency plus 429s from per-route fixed-window buckets and random global limits."""
+
+    def __init__(self, rng, latency, jitter, bucket_limit, bucket_window, rate_limit_chance, retry_after):
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.bucket_limit = bucket_limit
+        self.bucket_window = bucket_window
+        self.rate_limit_chance = rate_limit_chance
+        self.retry_after = retry_after
+        self.buckets = {}
+        self.calls = {}
+        self.rate_limited = {}
+        self.rate_limit_wait = 0.0
+
+    async def request(self, route, major=None):
+        self.calls[route] = self.calls.get(route, 0) + 1
+        key = (route, major)
+        while True:
+            now = time.monotonic()
+            bucket = self.buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.bucket_window:
+                bucket = self.buckets[key] = [now, 0]
+            if bucket[1] >= self.bucket_limit:
+                wait = bucket[0] + self.bucket_window - now
+            elif self.rng.random() < self.rate_limit_chance:
+                wait = self.retry_after
+            else:
+                bucket[1] += 1
+                break
+            # discord.py sleeps out a 429 and retries, so the caller only sees the delay
+            self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+            self.rate_limit_wait += wait
+            await asyncio.sleep(wait)
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+
+
+class FakeUser:
+    def __init__(self, user_id, created_at=None):
+        self.id = user_id
+        self.name = f"user{user_id % 1_000_000}"
+        self.display_name = self.name
+        self.global_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.avatar = None
+        self.created_at = created_at or datetime.now(timezone.utc) - timedelta(days=365)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild, user_id, created_at=None, permissions=None):
+        super().__init__(user_id, created_at)
+        self.guild = guild
+        self.joined_at = datetime.now(timezone.utc)
+        self.roles = []
+        self.guild_permissions = permissions or discord.Permissions.none()
+
+    async def kick(self, reason=None):
+        await self.guild.rest.request("DELETE /guilds/{guild_id}/members/{user_id}", self.guild.id)
+
+    async def ban(self, reason=None, **kwargs):
+        await self.guild.ban(self, reason=reason)
+
+    async def add_roles(self, *roles, reason=None):
+        await self.guild.rest.request("PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.guild.id)
+
+    async def remove_roles(self, *roles, reason=None):
+        await self.guild.rest.request("DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.guild.id)
+
+    async def send(self, *args, **kwargs):
+        await self.guild.rest.request("POST /channels/{channel_id}/messages")
+
+
+class FakeInvite:
+    def __init__(self, code, inviter):
+        self.code = code
+        self.inviter = inviter
+        self.uses = 0
+
+
+class FakeRawMemberRemove:
+    def __init__(self, guild_id, user):
+        self.guild_id = guild_id
+        self.user = user
+
+
+class FakeChannel:
+    def __init__(self, guild, channel_id):
+        self.id = channel_id
+        self.guild = guild
+        self.name = f"channel-{channel_id % 1000}"
+        self.mention = f"<#{channel_id}>"
+        self.overwrites = {}
+
+    async def send(self, *args, **kwargs):
+        await self.guild.rest.request("POST /channels/{channel_id}/messages", self.id)
+
+    async def delete_messages(self, messages, reason=None):
+        await self.guild.rest.request("POST /channels/{channel_id}/messages/bulk-delete", self.id)
+
+    async def set_permissions(self, target, **kwargs):
+        await self.guild.rest.request("PUT /channels/{channel_id}/permissions/{overwrite_id}", self.id)
+
+
+class FakeMessage:
+    def __init__(self, message_id, channel, author, content):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+
+    async def delete(self):
+        await self.guild.rest.request("DELETE /channels/{channel_id}/messages/{message_id}", self.channel.id)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, rest, shard_count=1):
+        self.id = guild_id
+        self.rest = rest
+        self.name = f"guild-{guild_id % 10_000}"
+        self.shard_id = (guild_id >> 22) % shard_count
+        self.owner_id = USER_BASE
+        self.icon = None
+        self.chunked = True
+        self.roles = []
+        self.member_map = {}
+        self.invite_map = {}
+        self.channels = [FakeChannel(self, guild_id + 1)]
+
+    @property
+    def members(self):
+        return list(self.member_map.values())
+
+    @property
+    def member_count(self):
+        return len(self.member_map)
+
+    @property
+    def text_channels(self):
+        return self.channels
+
+    def get_member(self, user_id):
+        return self.member_map.get(user_id)
+
+    def get_channel_or_thread(self, channel_id):
+        return next((channel for channel in self.channels if channel.id == channel_id), None)
+
+    def get_channel(self, channel_id):
+        return self.get_channel_or_thread(channel_id)
+
+    def ensure_member(self, user_id, account_age_days=365):
+        member = self.member_map.get(user_id)
+        if member is None:
+            member = self.member_map[user_id] = FakeMember(self, user_id, datetime.now(timezone.utc) - timedelta(days=account_age_days))
+        return member
+
+    async def fetch_member(self, user_id):
+        await self.rest.request("GET /guilds/{guild_id}/members/{user_id}", self.id)
+        # The database helpers pass serveruser.user_id, which is stored as a string
+        return self.ensure_member(int(user_id))
+
+    async def fetch_members(self, limit=None):
+        for member in self.members:
+            yield member
+
+    async def invites(self):
+        await self.rest.request("GET /guilds/{guild_id}/invites", self.id)
+        return list(self.invite_map.values())
+
+    async def ban(self, user, reason=None, **kwargs):
+        await self.rest.request("PUT /guilds/{guild_id}/bans/{user_id}", self.id)
+
+    async def bulk_ban(self, users, reason=None, **kwargs):
+        await self.rest.request("POST /guilds/{guild_id}/bulk-ban", self.id)
+
+    async def unban(self, user, reason=None):
+        await self.rest.request("DELETE /guilds/{guild_id}/bans/{user_id}", self.id)
+
+    async def create_role(self, **kwargs):
+        await self.rest.request("POST /guilds/{guild_id}/roles", self.id)
+
+
+class FakeResponse:
+    def __init__(self, rest):
+        self.rest = rest
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, *args, **kwargs):
+        await self.rest.request("POST /interactions/{interaction_id}/{interaction_token}/callback")
+        self.done = True
+
+    async def defer(self, *args, **kwargs):
+        await self.send_message()
+
+    async def edit_message(self, *args, **kwargs):
+        await self.send_message()
+
+    async def send_modal(self, *args, **kwargs):
+        await self.send_message()
+
+
+class FakeFollowup:
+    def __init__(self, rest):
+        self.rest = rest
+
+    async def send(self, *args, **kwargs):
+        await self.rest.request("POST /webhooks/{application_id}/{interaction_token}")
+
+
+class FakeInteraction:
+    def __init__(self, interaction_id, bot, guild, user, command):
+        self.id = interaction_id
+        self.client = bot
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = guild.channels[0]
+        self.channel_id = self.channel.id
+        self.command = command
+        self.created_at = datetime.now(timezone.utc)
+        self.response = FakeResponse(guild.rest)
+        self.followup = FakeFollowup(guild.rest)
+
+
+class LoadTestBot(commands.Bot):
+    """A bot that never connects; guilds, users and REST calls are served by the fakes."""
+
+    def __init__(self, rest):
+        super().__init__(command_prefix="!", intents=discord.Intents.all())
+        self.rest = rest
+        self.fake_guilds = {}
+
+    @property
+    def guilds(self):
+        return list(self.fake_guilds.values())
+
+    def get_guild(self, guild_id):
+        return self.fake_guilds.get(guild_id)
+
+    async def fetch_guild(self, guild_id, **kwargs):
+        await self.rest.request("GET /guilds/{guild_id}", guild_id)
+        return self.fake_guilds[guild_id]
+
+    async def fetch_user(self, user_id):
+        await self.rest.request("GET /users/{user_id}")
+        return FakeUser(int(user_id))
+
+
+def generate_events(args, rng):
+    events = []
+    users = iter(range(USER_BASE + 1, USER_BASE + 10**12))
+    guild_ids = [GUILD_BASE + (index << 22) for index in range(args.guilds)]
+    invites = {}
+    for guild_id in guild_ids:
+        invites[guild_id] = []
+        for number in range(args.invites_per_guild):
+            code = f"{guild_id % 100_000:x}{number}"
+            invites[guild_id].append(code)
+            events.append({"t": 0.0, "type": "invite_create", "guild": guild_id, "code": code, "inviter": next(users)})
+
+    joins = []
+    for _ in range(args.joins):
+        guild_id = rng.choice(guild_ids)
+        joins.append({"t": rng.uniform(0, args.duration), "type": "member_join", "guild": guild_id, "user": next(users),
+                      "code": rng.choice(invites[guild_id]), "account_age_days": rng.randint(0, 2000)})
+    for _ in range(args.bursts):
+        # A raid: fresh accounts joining one guild through one invite within a couple of seconds
+        guild_id = rng.choice(guild_ids)
+        start, code = rng.uniform(0, args.duration), rng.choice(invites[guild_id])
+        for number in range(args.burst_size):
+            joins.append({"t": start + number * 0.02, "type": "member_join", "guild": guild_id, "user": next(users),
+                          "code": code, "account_age_days": rng.randint(0, 3)})
+    events += joins
+
+    for join in rng.sample(joins, int(len(joins) * args.leave_ratio)):
+        events.append({"t": join["t"] + rng.uniform(1, max(args.duration / 4, 1)), "type": "member_remove", "guild": join["guild"], "user": join["user"]})
+
+    members = [(join["guild"], join["user"]) for join in joins] or [(guild_id, USER_BASE) for guild_id in guild_ids]
+    for number in range(args.messages):
+        guild_id, user_id = rng.choice(members)
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+        events.append({"t": rng.uniform(0, args.duration), "type": "message", "guild": guild_id, "user": user_id, "message": number + 1, "content": content})
+
+    for _ in range(args.interactions):
+        guild_id, user_id = rng.choice(members)
+        name = rng.choice(list(COMMANDS))
+        targets = [user for guild, user in members if guild == guild_id][:50] or [user_id]
+        events.append({"t": rng.uniform(0, args.duration), "type": "interaction", "guild": guild_id, "user": USER_BASE,
+                       "command": name, "options": COMMANDS[name](rng, guild_id, targets)})
+
+    events.sort(key=lambda event: event["t"])
+    return events
+
+
+def read_events(path):
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_events(path, events):
+    with open(path, "w") as file:
+        for event in events:
+            file.write(json.dumps(event) + "\n")
+
+
+def database_stats(database):
+    from sqlalchemy import inspect, text
+    rows = {}
+    with database.engine.connect() as conn:
+        for table in inspect(database.engine).get_table_names():
+            rows[table] = conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+    size = 0
+    if database.engine.url.get_backend_name() == "sqlite" and database.engine.url.database:
+        for suffix in ("", "-wal", "-journal"):
+            path = database.engine.url.database + suffix
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+    return size, rows
+
+
+class Harness:
+    def __init__(self, bot, rest, shard_count):
+        self.bot = bot
+        self.rest = rest
+        self.shard_count = shard_count
+        self.latencies = {}
+        self.errors = {}
+        self.skipped = {}
+        self.interaction_ids = iter(range(1, 10**12))
+        self.moderator_permissions = discord.Permissions(administrator=True)
+
+    def guild(self, guild_id):
+        guild = self.bot.fake_guilds.get(guild_id)
+        if guild is None:
+            guild = self.bot.fake_guilds[guild_id] = FakeGuild(guild_id, self.rest, self.shard_count)
+        return guild
+
+    async def dispatch(self, event_name, *args):
+        handlers = self.bot.extra_events.get(f"on_{event_name}", [])
+        await asyncio.gather(*(handler(*args) for handler in handlers))
+
+    async def apply(self, event):
+        guild = self.guild(event["guild"])
+        kind = event["type"]
+        if kind == "invite_create":
+            invite = guild.invite_map[event["code"]] = FakeInvite(event["code"], guild.ensure_member(event["inviter"]))
+            await self.dispatch("invite_create", invite)
+        elif kind == "member_join":
+            member = guild.ensure_member(event["user"], event.get("account_age_days", 365))
+            invite = guild.invite_map.get(event.get("code"))
+            if invite is not None:
+                invite.uses += 1
+            await self.dispatch("member_join", member)
+        elif kind == "member_remove":
+            member = guild.member_map.pop(event["user"], None) or FakeMember(guild, event["user"])
+            await self.dispatch("member_remove", member)
+            await self.dispatch("raw_member_remove", FakeRawMemberRemove(guild.id, member))
+        elif kind == "message":
+            author = guild.ensure_member(event["user"])
+            await self.dispatch("message", FakeMessage(event["message"], guild.channels[0], author, event["content"]))
+        elif kind == "interaction":
+            await self.invoke(guild, event)
+        else:
+            raise ValueError(f"Unknown event type: {kind}")
+
+    async def invoke(self, guild, event):
+        command = self.bot.tree.get_command(event["command"])
+        if command is None:
+            self.skipped[event["command"]] = self.skipped.get(event["command"], 0) + 1
+            return
+        user = guild.ensure_member(event["user"])
+        user.guild_permissions = self.moderator_permissions
+        options = dict(event.get("options", {}))
+        if "user" in options:
+            options["user"] = guild.ensure_member(options["user"])
+        interaction = FakeInteraction(next(self.interaction_ids), self.bot, guild, user, command)
+        await command.callback(command.binding, interaction, **options)
+
+    async def run_event(self, event):
+        label = event["command"] if event["type"] == "interaction" else event["type"]
+        start = time.perf_counter()
+        try:
+            await self.apply(event)
+        except Exception as e:
+            key = f"{label}: {type(e).__name__}: {e}"[:200]
+            self.errors[key] = self.errors.get(key, 0) + 1
+        self.latencies.setdefault(label, []).append(time.perf_counter() - start)
+
+    async def replay(self, events, speed):
+        start = time.monotonic()
+        tasks = []
+        for event in events:
+            if speed > 0:
+                delay = event["t"] / speed - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # Like the gateway, events don't wait for earlier handlers to finish
+            tasks.append(asyncio.create_task(self.run_event(event)))
+        await asyncio.gather(*tasks)
+
+    async def drain(self, timeout):
+        # Raid joins are stored by a background batch task after the handlers return
+        invite_tracker = self.bot.get_cog("InviteTracker")
+        deadline = time.monotonic() + timeout
+        while invite_tracker is not None and invite_tracker.raid_tasks and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+
+
+def print_report(harness, elapsed, before, after, event_count):
+    print(f"\nReplayed {event_count} events across {len(harness.bot.fake_guilds)} guilds in {elapsed:.1f} s ({event_count / elapsed:,.0f} events/s)")
+    print(f"{'event':<16}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, values in sorted(harness.latencies.items()):
+        print(f"{label:<16}{len(values):>8}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.9) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+
+    rest = harness.rest
+    print(f"\nREST: {sum(rest.calls.values())} calls, {sum(rest.rate_limited.values())} rate limited ({rest.rate_limit_wait:.1f} s waiting)")
+    for route, count in sorted(rest.calls.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {count:>8}  {route}  ({rest.rate_limited.get(route, 0)} x 429)")
+
+    size_before, rows_before = before
+    size_after, rows_after = after
+    print(f"\nDatabase: {size_before / 1024:,.0f} KiB -> {size_after / 1024:,.0f} KiB")
+    for table in sorted(rows_after):
+        growth = rows_after[table] - rows_before.get(table, 0)
+        if growth:
+            print(f"  {table:<20} +{growth} rows ({rows_after[table]} total)")
+
+    if harness.skipped:
+        print(f"\nSkipped interactions for commands that aren't loaded: {harness.skipped}")
+    if harness.errors:
+        print("\nErrors:")
+        for error, count in sorted(harness.errors.items(), key=lambda item: item[1], reverse=True)[:20]:
+            print(f"  {count:>6}  {error}")
+    try:
+        import resource
+        print(f"\nPeak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MiB")
+    except ImportError:
+        pass
+
+
+async def restart_harness():
+    print("A module changed the schema, restarting the load test...")
+    os.environ["LOADTEST_RESTARTED"] = "1"
+    # Relative --workdir, --replay and --record paths are resolved from where the run was started
+    os.chdir(LAUNCH_DIR)
+    os.execl(sys.executable, sys.executable, os.path.join(REPO_ROOT, os.path.basename(sys.argv[0])), *sys.argv[1:])
+
+
+async def run(args, events):
+    database = importlib.import_module("modules.database")
+    rest = FakeRest(random.Random(args.seed), args.latency / 1000, args.jitter / 1000, args.bucket_limit,
+                    args.bucket_window, args.rate_limit_chance, args.retry_after)
+    bot = LoadTestBot(rest)
+    harness = Harness(bot, rest, args.shards)
+    output = io.StringIO() if not args.verbose else None
+
+    async with bot:
+        for module_name in args.modules.split(","):
+            module = importlib.import_module(f"modules.{module_name}")
+            await module.setup(bot, restart_harness)
+        before = database_stats(database)
+
+        start = time.monotonic()
+        with contextlib.redirect_stdout(output) if output is not None else contextlib.nullcontext():
+            await harness.replay(events, args.speed)
+            await harness.drain(args.drain)
+        elapsed = time.monotonic() - start
+
+        after = database_stats(database)
+        print_report(harness, elapsed, before, after, len(events))
+        for cog_name in list(bot.cogs):
+            await bot.remove_cog(cog_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the cogs with fake guilds and a synthetic or recorded event stream.")
+    parser.add_argument("--replay", help="Replay events from a JSONL file instead of generating them")
+    parser.add_argument("--record", help="Write the generated events to a JSONL file")
+    parser.add_argument("--record-only", action="store_true", help="Only write --record, don't run the load test")
+    parser.add_argument("--modules", default="database,invite_tracker,ultra_mod,pokedex", help="Modules to load, in order")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--joins", type=int, default=10_000)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds the generated stream spans")
+    parser.add_argument("--leave-ratio", type=float, default=0.1)
+    parser.add_argument("--bursts", type=int, default=2, help="Number of raid bursts")
+    parser.add_argument("--burst-size", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5_000)
+    parser.add_argument("--interactions", type=int, default=500)
+    parser.add_argument("--invites-per-guild", type=int, default=5)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier, 0 for as fast as possible")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=80, help="Mean REST latency in ms")
+    parser.add_argument("--jitter", type=float, default=20, help="REST latency standard deviation in ms")
+    parser.add_argument("--bucket-limit", type=int, default=5, help="Requests per route bucket window before a 429")
+    parser.add_argument("--bucket-window", type=float, default=1.0)
+    parser.add_argument("--rate-limit-chance", type=float, default=0.001, help="Chance of a random 429 per request")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--drain", type=float, default=60, help="Seconds to wait for background batches after the stream")
+    parser.add_argument("--workdir", default="loadtest_run", help="Directory for the database and logs of the run")
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite database in --workdir")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Show the cogs' output during the run")
+    args = parser.parse_args()
+
+    if args.replay:
+        events = read_events(args.replay)
+    else:
+        events = generate_events(args, random.Random(args.seed))
+    if args.record:
+        write_events(args.record, events)
+        print(f"Recorded {len(events)} events to {args.record}")
+        if args.record_only:
+            return
+
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    database_path = os.path.join(workdir, "loadtest.db")
+    # The run's models are generated in the workdir instead of rewriting modules/dynamic_models.py
+    models_path = os.path.join(workdir, "dynamic_models.py")
+    if not args.database_url and not os.environ.get("LOADTEST_RESTARTED"):
+        for path in (database_path, models_path):
+            if os.path.exists(path):
+                os.remove(path)
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{database_path}"
+    os.environ["DYNAMIC_MODELS_DIR"] = workdir
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    asyncio.run(run(args, events))
+
+
+if __name__ == "__main__":
+    main()
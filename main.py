@@ -8,6 +8,14 @@ import os
 import traceback
 import sys
 import asyncio
+import time
+import importlib
+import ast
+import hashlib
+import contextlib
+import cProfile
+import pstats
+from modules.member_cache import member_cache_policy, guild_memory_report
 
 # Default configuration
 default_config = {
@@ -23,6 +31,24 @@ default_config = {
 
 has_run = False
 config_path = 'config.json'
+command_hash_path = '.command_tree_hash.json'
+startup_profile_path = 'startup_profile.json'
+
+# Wall time of every startup phase and every extension's import and setup, reported once the bot is ready
+startup_started = time.perf_counter()
+startup_profile = {"phases": {}, "imports": {}, "setups": {}}
+startup_profiler = None
+if os.environ.get("BOT_PROFILE_STARTUP"):
+    startup_profiler = cProfile.Profile()
+    startup_profiler.enable()
+
+@contextlib.contextmanager
+def startup_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_profile["phases"][name] = time.perf_counter() - start
 
 
 
@@ -51,65 +77,215 @@ def load_config():
             json.dump(config, file, indent=4)
     return config
 
-def aggregate_intents(modules):
-    intents = discord.Intents.default()
+MANIFEST_FIELDS = {
+    "__intents__": "intents",
+    "__dependencies__": "dependencies",
+    "__version__": "version",
+    "__member_cache__": "member_cache",
+    "__chunk_guilds__": "chunk_guilds",
+}
+
+def read_manifest(module):
+    """Read a module's manifest literals (__intents__, __dependencies__, ...) without importing it."""
+    manifest = {"intents": [], "dependencies": [], "version": None, "member_cache": None, "chunk_guilds": None}
+    path = os.path.join("modules", f"{module}.py")
+    if not os.path.exists(path):
+        path = os.path.join("modules", module, "__init__.py")
+    with open(path, "r", encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            field = MANIFEST_FIELDS.get(node.targets[0].id)
+            if field:
+                manifest[field] = ast.literal_eval(node.value)
+    return manifest
+
+def read_manifests(modules):
+    manifests = {}
     for module in modules:
         try:
-            mod = __import__(f"modules.{module}", fromlist=["*"])
-            module_intents = getattr(mod, "__intents__", [])
-            for intent in module_intents:
-                if not getattr(intents, intent, False):
-                    setattr(intents, intent, True)
-        except ImportError as e:
-            print(f"Failed to import module {module}: {e}")
-        except AttributeError as e:
-            print(f"Module {module} does not define required intents: {e}")
+            manifests[module] = read_manifest(module)
+        except (OSError, SyntaxError, ValueError) as e:
+            print(f"Failed to read manifest of module {module}: {e}")
+    return manifests
+
+def aggregate_intents(manifests):
+    intents = discord.Intents.default()
+    for module, manifest in manifests.items():
+        for intent in manifest["intents"]:
+            if not hasattr(intents, intent):
+                print(f"Module {module} requests unknown intent: {intent}")
+            elif not getattr(intents, intent):
+                setattr(intents, intent, True)
     return intents
 
-config = load_config()
+with startup_phase("load config"):
+    config = load_config()
 bot_token = config['bot_token']
 initial_extensions = config['modules']
 
-intents = aggregate_intents(initial_extensions)
-bot = commands.Bot(command_prefix="!", intents=intents)
+def create_bot(intents, member_cache_flags, chunk_at_startup):
+    """Build a plain Bot, or an AutoShardedBot when sharding is configured.
 
-async def load_extension(extension, loaded_extensions):
-    if extension in loaded_extensions:
-        print(f"Skipping already loaded extension: {extension}")
-        return
+    The cluster launcher passes the shards a worker process owns through
+    BOT_SHARD_IDS/BOT_SHARD_COUNT; "shard_count" in the config ("auto" lets
+    Discord pick) shards a single process.
+    """
+    shard_ids = os.environ.get("BOT_SHARD_IDS")
+    if shard_ids:
+        return commands.AutoShardedBot(command_prefix="!", intents=intents,
+                                       member_cache_flags=member_cache_flags, chunk_guilds_at_startup=chunk_at_startup,
+                                       shard_ids=[int(shard_id) for shard_id in shard_ids.split(",")],
+                                       shard_count=int(os.environ["BOT_SHARD_COUNT"]))
+    shard_count = config.get("shard_count")
+    if shard_count:
+        return commands.AutoShardedBot(command_prefix="!", intents=intents,
+                                       member_cache_flags=member_cache_flags, chunk_guilds_at_startup=chunk_at_startup,
+                                       shard_count=None if shard_count == "auto" else int(shard_count))
+    return commands.Bot(command_prefix="!", intents=intents,
+                        member_cache_flags=member_cache_flags, chunk_guilds_at_startup=chunk_at_startup)
 
-    try:
-        # Import the module
-        module = __import__(f"modules.{extension}", fromlist=["*"])
-        
-        # Check for dependencies
-        dependencies = getattr(module, "__dependencies__", [])
-        missing_dependencies = [dep for dep in dependencies if dep not in initial_extensions]
+with startup_phase("read manifests"):
+    manifests = read_manifests(initial_extensions)
+with startup_phase("create bot"):
+    intents = aggregate_intents(manifests)
+    member_cache_flags, chunk_at_startup = member_cache_policy(manifests, intents)
+    bot = create_bot(intents, member_cache_flags, chunk_at_startup)
+
+cluster_id = int(os.environ.get("BOT_CLUSTER_ID", 0))
+is_primary_cluster = not os.environ.get("BOT_CLUSTER_WORKER")
+
+loaded_extensions = set()
+extension_dependencies = {}
+reload_lock = asyncio.Lock()
+# Other modules hold the engine, sessions and models of these, so only a restart can replace them
+PINNED_EXTENSIONS = {"database"}
 
-        if missing_dependencies:
-            print(f"Warning: Module '{extension}' has missing dependencies: {', '.join(missing_dependencies)}")
-            return
+def find_dependency_cycle(remaining):
+    # Every remaining extension still waits on another remaining one, so walking dependencies must loop
+    path = []
+    current = next(iter(remaining))
+    while current not in path:
+        path.append(current)
+        current = next(dep for dep in remaining[current] if dep in remaining)
+    return path[path.index(current):] + [current]
 
-        unsatisfied_dependencies = [dep for dep in dependencies if dep not in loaded_extensions]
+def sort_extensions(extensions, dependencies):
+    """Order extensions into waves: every extension in a wave only depends on earlier waves."""
+    remaining = {extension: list(dependencies.get(extension, [])) for extension in extensions}
+    skipped = {}
 
-        if unsatisfied_dependencies:
-            print(f"Warning: Module '{extension}' loaded before its dependencies: {', '.join(unsatisfied_dependencies)}")
-            return
+    changed = True
+    while changed:
+        changed = False
+        for extension, deps in list(remaining.items()):
+            missing = [dep for dep in deps if dep not in remaining]
+            if missing:
+                skipped[extension] = f"missing dependencies: {', '.join(missing)}"
+                del remaining[extension]
+                changed = True
+
+    waves = []
+    while remaining:
+        ready = [extension for extension, deps in remaining.items() if all(dep not in remaining for dep in deps)]
+        if not ready:
+            cycle = " -> ".join(find_dependency_cycle(remaining))
+            for extension in remaining:
+                skipped[extension] = f"dependency cycle: {cycle}"
+            break
+        waves.append(ready)
+        for extension in ready:
+            del remaining[extension]
+    return waves, skipped
+
+async def load_extension(extension, module, loaded_extensions, timings):
+    if extension in loaded_extensions:
+        print(f"Skipping already loaded extension: {extension}")
+        return
 
+    start = time.perf_counter()
+    try:
         # Call the setup function with required arguments
         await module.setup(bot, restart_program)
 
         loaded_extensions.add(extension)
-        print(f"Loaded extension {extension}")
+        print(f"Loaded extension {extension} in {time.perf_counter() - start:.2f}s")
     except Exception as e:
         print(f"Failed to load extension {extension}: {e}")
         traceback.print_exc()
+    finally:
+        timings[extension] = time.perf_counter() - start
+
+def import_extension(extension, import_times):
+    start = time.perf_counter()
+    try:
+        return importlib.import_module(f"modules.{extension}")
+    except Exception as e:
+        print(f"Failed to import extension {extension}: {e}")
+        traceback.print_exc()
+        return None
+    finally:
+        import_times[extension] = time.perf_counter() - start
 
 async def load_extensions():
-    loaded_extensions = set()
+    timings = {}
+    import_times = {}
 
-    for extension in initial_extensions:
-        await load_extension(extension, loaded_extensions)
+    dependencies = {extension: manifest["dependencies"] for extension, manifest in manifests.items()}
+    extension_dependencies.update(dependencies)
+    waves, skipped = sort_extensions(list(manifests), dependencies)
+    for extension, reason in skipped.items():
+        print(f"Warning: Module '{extension}' was not loaded, {reason}")
+
+    for wave in waves:
+        runnable = {}
+        for extension in wave:
+            failed = [dep for dep in dependencies[extension] if dep not in loaded_extensions]
+            if failed:
+                print(f"Warning: Module '{extension}' was not loaded, dependencies failed to load: {', '.join(failed)}")
+                continue
+            # Import lazily, once everything it depends on (e.g. the database) has been set up
+            module = import_extension(extension, import_times)
+            if module is not None:
+                runnable[extension] = module
+        # Extensions in the same wave don't depend on each other, so their setup can overlap
+        await asyncio.gather(*(load_extension(extension, module, loaded_extensions, timings) for extension, module in runnable.items()))
+
+    startup_profile["imports"].update(import_times)
+    startup_profile["setups"].update(timings)
+
+def report_startup():
+    """Print the startup timings as a table and save them, plus the cProfile capture if enabled."""
+    profile = dict(startup_profile, total=time.perf_counter() - startup_started)
+    database = sys.modules.get("modules.database")
+    if database is not None:
+        profile["database"] = dict(database.setup_timings)
+
+    print("Startup phases:")
+    for phase, elapsed in profile["phases"].items():
+        print(f"  {phase:<28} {elapsed:8.2f}s")
+    print("Extension import and setup times:")
+    for extension, elapsed in sorted(profile["setups"].items(), key=lambda item: item[1], reverse=True):
+        status = "loaded" if extension in loaded_extensions else "failed"
+        print(f"  {extension:<20} import {profile['imports'].get(extension, 0):6.2f}s  setup {elapsed:8.2f}s  {status}")
+    if profile.get("database"):
+        print("Database schema setup:")
+        for step, elapsed in sorted(profile["database"].items(), key=lambda item: item[1], reverse=True):
+            print(f"  {step:<28} {elapsed:8.2f}s")
+    print(f"Startup finished in {profile['total']:.2f}s")
+    report_member_cache()
+
+    try:
+        with open(startup_profile_path, 'w') as file:
+            json.dump(profile, file, indent=4)
+    except OSError as e:
+        print(f"Failed to save startup profile: {e}")
+
+    if startup_profiler is not None:
+        startup_profiler.disable()
+        startup_profiler.dump_stats("startup.prof")
+        pstats.Stats(startup_profiler).sort_stats("cumulative").print_stats(25)
+        print("Saved cProfile capture to startup.prof")
 
 
 async def unload_extensions():
@@ -121,6 +297,121 @@ async def unload_extensions():
             print(f"Failed to unload extension {extension}: {e}")
             traceback.print_exc()
 
+def command_payload(command):
+    try:
+        return command.to_dict(bot.tree)
+    except TypeError:
+        # discord.py < 2.4 serializes commands without the tree
+        return command.to_dict()
+
+def module_app_commands(extension):
+    module_name = f"modules.{extension}"
+    return [command for cog in bot.cogs.values() if type(cog).__module__ == module_name for command in cog.get_app_commands()]
+
+def loaded_dependents(extension):
+    return [other for other in loaded_extensions if extension in extension_dependencies.get(other, [])]
+
+def command_tree_hash(guild=None):
+    payloads = sorted((command_payload(command) for command in bot.tree.get_commands(guild=guild)), key=lambda payload: payload['name'])
+    return hashlib.sha256(json.dumps(payloads, sort_keys=True, default=str).encode()).hexdigest()
+
+def load_command_hashes():
+    try:
+        with open(command_hash_path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_command_hashes(hashes):
+    with open(command_hash_path, 'w') as file:
+        json.dump(hashes, file, indent=4)
+
+async def sync_command_tree(force=False):
+    """Sync the app command tree only where its serialized hash changed since the last sync.
+
+    With "dev_guilds" in the config, global commands are copied to those guilds
+    and synced there (instant, per-guild) instead of globally.
+    """
+    hashes = load_command_hashes()
+    dev_guilds = [discord.Object(id=guild_id) for guild_id in config.get('dev_guilds', [])]
+    for guild in dev_guilds:
+        bot.tree.copy_global_to(guild=guild)
+
+    for guild in dev_guilds or [None]:
+        scope = f"guild {guild.id}" if guild else "global"
+        key = f"{bot.application_id}:{guild.id if guild else 'global'}"
+        tree_hash = command_tree_hash(guild)
+        if not force and hashes.get(key) == tree_hash:
+            print(f"Command tree unchanged, skipped {scope} sync")
+            continue
+        start = time.perf_counter()
+        synced = await bot.tree.sync(guild=guild)
+        hashes[key] = tree_hash
+        save_command_hashes(hashes)
+        print(f"Synced {len(synced)} commands ({scope}) in {time.perf_counter() - start:.2f}s")
+
+async def sync_changed_commands(changed, removed):
+    """Push only the given global commands instead of re-syncing the whole tree."""
+    if config.get('dev_guilds'):
+        await sync_command_tree()
+        return
+
+    for command in changed:
+        await bot.http.upsert_global_command(bot.application_id, command_payload(command))
+    if removed:
+        remote = {command.name: command for command in await bot.tree.fetch_commands()}
+        for name in removed:
+            if name in remote:
+                await bot.http.delete_global_command(bot.application_id, remote[name].id)
+    print(f"Synced {len(changed)} changed and {len(removed)} removed commands")
+    hashes = load_command_hashes()
+    hashes[f"{bot.application_id}:global"] = command_tree_hash()
+    save_command_hashes(hashes)
+
+async def unload_module(extension):
+    """Remove an extension's cogs (with their listeners and app commands) and standalone listeners.
+
+    Background tasks are only stopped if the module cancels them in its cog_unload.
+    """
+    if extension in PINNED_EXTENSIONS:
+        raise ValueError(f"{extension} can't be unloaded or reloaded at runtime, restart the bot instead")
+    module_name = f"modules.{extension}"
+    removed_commands = [command.name for command in module_app_commands(extension)]
+    for cog_name, cog in list(bot.cogs.items()):
+        if type(cog).__module__ == module_name:
+            await bot.remove_cog(cog_name)
+    for event, listeners in list(bot.extra_events.items()):
+        for listener in list(listeners):
+            if getattr(listener, "__module__", None) == module_name:
+                bot.remove_listener(listener, event)
+    loaded_extensions.discard(extension)
+    print(f"Unloaded extension {extension}")
+    return removed_commands
+
+async def reload_module(extension):
+    if extension in PINNED_EXTENSIONS:
+        raise ValueError(f"{extension} can't be unloaded or reloaded at runtime, restart the bot instead")
+    module_name = f"modules.{extension}"
+    dependents = loaded_dependents(extension)
+    if dependents:
+        print(f"Warning: {', '.join(dependents)} keep references to the previous version of {extension} until they are reloaded too")
+
+    old_commands = {command.name: command_payload(command) for command in module_app_commands(extension)}
+    await unload_module(extension)
+    if module_name in sys.modules:
+        module = importlib.reload(sys.modules[module_name])
+    else:
+        module = importlib.import_module(module_name)
+    extension_dependencies[extension] = read_manifest(extension)["dependencies"]
+    await module.setup(bot, restart_program)
+    loaded_extensions.add(extension)
+    print(f"Reloaded extension {extension}")
+
+    new_commands = module_app_commands(extension)
+    changed = [command for command in new_commands if old_commands.get(command.name) != command_payload(command)]
+    removed = [name for name in old_commands if name not in {command.name for command in new_commands}]
+    await sync_changed_commands(changed, removed)
+
 async def restart_program():
     """Restart the current program."""
     try:
@@ -131,15 +422,56 @@ async def restart_program():
         print(f"Failed to restart program: {e}")
         traceback.print_exc()
 
+def report_member_cache(limit=10):
+    report = guild_memory_report(bot.guilds)
+    cached = sum(row[1] for row in report)
+    print(f"Member cache: {member_cache_flags}, chunk at startup: {chunk_at_startup}, "
+          f"{cached} members cached, ~{sum(row[4] for row in report) / 1024 / 1024:.1f} MiB")
+    for guild, members, member_count, chunked, size in report[:limit]:
+        print(f"  {guild.name[:28]:<28} {members:>8}/{member_count:<8} {'chunked' if chunked else 'partial':<8} ~{size / 1024:,.0f} KiB")
+    return report
+
+def signal_cluster_ready():
+    # The launcher waits for the primary to finish migrations before starting the other clusters
+    ready_file = os.environ.get("BOT_CLUSTER_READY_FILE")
+    if ready_file:
+        with open(ready_file, 'w') as file:
+            file.write(str(os.getpid()))
+
 @bot.event
 async def on_ready():
     global has_run
     if not has_run:
-        await load_extensions()
-        await bot.tree.sync()
-        print(f'Logged in as {bot.user}')
+        startup_profile["phases"]["login and gateway"] = time.perf_counter() - connect_started
+        with startup_phase("load extensions"):
+            await load_extensions()
+        # Global commands are shared by every cluster, so only the primary syncs them
+        if is_primary_cluster:
+            with startup_phase("command tree sync"):
+                await sync_command_tree()
+        signal_cluster_ready()
+        report_startup()
+        shard_ids = getattr(bot, 'shard_ids', None) or [bot.shard_id or 0]
+        print(f'Logged in as {bot.user} (cluster {cluster_id}, shards {shard_ids})')
         has_run = True
 
+async def run_fake_gateway():
+    """Load every extension and replay shard ready events without connecting to Discord."""
+    global has_run
+    has_run = True
+    async with bot:
+        with startup_phase("load extensions"):
+            await load_extensions()
+        signal_cluster_ready()
+        report_startup()
+        shard_ids = getattr(bot, 'shard_ids', None) or [0]
+        for shard_id in shard_ids:
+            bot.dispatch('shard_connect', shard_id)
+            bot.dispatch('shard_ready', shard_id)
+        await asyncio.sleep(float(os.environ.get("BOT_FAKE_GATEWAY_SECONDS", 1)))
+        print(f"Fake gateway: cluster {cluster_id} (pid {os.getpid()}) ran shards {shard_ids} "
+              f"of {bot.shard_count or 1} with {len(loaded_extensions)} extensions loaded")
+
 @bot.tree.command(name="reload", description="Reload program")
 @commands.is_owner()
 async def reload(interaction: discord.Interaction):
@@ -150,5 +482,72 @@ async def reload(interaction: discord.Interaction):
         await interaction.response.send_message(f"Failed to reload: {e}", ephemeral=True)
         traceback.print_exc()
 
+@bot.tree.command(name="member_cache", description="Show member cache usage per guild")
+async def member_cache_command(interaction: discord.Interaction):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("Only the bot owner can view the member cache.", ephemeral=True)
+        return
+    report = report_member_cache()
+    embed = discord.Embed(title="Member Cache", color=discord.Color.blue())
+    embed.description = (f"Flags: {member_cache_flags}\nChunk at startup: {chunk_at_startup}\n"
+                         f"Cached members: {sum(row[1] for row in report)} (~{sum(row[4] for row in report) / 1024 / 1024:.1f} MiB)")
+    for guild, members, member_count, chunked, size in report[:10]:
+        embed.add_field(name=guild.name, value=f"{members}/{member_count} members, {'chunked' if chunked else 'partial'}, ~{size / 1024:,.0f} KiB", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="reload_module", description="Reload a single module without restarting")
+@app_commands.describe(module="The module to reload")
+async def reload_module_command(interaction: discord.Interaction, module: str):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("Only the bot owner can reload modules.", ephemeral=True)
+        return
+    if module not in initial_extensions:
+        await interaction.response.send_message(f"Unknown module: {module}", ephemeral=True)
+        return
+    if module in PINNED_EXTENSIONS:
+        await interaction.response.send_message(f"{module} can't be reloaded at runtime, use /reload to restart the bot", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    async with reload_lock:
+        try:
+            await reload_module(module)
+            await interaction.followup.send(f"Reloaded {module}", ephemeral=True)
+        except Exception as e:
+            traceback.print_exc()
+            await interaction.followup.send(f"Failed to reload {module}: {e}", ephemeral=True)
+
+@bot.tree.command(name="unload_module", description="Unload a single module without restarting")
+@app_commands.describe(module="The module to unload")
+async def unload_module_command(interaction: discord.Interaction, module: str):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("Only the bot owner can unload modules.", ephemeral=True)
+        return
+    if module not in loaded_extensions:
+        await interaction.response.send_message(f"Module {module} is not loaded", ephemeral=True)
+        return
+    if module in PINNED_EXTENSIONS:
+        await interaction.response.send_message(f"{module} can't be unloaded at runtime", ephemeral=True)
+        return
+    dependents = loaded_dependents(module)
+    if dependents:
+        await interaction.response.send_message(f"Unload {', '.join(dependents)} first, they depend on {module}", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    async with reload_lock:
+        try:
+            removed = await unload_module(module)
+            await sync_changed_commands([], removed)
+            await interaction.followup.send(f"Unloaded {module}", ephemeral=True)
+        except Exception as e:
+            traceback.print_exc()
+            await interaction.followup.send(f"Failed to unload {module}: {e}", ephemeral=True)
+
+connect_started = time.perf_counter()
+
 if __name__ == "__main__":
-    bot.run(bot_token)
+    if os.environ.get("BOT_FAKE_GATEWAY"):
+        asyncio.run(run_fake_gateway())
+    else:
+        bot.run(bot_token)
@@ -0,0 +1,153 @@
+# modules/audit_log.py
+
+from collections import deque
+from datetime import datetime
+import asyncio
+import json
+import os
+import traceback
+
+
+class AuditLog:
+    """Moderation audit log written in batches off the event loop.
+
+    Entries are appended as JSON lines to numbered segment files. Each segment
+    has a sidecar .idx file of "guild_id user_id offset" lines, which is all
+    that needs to be read at startup to answer per-user history queries.
+    """
+
+    def __init__(self, directory="logs/modlog", max_bytes=5_000_000, backup_count=20, batch_size=500, per_user_limit=200):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.per_user_limit = per_user_limit
+        self.index = {}
+        self.segment = 1
+        self.queue = None
+        self.writer_task = None
+
+    def segment_path(self, segment, suffix="log"):
+        return os.path.join(self.directory, f"modlog-{segment:06d}.{suffix}")
+
+    def list_segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith("modlog-") and name.endswith(".log"):
+                segments.append(int(name[7:-4]))
+        return sorted(segments)
+
+    def load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.list_segments()
+        for segment in segments:
+            try:
+                with open(self.segment_path(segment, "idx"), "r") as index_file:
+                    for line in index_file:
+                        guild_id, user_id, offset = line.split()
+                        self.add_to_index(int(guild_id), int(user_id), segment, int(offset))
+            except FileNotFoundError:
+                print(f"Audit log segment {segment} has no index file, skipping it")
+        if segments:
+            self.segment = segments[-1]
+
+    def add_to_index(self, guild_id, user_id, segment, offset):
+        positions = self.index.get((guild_id, user_id))
+        if positions is None:
+            positions = self.index[(guild_id, user_id)] = deque(maxlen=self.per_user_limit)
+        positions.append((segment, offset))
+
+    def start(self):
+        if self.writer_task is not None:
+            return
+        self.load_index()
+        self.queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self.run_writer())
+
+    async def stop(self):
+        if self.writer_task is None:
+            return
+        await self.queue.put(None)
+        await self.writer_task
+        self.writer_task = None
+
+    def log(self, guild_id, user_id, action, user_name=None, moderator_id=None):
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'guild_id': guild_id,
+            'user_id': user_id,
+            'user_name': user_name,
+            'moderator_id': moderator_id,
+            'action': action,
+        }
+        if self.queue is None:
+            print(f"Audit log is not running, dropping entry: {entry}")
+            return
+        self.queue.put_nowait(entry)
+
+    async def run_writer(self):
+        stopping = False
+        while not stopping:
+            entry = await self.queue.get()
+            batch = [] if entry is None else [entry]
+            while entry is not None and len(batch) < self.batch_size and not self.queue.empty():
+                entry = self.queue.get_nowait()
+                if entry is not None:
+                    batch.append(entry)
+            stopping = entry is None
+            if not batch:
+                continue
+            try:
+                positions = await asyncio.to_thread(self.write_batch, batch)
+                for guild_id, user_id, segment, offset in positions:
+                    self.add_to_index(guild_id, user_id, segment, offset)
+            except Exception as e:
+                print(f"Failed to write {len(batch)} audit log entries: {e}")
+                traceback.print_exc()
+
+    def write_batch(self, batch):
+        positions = []
+        index_lines = []
+        with open(self.segment_path(self.segment), "ab") as log_file:
+            for entry in batch:
+                offset = log_file.tell()
+                log_file.write((json.dumps(entry) + "\n").encode())
+                positions.append((entry['guild_id'], entry['user_id'], self.segment, offset))
+                index_lines.append(f"{entry['guild_id']} {entry['user_id']} {offset}\n")
+            size = log_file.tell()
+        with open(self.segment_path(self.segment, "idx"), "a") as index_file:
+            index_file.writelines(index_lines)
+        if size >= self.max_bytes:
+            self.rotate()
+        return positions
+
+    def rotate(self):
+        self.segment += 1
+        for segment in self.list_segments()[:-self.backup_count]:
+            for suffix in ("log", "idx"):
+                try:
+                    os.remove(self.segment_path(segment, suffix))
+                except FileNotFoundError:
+                    pass
+
+    async def history(self, guild_id, user_id, limit=10):
+        positions = list(self.index.get((guild_id, user_id), ()))[-limit:]
+        if not positions:
+            return []
+        return await asyncio.to_thread(self.read_entries, positions)
+
+    def read_entries(self, positions):
+        entries = []
+        by_segment = {}
+        for segment, offset in positions:
+            by_segment.setdefault(segment, []).append(offset)
+        for segment, offsets in sorted(by_segment.items()):
+            try:
+                with open(self.segment_path(segment), "rb") as log_file:
+                    for offset in offsets:
+                        log_file.seek(offset)
+                        entries.append(json.loads(log_file.readline()))
+            except FileNotFoundError:
+                # Segment was removed by rotation
+                continue
+        return entries
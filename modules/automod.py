@@ -0,0 +1,313 @@
+# modules/automod.py
+
+import discord
+from discord.ext import commands
+from discord import app_commands
+from modules.database import add_column, SessionLocal
+from modules.dynamic_models import ServerUser
+from modules.ultra_mod import audit_log
+from modules.debounce import DebounceStore
+from sqlalchemy import Integer, BigInteger, String, Text
+from collections import OrderedDict, deque
+import traceback
+import asyncio
+import time
+import re
+
+SPAM_MESSAGES = 5
+SPAM_WINDOW = 5.0
+MAX_TRACKED_USERS = 10_000
+RULE_KINDS = ("word", "regex")
+
+async def setup_automod_columns():
+    await add_column('automodrule', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('automodrule', 'guild_id', BigInteger, default=0, nullable=False)
+    await add_column('automodrule', 'kind', String, default='word', nullable=False)
+    await add_column('automodrule', 'pattern', Text, nullable=True, final_column=True)
+
+async def setup_automod_rule():
+    await setup_automod_columns()
+    global Automodrule
+    from modules.dynamic_models import Automodrule
+
+
+TOKEN_RE = re.compile(r"\w+")
+# Numbered and named backreferences would point at the wrong group inside the combined pattern
+BACKREFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def compile_regex_rule(pattern):
+    """Compile a regex rule the way CompiledRules matches it; raises re.error for invalid patterns."""
+    return re.compile(pattern, re.IGNORECASE)
+
+
+class CompiledRules:
+    """A guild's rules compiled for a single pass over each message.
+
+    Single-token words are matched by tokenizing the message once and looking
+    tokens up in a set, which stays flat as the word list grows. Phrases and
+    regex rules share one combined pattern with a named group per rule. Regex
+    rules that can't be part of it (backreferences, inline global flags,
+    clashing group names) are compiled and matched on their own, and rules
+    that don't compile at all are dropped with a log line.
+    """
+
+    __slots__ = ('words', 'pattern', 'groups', 'separate')
+
+    def __init__(self, rules):
+        self.words = frozenset(pattern.lower() for _, kind, pattern in rules
+                               if kind == "word" and pattern and TOKEN_RE.fullmatch(pattern))
+        phrases = sorted({re.escape(pattern.lower()) for _, kind, pattern in rules
+                          if kind == "word" and pattern and not TOKEN_RE.fullmatch(pattern)}, key=len, reverse=True)
+        parts = []
+        self.groups = {}
+        self.separate = []
+        if phrases:
+            parts.append(rf"(?P<automod_word>\b(?:{'|'.join(phrases)})\b)")
+        combinable = []
+        for rule_id, kind, pattern in rules:
+            if kind != "regex" or not pattern:
+                continue
+            try:
+                regex = compile_regex_rule(pattern)
+            except re.error as e:
+                print(f"Dropping automod rule #{rule_id}, invalid regular expression: {e}")
+                continue
+            if BACKREFERENCE_RE.search(pattern):
+                self.separate.append((rule_id, regex))
+            else:
+                combinable.append((rule_id, pattern, regex))
+
+        try:
+            self.pattern = self.combine(parts, combinable)
+        except re.error:
+            # Some rule only compiles on its own; add them one at a time to find which
+            accepted = []
+            for rule in combinable:
+                try:
+                    self.combine(parts, accepted + [rule])
+                    accepted.append(rule)
+                except re.error:
+                    self.separate.append((rule[0], rule[2]))
+            self.pattern = self.combine(parts, accepted)
+
+    def combine(self, parts, rules):
+        self.groups = {f"automod_rule{rule_id}": rule_id for rule_id, _, _ in rules}
+        parts = parts + [f"(?P<automod_rule{rule_id}>{pattern})" for rule_id, pattern, _ in rules]
+        return re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+    def match(self, content):
+        if self.words:
+            for token in TOKEN_RE.findall(content.lower()):
+                if token in self.words:
+                    return f"blocked word: {token}"
+        if self.pattern is not None:
+            match = self.pattern.search(content)
+            if match:
+                # Look the rule up by our own group names; a rule's inner groups would confuse lastgroup
+                found = match.groupdict()
+                if found.get("automod_word") is not None:
+                    return f"blocked word: {found['automod_word']}"
+                for name, rule_id in self.groups.items():
+                    if found[name] is not None:
+                        return f"matched rule #{rule_id}"
+        for rule_id, regex in self.separate:
+            if regex.search(content):
+                return f"matched rule #{rule_id}"
+        return None
+
+
+class AutomodEngine:
+    """Per-guild compiled rules, spam counters and automod exemptions, all held in memory."""
+
+    def __init__(self, spam_messages=SPAM_MESSAGES, spam_window=SPAM_WINDOW, max_tracked_users=MAX_TRACKED_USERS, clock=time.monotonic):
+        self.spam_messages = spam_messages
+        self.spam_window = spam_window
+        self.max_tracked_users = max_tracked_users
+        self.clock = clock
+        self.matchers = {}
+        self.exempt = {}
+        self.recent = OrderedDict()
+
+    def is_loaded(self, guild_id):
+        return guild_id in self.matchers
+
+    def set_rules(self, guild_id, rules):
+        self.matchers[guild_id] = CompiledRules(rules)
+
+    def set_exempt(self, guild_id, user_ids):
+        self.exempt[guild_id] = set(user_ids)
+
+    def set_automod(self, guild_id, user_id, enabled):
+        exempt = self.exempt.setdefault(guild_id, set())
+        if enabled:
+            exempt.discard(user_id)
+        else:
+            exempt.add(user_id)
+
+    def is_spam(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        now = self.clock()
+        timestamps = self.recent.get(key)
+        if timestamps is None:
+            timestamps = self.recent[key] = deque(maxlen=self.spam_messages)
+            if len(self.recent) > self.max_tracked_users:
+                self.recent.popitem(last=False)
+        else:
+            self.recent.move_to_end(key)
+        timestamps.append(now)
+        return len(timestamps) == self.spam_messages and now - timestamps[0] < self.spam_window
+
+    def check(self, guild_id, user_id, content):
+        """Return the reason a message violates automod, or None."""
+        if user_id in self.exempt.get(guild_id, ()):
+            return None
+        if self.is_spam(guild_id, user_id):
+            return "sending messages too fast"
+        rules = self.matchers.get(guild_id)
+        if rules is not None and content:
+            return rules.match(content)
+        return None
+
+
+def load_guild_rules(guild_id):
+    session = SessionLocal()
+    try:
+        rules = session.query(Automodrule.id, Automodrule.kind, Automodrule.pattern).filter_by(guild_id=guild_id).all()
+        exempt = session.query(ServerUser.user_id).filter(ServerUser.server_id == guild_id, ServerUser.automod == False).all()
+        return rules, [int(user_id) for (user_id,) in exempt]
+    finally:
+        session.close()
+        SessionLocal.remove()
+
+
+class Automod(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.engine = AutomodEngine()
+        self.loading = {}
+        # One removal notice per user and spam window, however many messages are deleted
+        self.notices = DebounceStore(cooldown=SPAM_WINDOW)
+
+    async def ensure_guild(self, guild_id):
+        if self.engine.is_loaded(guild_id):
+            return
+        # Messages arriving while the rules load wait for the same load instead of querying again
+        task = self.loading.get(guild_id)
+        if task is None:
+            task = self.loading[guild_id] = asyncio.create_task(self.load_guild(guild_id))
+        await asyncio.shield(task)
+
+    async def load_guild(self, guild_id):
+        try:
+            rules, exempt = await asyncio.to_thread(load_guild_rules, guild_id)
+            self.engine.set_rules(guild_id, rules)
+            self.engine.set_exempt(guild_id, exempt)
+        finally:
+            self.loading.pop(guild_id, None)
+
+    async def cog_unload(self):
+        tasks = list(self.loading.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.guild is None or message.author.bot:
+            return
+        if isinstance(message.author, discord.Member) and message.author.guild_permissions.administrator:
+            return
+
+        try:
+            await self.ensure_guild(message.guild.id)
+            reason = self.engine.check(message.guild.id, message.author.id, message.content)
+            if reason is None:
+                return
+            await message.delete()
+            if not self.notices.hit((message.guild.id, message.author.id)):
+                await message.channel.send(f"{message.author.mention}, your message was removed ({reason}).", delete_after=5)
+            audit_log.log(message.guild.id, message.author.id, f"Automod removed message ({reason})", user_name=message.author.display_name)
+        except discord.NotFound:
+            pass
+        except Exception as e:
+            print(f"Automod failed to process message {message.id}: {e}")
+            traceback.print_exc()
+
+    @commands.Cog.listener()
+    async def on_automod_toggle(self, guild_id, user_id, enabled):
+        self.engine.set_automod(guild_id, user_id, enabled)
+
+    @app_commands.command(name="automod_add", description="Add an automod rule")
+    @app_commands.describe(kind="Either 'word' or 'regex'", pattern="The word or regular expression to block")
+    async def automod_add(self, interaction: discord.Interaction, kind: str, pattern: str):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+        if kind not in RULE_KINDS:
+            await interaction.response.send_message(f"Rule kind must be one of: {', '.join(RULE_KINDS)}", ephemeral=True)
+            return
+        if kind == "regex":
+            try:
+                compile_regex_rule(pattern)
+            except re.error as e:
+                await interaction.response.send_message(f"Invalid regular expression: {e}", ephemeral=True)
+                return
+
+        session = SessionLocal()
+        try:
+            rule = Automodrule(guild_id=interaction.guild.id, kind=kind, pattern=pattern)
+            session.add(rule)
+            session.commit()
+            rule_id = rule.id
+            self.engine.matchers.pop(interaction.guild.id, None)
+            await interaction.response.send_message(f"Added automod rule #{rule_id} ({kind}): `{pattern}`", ephemeral=True)
+        except Exception as e:
+            session.rollback()
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+            await interaction.response.send_message(f"Failed to add rule: {e}", ephemeral=True)
+        finally:
+            session.close()
+
+    @app_commands.command(name="automod_remove", description="Remove an automod rule")
+    @app_commands.describe(rule_id="The ID of the rule to remove")
+    async def automod_remove(self, interaction: discord.Interaction, rule_id: int):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        session = SessionLocal()
+        try:
+            deleted = session.query(Automodrule).filter_by(id=rule_id, guild_id=interaction.guild.id).delete()
+            session.commit()
+            self.engine.matchers.pop(interaction.guild.id, None)
+            message = f"Removed automod rule #{rule_id}" if deleted else f"Automod rule #{rule_id} not found"
+            await interaction.response.send_message(message, ephemeral=True)
+        finally:
+            session.close()
+
+    @app_commands.command(name="automod_rules", description="List the automod rules of this server")
+    async def automod_rules(self, interaction: discord.Interaction):
+        session = SessionLocal()
+        try:
+            rules = session.query(Automodrule).filter_by(guild_id=interaction.guild.id).order_by(Automodrule.id).limit(25).all()
+            embed = discord.Embed(title="🛡️ Automod Rules", color=discord.Color.blue())
+            if not rules:
+                embed.description = "No automod rules configured."
+            for rule in rules:
+                embed.add_field(name=f"#{rule.id} ({rule.kind})", value=f"`{rule.pattern}`", inline=False)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        finally:
+            session.close()
+
+async def setup(bot, restart_fn):
+    await setup_automod_rule()
+    await bot.add_cog(Automod(bot))
+
+__intents__ = ["guilds", "guild_messages", "message_content"]
+__member_cache__ = []
+__dependencies__ = ["database", "ultra_mod"]
+__version__ = "1.0.0"
@@ -6,12 +6,17 @@ from sqlalchemy.orm.state import InstanceState
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.exc import OperationalError
 
+from modules.metrics_registry import metrics
+
 from datetime import datetime
 import logging
 import traceback
 import asyncio
 import os
+import sys
 import importlib
+import functools
+import time
 
 logging.basicConfig()
 logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
@@ -19,11 +24,23 @@ logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
 mapper_registry = registry()
 metadata = mapper_registry.metadata
 
-DATABASE_URL = "sqlite:///database.db"
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///database.db")
 engine = create_engine(DATABASE_URL, echo=False)
 SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
+# Cluster workers share the primary's schema; only the primary creates tables, alters columns and rewrites dynamic_models.py
+SCHEMA_OWNER = not os.environ.get("BOT_CLUSTER_WORKER")
+
+# dynamic_models.py is generated next to this file unless DYNAMIC_MODELS_DIR points elsewhere (load tests, the test suite)
+DYNAMIC_MODELS_DIR = os.environ.get("DYNAMIC_MODELS_DIR")
+DYNAMIC_MODELS_PATH = os.path.join(DYNAMIC_MODELS_DIR or os.path.dirname(__file__), 'dynamic_models.py')
+if DYNAMIC_MODELS_DIR and DYNAMIC_MODELS_DIR not in sys.modules[__package__].__path__:
+    # Searched first, so `from modules.dynamic_models import ...` loads the generated copy
+    sys.modules[__package__].__path__.insert(0, DYNAMIC_MODELS_DIR)
+
 model_column_defaults = {}
+setup_timings = {}
+db_operation_seconds = metrics.histogram('db_operation_seconds', 'Latency of database helper operations', labels=('operation', 'table'))
 pending_tables = {}
 added_columns = {}
 default_functions = {}
@@ -76,7 +93,7 @@ def format_default_value(default):
 def generate_dynamic_models():
     imports = {"from sqlalchemy import Column", "from datetime import datetime"}
     class_definitions = []
-    file_path = os.path.join(os.path.dirname(__file__), 'dynamic_models.py')
+    file_path = DYNAMIC_MODELS_PATH
 
     # Ensure the default models are always present
     default_tables = {
@@ -142,7 +159,7 @@ def generate_dynamic_models():
 
 
 def update_dynamic_models_file(class_name, column_name=None, column_type=None, default=None, nullable=True, primary_key=False):
-    file_path = os.path.join(os.path.dirname(__file__), 'dynamic_models.py')
+    file_path = DYNAMIC_MODELS_PATH
     imports = set()
     base_import = "from .database import Base"
     relationship_import = "from sqlalchemy.orm import relationship"
@@ -170,10 +187,17 @@ def update_dynamic_models_file(class_name, column_name=None, column_type=None, d
             continue
 
         # Mark the start of the class definition
-        if stripped_line.startswith(f'class {class_name}'):
+        if stripped_line.startswith(f'class {class_name}('):
             print(f"Class {class_name} found.")
             class_found = True
             in_class_definition = True
+        elif in_class_definition and not line.startswith('    '):
+            # The next class (or a blank line) ends the definition; it stays with the other lines
+            in_class_definition = False
+            if not column_exists and not column_inserted:
+                print(f"Inserting column {column_name} in class {class_name}.")
+                class_content_lines.append(f"    {column_name} = Column({column_type.__name__}, {format_default_value(default)}, {'nullable=False' if not nullable else 'nullable=True'}, {'primary_key=True' if primary_key else ''})\n")
+                column_inserted = True
 
         # Collect lines within the class definition
         if in_class_definition:
@@ -182,13 +206,6 @@ def update_dynamic_models_file(class_name, column_name=None, column_type=None, d
             if stripped_line.startswith(f"{column_name} = Column("):
                 print(f"Column {column_name} already exists in class {class_name}.")
                 column_exists = True
-
-            if not line.startswith('    ') and not stripped_line.startswith(f'class {class_name}'):
-                in_class_definition = False
-                if not column_exists and not column_inserted:
-                    print(f"Inserting column {column_name} in class {class_name}.")
-                    class_content_lines.insert(-1, f"    {column_name} = Column({column_type.__name__}, {format_default_value(default)}, {'nullable=False' if not nullable else 'nullable=True'}, {'primary_key=True' if primary_key else ''})\n")
-                    column_inserted = True
             continue
 
         if stripped_line:  # Skip empty lines
@@ -198,7 +215,7 @@ def update_dynamic_models_file(class_name, column_name=None, column_type=None, d
     if class_content_lines:
         if not column_exists and not column_inserted:
             print(f"Inserting column {column_name} in class {class_name} at the end of class content.")
-            class_content_lines.insert(-1, f"    {column_name} = Column({column_type.__name__}, {format_default_value(default)}, {'nullable=False' if not nullable else 'nullable=True'}, {'primary_key=True' if primary_key else ''})\n")
+            class_content_lines.append(f"    {column_name} = Column({column_type.__name__}, {format_default_value(default)}, {'nullable=False' if not nullable else 'nullable=True'}, {'primary_key=True' if primary_key else ''})\n")
         new_lines.extend(class_content_lines)
 
     # If the class was not found, add it to the end
@@ -223,7 +240,22 @@ def update_dynamic_models_file(class_name, column_name=None, column_type=None, d
 
 
 
+def record_setup_time(step, start):
+    setup_timings[step] = setup_timings.get(step, 0) + time.perf_counter() - start
+
+def timed_table_setup(func):
+    """Accumulate the time spent on each table's schema setup into setup_timings."""
+    @functools.wraps(func)
+    async def wrapper(table_name, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(table_name, *args, **kwargs)
+        finally:
+            record_setup_time(f"columns {table_name.lower()}", start)
+    return wrapper
+
 # Function to add columns to the database table
+@timed_table_setup
 async def add_column(table_name, column_name, column_type, default=None, nullable=True, final_column=False, primary_key=False):
     if column_type is None:
         raise ValueError("column_type must be provided")
@@ -236,6 +268,10 @@ async def add_column(table_name, column_name, column_type, default=None, nullabl
         table_name_lower = table_name.lower()
         table = metadata.tables.get(table_name_lower)
 
+        if not SCHEMA_OWNER and (table is None or column_name not in table.c):
+            print(f"Skipping schema change {table_name_lower}.{column_name} in cluster worker, the primary cluster applies migrations")
+            return False
+
         if table is None:
             print("Table does not exist, creating table.")
             # Create the table if it does not exist
@@ -309,7 +345,7 @@ def clear_base_classes():
 
     
 def get_model_class_by_table_name(table_name):
-    file_path = os.path.join(os.path.dirname(__file__), 'dynamic_models.py')
+    file_path = DYNAMIC_MODELS_PATH
     if not os.path.exists(file_path):
         return None
     
@@ -429,7 +465,7 @@ def load_default_functions():
 
 
 def check_and_generate_dynamic_models():
-    file_path = os.path.join(os.path.dirname(__file__), 'dynamic_models.py')
+    file_path = DYNAMIC_MODELS_PATH
     if not os.path.exists(file_path):
         generate_dynamic_models()
         load_default_functions()
@@ -469,6 +505,14 @@ def generate_serveruser_id(instance):
 
 
 
+def timed_db_operation(func):
+    @functools.wraps(func)
+    async def wrapper(model, *args, **kwargs):
+        with db_operation_seconds.time(operation=func.__name__, table=model.__tablename__):
+            return await func(model, *args, **kwargs)
+    return wrapper
+
+@timed_db_operation
 async def get_or_create(model, **kwargs):
     session = SessionLocal()
     try:
@@ -542,6 +586,7 @@ async def get_or_create(model, **kwargs):
 
 
 
+@timed_db_operation
 async def update_instance(model, filter_by, **kwargs):
     session = SessionLocal()
     try:
@@ -575,6 +620,18 @@ def refresh_model_class(model_class, column_name=None, column_type=None, default
         print(f"Failed to refresh model class {model_class.__name__}: {e}")
         traceback.print_exc()
 
+def add_index(table_name, index_name, *column_names, unique=False):
+    if not SCHEMA_OWNER:
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {index_name} ON {table_name.lower()} ({", ".join(column_names)})'))
+        return True
+    except OperationalError as e:
+        print(f"Failed to create index {index_name} on {table_name}: {e}")
+        traceback.print_exc()
+        return False
+
 def register_model_defaults(model_name, column_name, default):
     if model_name not in model_column_defaults:
         model_column_defaults[model_name] = {}
@@ -597,6 +654,10 @@ def update_dynamic_models_from_added_columns():
     return updated
 
 def init_db():
+    if not SCHEMA_OWNER:
+        load_default_functions()
+        metadata.reflect(bind=engine)
+        return
     try:
         check_and_generate_dynamic_models()
         from modules.dynamic_models import Base
@@ -611,9 +672,14 @@ async def setup(bot, restart_fn):
     restart_program_fn = restart_fn
     bot_instance = bot
     try:
+        start = time.perf_counter()
         init_db()
-        await create_pending_tables()  # Ensure pending tables are created
-        update_dynamic_models_from_added_columns()  # Update dynamic models with added columns
+        record_setup_time("init_db", start)
+        if SCHEMA_OWNER:
+            start = time.perf_counter()
+            await create_pending_tables()  # Ensure pending tables are created
+            update_dynamic_models_from_added_columns()  # Update dynamic models with added columns
+            record_setup_time("pending tables and models", start)
         from modules.dynamic_models import User, ServerUser, Server  # Ensure the dynamic models are imported here
     except Exception as e:
         print(f"Failed to setup database module: {e}")
@@ -621,4 +687,5 @@ async def setup(bot, restart_fn):
 
 
 __intents__ = ["guilds", "members"]
+__member_cache__ = []
 __version__ = "1.0.0"
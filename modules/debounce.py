@@ -0,0 +1,86 @@
+# modules/debounce.py
+
+import heapq
+import time
+
+
+class DebounceStore:
+    """Remembers recently seen keys for a cooldown, with expiry and a size cap.
+
+    Expirations are kept in a min-heap so stale keys are dropped as time passes
+    instead of piling up forever. When the store is full the keys closest to
+    expiry are evicted first.
+    """
+
+    def __init__(self, cooldown=2, max_size=100_000, clock=time.monotonic):
+        self.cooldown = cooldown
+        self.max_size = max_size
+        self.clock = clock
+        self.expires = {}
+        self.heap = []
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.expires)
+
+    def __contains__(self, key):
+        expires_at = self.expires.get(key)
+        return expires_at is not None and expires_at > self.clock()
+
+    def hit(self, key, cooldown=None):
+        """Return True if key was seen within its cooldown, otherwise record it and return False."""
+        now = self.clock()
+        self.purge(now)
+
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at > now:
+            self.hits += 1
+            return True
+
+        expires_at = now + (self.cooldown if cooldown is None else cooldown)
+        self.expires[key] = expires_at
+        heapq.heappush(self.heap, (expires_at, key))
+        self.misses += 1
+
+        while len(self.expires) > self.max_size:
+            self.pop_oldest(evicted=True)
+
+        if len(self.heap) > 2 * len(self.expires) + 64:
+            self.compact()
+        return False
+
+    def purge(self, now=None):
+        now = self.clock() if now is None else now
+        while self.heap and self.heap[0][0] <= now:
+            self.pop_oldest(evicted=False)
+
+    def pop_oldest(self, evicted):
+        expires_at, key = heapq.heappop(self.heap)
+        # Skip heap entries superseded by a later hit on the same key
+        if self.expires.get(key) != expires_at:
+            return
+        del self.expires[key]
+        if evicted:
+            self.evicted += 1
+        else:
+            self.expired += 1
+
+    def compact(self):
+        self.heap = [(expires_at, key) for key, expires_at in self.expires.items()]
+        heapq.heapify(self.heap)
+
+    def clear(self):
+        self.expires.clear()
+        self.heap.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.expires),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
@@ -1,24 +1,273 @@
+# modules/game.py
+
 import discord
 from discord.ext import commands
 from discord import app_commands
+from modules.database import add_column, add_index, SessionLocal, engine
+from sqlalchemy import Integer, BigInteger, text
+from collections import OrderedDict
+import traceback
+import asyncio
 import random
+import time
+
+SESSION_TTL = 600
+MAX_SESSIONS = 100_000
+FLUSH_INTERVAL = 30
+MAX_WRITE_ATTEMPTS = 5
+DEFAULT_MAXIMUM = 10
+LARGEST_MAXIMUM = 1_000_000
+
+async def setup_game_score_columns():
+    await add_column('gamescore', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('gamescore', 'guild_id', BigInteger, default=0, nullable=False)
+    await add_column('gamescore', 'user_id', BigInteger, default=0, nullable=False)
+    await add_column('gamescore', 'games', Integer, default=0, nullable=False)
+    await add_column('gamescore', 'wins', Integer, default=0, nullable=False)
+    await add_column('gamescore', 'best_attempts', Integer, nullable=True, final_column=True)
+    add_index('gamescore', 'ux_gamescore_guild_user', 'guild_id', 'user_id', unique=True)
+    add_index('gamescore', 'ix_gamescore_guild_wins', 'guild_id', 'wins')
+
+
+class GameSession:
+    """State of one guessing game; slotted so thousands of open games stay small."""
+
+    __slots__ = ('answer', 'maximum', 'attempts', 'attempts_left', 'expires_at')
+
+    def __init__(self, answer, maximum, attempts_left, expires_at):
+        self.answer = answer
+        self.maximum = maximum
+        self.attempts = 0
+        self.attempts_left = attempts_left
+        self.expires_at = expires_at
+
+
+class GameSessionStore:
+    """Open games keyed by (channel_id, user_id) with a sliding TTL.
+
+    Every access moves a session to the end of the OrderedDict, so the dict is
+    ordered by expiry and expired sessions are always at the front.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.sessions = OrderedDict()
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def start(self, key, answer, maximum, attempts):
+        session = self.sessions[key] = GameSession(answer, maximum, attempts, self.clock() + self.ttl)
+        self.sessions.move_to_end(key)
+        if len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.expired += 1
+        return session
+
+    def get(self, key):
+        session = self.sessions.get(key)
+        if session is None:
+            return None
+        now = self.clock()
+        if session.expires_at <= now:
+            del self.sessions[key]
+            self.expired += 1
+            return None
+        session.expires_at = now + self.ttl
+        self.sessions.move_to_end(key)
+        return session
+
+    def end(self, key):
+        return self.sessions.pop(key, None)
+
+    def evict_expired(self):
+        now = self.clock()
+        evicted = 0
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if session.expires_at > now:
+                break
+            self.sessions.popitem(last=False)
+            evicted += 1
+        self.expired += evicted
+        return evicted
+
+
+class ScoreBuffer:
+    """Accumulates per-player results in memory and writes them to gamescore in one batch.
+
+    A batch that keeps failing is retried MAX_WRITE_ATTEMPTS times, then
+    written row by row so only the rows the database rejects are dropped.
+    """
+
+    def __init__(self, max_attempts=MAX_WRITE_ATTEMPTS):
+        self.pending = {}
+        self.max_attempts = max_attempts
+        self.failures = 0
+        self.dropped = 0
+
+    def record(self, guild_id, user_id, won, attempts):
+        entry = self.pending.get((guild_id, user_id))
+        if entry is None:
+            entry = self.pending[(guild_id, user_id)] = [0, 0, None]
+        entry[0] += 1
+        if won:
+            entry[1] += 1
+            entry[2] = attempts if entry[2] is None else min(entry[2], attempts)
+
+    def write(self, batch):
+        params = [{'guild_id': guild_id, 'user_id': user_id, 'games': games, 'wins': wins, 'best': best}
+                  for (guild_id, user_id), (games, wins, best) in batch.items()]
+        with engine.begin() as conn:
+            conn.execute(text('''
+                INSERT INTO gamescore (guild_id, user_id, games, wins, best_attempts)
+                VALUES (:guild_id, :user_id, :games, :wins, :best)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                    games = games + excluded.games, wins = wins + excluded.wins,
+                    best_attempts = CASE
+                        WHEN excluded.best_attempts IS NULL THEN best_attempts
+                        WHEN best_attempts IS NULL OR excluded.best_attempts < best_attempts THEN excluded.best_attempts
+                        ELSE best_attempts END
+            '''), params)
+
+    def write_rows(self, batch):
+        written = 0
+        for key, entry in batch.items():
+            try:
+                self.write({key: entry})
+                written += 1
+            except Exception as e:
+                self.dropped += 1
+                print(f"Dropping game score of user {key[1]} in guild {key[0]}: {e}")
+        return written
+
+    def merge(self, batch):
+        # Put the unwritten results back in front of anything recorded meanwhile
+        for key, (games, wins, best) in batch.items():
+            entry = self.pending.setdefault(key, [0, 0, None])
+            entry[0] += games
+            entry[1] += wins
+            if best is not None:
+                entry[2] = best if entry[2] is None else min(entry[2], best)
+
+    async def flush(self):
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        try:
+            await asyncio.to_thread(self.write, batch)
+        except Exception as e:
+            self.failures += 1
+            print(f"Failed to write {len(batch)} game scores (attempt {self.failures}/{self.max_attempts}): {e}")
+            if self.failures < self.max_attempts:
+                self.merge(batch)
+                return 0
+            self.failures = 0
+            return await asyncio.to_thread(self.write_rows, batch)
+        self.failures = 0
+        return len(batch)
+
+
+def attempts_for(maximum):
+    # A binary search over 1..maximum needs maximum.bit_length() guesses at worst; allow one to spare
+    return max(3, maximum.bit_length() + 1)
+
 
 class Game(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.sessions = GameSessionStore()
+        self.scores = ScoreBuffer()
+        self.maintenance_task = None
+
+    def start(self):
+        if self.maintenance_task is None:
+            self.maintenance_task = asyncio.create_task(self.run_maintenance())
+
+    async def run_maintenance(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            self.sessions.evict_expired()
+            await self.scores.flush()
+
+    async def cog_unload(self):
+        if self.maintenance_task is not None:
+            self.maintenance_task.cancel()
+        await self.scores.flush()
 
     @app_commands.command(name="startgame", description="Start a guessing game")
-    async def start_game(self, interaction: discord.Interaction):
-        await interaction.response.send_message("Game started! Guess a number between 1 and 10.")
+    @app_commands.describe(maximum=f"Guess a number between 1 and this (default {DEFAULT_MAXIMUM})")
+    async def start_game(self, interaction: discord.Interaction, maximum: int = DEFAULT_MAXIMUM):
+        if interaction.guild_id is None:
+            # Scores are kept per server
+            await interaction.response.send_message("The guessing game can only be played in a server.", ephemeral=True)
+            return
+        if not 2 <= maximum <= LARGEST_MAXIMUM:
+            await interaction.response.send_message(f"The maximum must be between 2 and {LARGEST_MAXIMUM}.", ephemeral=True)
+            return
+        attempts = attempts_for(maximum)
+        self.sessions.start((interaction.channel_id, interaction.user.id), random.randint(1, maximum), maximum, attempts)
+        await interaction.response.send_message(f"Game started! Guess a number between 1 and {maximum}. You have {attempts} attempts.")
 
-    @app_commands.command(name="guess", description="Guess a number between 1 and 10")
+    @app_commands.command(name="guess", description="Guess the number of your current game")
     @app_commands.describe(number="The number you guess")
     async def guess(self, interaction: discord.Interaction, number: int):
-        answer = random.randint(1, 10)
-        if number == answer:
-            await interaction.response.send_message(f"Congratulations {interaction.user.mention}, you guessed the right number!")
+        key = (interaction.channel_id, interaction.user.id)
+        session = self.sessions.get(key)
+        if session is None:
+            await interaction.response.send_message("You don't have a game running in this channel, use /startgame first.", ephemeral=True)
+            return
+
+        session.attempts += 1
+        session.attempts_left -= 1
+        if number == session.answer:
+            self.sessions.end(key)
+            self.scores.record(interaction.guild_id, interaction.user.id, True, session.attempts)
+            await interaction.response.send_message(f"Congratulations {interaction.user.mention}, you guessed the right number in {session.attempts} attempts!")
+        elif session.attempts_left == 0:
+            self.sessions.end(key)
+            self.scores.record(interaction.guild_id, interaction.user.id, False, session.attempts)
+            await interaction.response.send_message(f"Sorry {interaction.user.mention}, the correct number was {session.answer}.")
         else:
-            await interaction.response.send_message(f"Sorry {interaction.user.mention}, the correct number was {answer}.")
+            hint = "higher" if number < session.answer else "lower"
+            await interaction.response.send_message(f"{interaction.user.mention}, it's {hint} than {number}. {session.attempts_left} attempts left.")
+
+    @app_commands.command(name="gameleaderboard", description="Shows the guessing game leaderboard")
+    async def game_leaderboard(self, interaction: discord.Interaction):
+        if interaction.guild_id is None:
+            await interaction.response.send_message("The leaderboard is kept per server.", ephemeral=True)
+            return
+        await self.scores.flush()
+        session = SessionLocal()
+        try:
+            rows = session.execute(text('''
+                SELECT user_id, wins, games, best_attempts FROM gamescore
+                WHERE guild_id = :guild_id ORDER BY wins DESC, best_attempts ASC LIMIT 10
+            '''), {'guild_id': interaction.guild_id}).all()
+            embed = discord.Embed(title="🎲 Guessing Game Leaderboard", color=discord.Color.blue())
+            if not rows:
+                embed.description = "Nobody has finished a game yet."
+            for position, (user_id, wins, games, best_attempts) in enumerate(rows, start=1):
+                best = f", best: {best_attempts} attempts" if best_attempts else ""
+                embed.add_field(name=f"#{position}", value=f"<@{user_id}> · {wins} wins of {games} games{best}", inline=False)
+            await interaction.response.send_message(embed=embed)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+            embed = discord.Embed(title="Error", description="Failed to retrieve the leaderboard.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        finally:
+            session.close()
+
+async def setup(bot, restart_fn):
+    await setup_game_score_columns()
+    cog = Game(bot)
+    await bot.add_cog(cog)
+    cog.start()
 
-async def setup(bot):
-    await bot.add_cog(Game(bot))
+__intents__ = ["guilds"]
+__dependencies__ = ["database"]
+__version__ = "2.0.0"
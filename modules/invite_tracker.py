@@ -4,10 +4,15 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from modules.dynamic_models import User, ServerUser
-from modules.database import get_or_create, update_instance, add_column, SessionLocal
-from sqlalchemy import Integer, BigInteger, Boolean, func
+from modules.debounce import DebounceStore
+from modules.join_rate import JoinRateMonitor
+from modules.metrics_registry import metrics
+from modules.database import get_or_create, update_instance, add_column, add_index, SessionLocal, engine
+from sqlalchemy import Integer, BigInteger, Boolean, String, func, text
 import traceback
 import asyncio
+from array import array
+from datetime import datetime, timezone
 import time
 
 async def setup_invite_tracker_columns():
@@ -15,16 +20,365 @@ async def setup_invite_tracker_columns():
     await add_column('serveruser', 'invites_count', Integer, default=0, nullable=False)
     await add_column('serveruser', 'left_guild', Boolean, default=False, nullable=False)
     await add_column('serveruser', 'left_invitees', Integer, default=0, nullable=False)
-    await add_column('serveruser', 'stayed_invitees', Integer, default=0, nullable=False, final_column=True)
+    await add_column('serveruser', 'stayed_invitees', Integer, default=0, nullable=False)
+    await add_column('serveruser', 'invite_code', String, nullable=True, final_column=True)
+    add_index('serveruser', 'ix_serveruser_server_invited_by', 'server_id', 'invited_by')
+
+async def setup_reconcile_columns():
+    await add_column('invitereconcile', 'guild_id', BigInteger, nullable=False, primary_key=True)
+    await add_column('invitereconcile', 'reconciled_at', Integer, default=0, nullable=False, final_column=True)
+
+
+class ReferralIndex:
+    """In-memory adjacency index of the invited_by graph, kept per guild."""
+
+    def __init__(self):
+        self.children = {}
+        self.parents = {}
+        self.left = {}
+        self.loading = {}
+        self.pending = {}
+
+    def is_loaded(self, guild_id):
+        return guild_id in self.parents
+
+    def ensure_loaded(self, guild_id):
+        if self.is_loaded(guild_id):
+            return True
+        if guild_id not in self.loading:
+            self.pending[guild_id] = []
+            self.loading[guild_id] = asyncio.create_task(self.load_guild(guild_id))
+        return False
+
+    async def load_guild(self, guild_id):
+        try:
+            children, parents, left = await asyncio.to_thread(self.read_guild_rows, guild_id)
+            self.children[guild_id] = children
+            self.parents[guild_id] = parents
+            self.left[guild_id] = left
+            for event in self.pending.pop(guild_id, []):
+                event()
+            print(f"Referral index loaded for guild {guild_id}: {len(parents)} edges")
+        except Exception as e:
+            self.pending.pop(guild_id, None)
+            print(f"Failed to load referral index for guild {guild_id}: {e}")
+            traceback.print_exc()
+        finally:
+            self.loading.pop(guild_id, None)
+
+    def read_guild_rows(self, guild_id):
+        children, parents, left = {}, {}, set()
+        session = SessionLocal()
+        try:
+            rows = session.query(ServerUser.user_id, ServerUser.invited_by, ServerUser.left_guild).filter(
+                ServerUser.server_id == guild_id
+            ).yield_per(5000)
+            for user_id, invited_by, left_guild in rows:
+                member_id = int(user_id)
+                if invited_by:
+                    parents[member_id] = int(invited_by)
+                    children.setdefault(int(invited_by), set()).add(member_id)
+                if left_guild:
+                    left.add(member_id)
+        finally:
+            session.close()
+            SessionLocal.remove()
+        return children, parents, left
+
+    def apply(self, guild_id, event):
+        if guild_id in self.loading:
+            self.pending[guild_id].append(event)
+        elif self.is_loaded(guild_id):
+            event()
+
+    def record_join(self, guild_id, member_id, inviter_id):
+        def event():
+            parents = self.parents[guild_id]
+            if inviter_id and member_id not in parents:
+                parents[member_id] = inviter_id
+                self.children[guild_id].setdefault(inviter_id, set()).add(member_id)
+            self.left[guild_id].discard(member_id)
+        self.apply(guild_id, event)
+
+    def record_leave(self, guild_id, member_id):
+        self.apply(guild_id, lambda: self.left[guild_id].add(member_id))
+
+    def invalidate(self, guild_id):
+        self.children.pop(guild_id, None)
+        self.parents.pop(guild_id, None)
+        self.left.pop(guild_id, None)
+
+    def subtree_levels(self, guild_id, root_id, max_depth):
+        children = self.children[guild_id]
+        left = self.left[guild_id]
+        levels = []
+        seen = {root_id}
+        frontier = [root_id]
+        while frontier and len(levels) < max_depth:
+            next_frontier = []
+            for node in frontier:
+                for child in children.get(node, ()):
+                    if child not in seen:
+                        seen.add(child)
+                        next_frontier.append(child)
+            if not next_frontier:
+                break
+            stayed = sum(1 for member_id in next_frontier if member_id not in left)
+            levels.append((len(next_frontier), stayed, len(next_frontier) - stayed))
+            frontier = next_frontier
+        return levels
+
+    def chain(self, guild_id, member_id, max_depth):
+        parents = self.parents[guild_id]
+        chain = []
+        seen = {member_id}
+        current = parents.get(member_id)
+        while current and current not in seen and len(chain) < max_depth:
+            chain.append(current)
+            seen.add(current)
+            current = parents.get(current)
+        return chain
+
+
+def subtree_levels_from_db(guild_id, root_id, max_depth):
+    session = SessionLocal()
+    try:
+        rows = session.execute(text('''
+            WITH RECURSIVE tree(member_id, depth) AS (
+                SELECT CAST(user_id AS INTEGER), 1 FROM serveruser
+                WHERE server_id = :guild_id AND invited_by = :root_id
+                UNION
+                SELECT CAST(s.user_id AS INTEGER), t.depth + 1 FROM serveruser s
+                JOIN tree t ON s.invited_by = t.member_id
+                WHERE s.server_id = :guild_id AND t.depth < :max_depth
+            ),
+            first_seen AS (
+                SELECT member_id, MIN(depth) AS depth FROM tree GROUP BY member_id
+            )
+            SELECT f.depth, COUNT(*), SUM(CASE WHEN s.left_guild THEN 0 ELSE 1 END)
+            FROM first_seen f
+            JOIN serveruser s ON s.server_id = :guild_id AND s.user_id = CAST(f.member_id AS TEXT)
+            GROUP BY f.depth ORDER BY f.depth
+        '''), {'guild_id': guild_id, 'root_id': root_id, 'max_depth': max_depth}).all()
+        return [(total, stayed, total - stayed) for _, total, stayed in rows]
+    finally:
+        session.close()
+        SessionLocal.remove()
+
+
+def chain_from_db(guild_id, member_id, max_depth):
+    session = SessionLocal()
+    try:
+        # The row at depth d holds inviter d + 1, so the recursion stops after max_depth rows
+        rows = session.execute(text('''
+            WITH RECURSIVE chain(member_id, invited_by, depth) AS (
+                SELECT CAST(user_id AS INTEGER), invited_by, 0 FROM serveruser
+                WHERE server_id = :guild_id AND user_id = :member_id
+                UNION
+                SELECT CAST(s.user_id AS INTEGER), s.invited_by, c.depth + 1 FROM serveruser s
+                JOIN chain c ON s.user_id = CAST(c.invited_by AS TEXT)
+                WHERE s.server_id = :guild_id AND c.depth + 1 < :max_depth
+            )
+            SELECT invited_by FROM chain WHERE invited_by IS NOT NULL ORDER BY depth
+        '''), {'guild_id': guild_id, 'member_id': str(member_id), 'max_depth': max_depth}).all()
+        chain = []
+        for (inviter_id,) in rows:
+            if inviter_id == member_id or inviter_id in chain:
+                break
+            chain.append(inviter_id)
+        return chain
+    finally:
+        session.close()
+        SessionLocal.remove()
+
+RECONCILE_CHUNK_SIZE = 1000
+# The bot restarts whenever a module adds a column, so startup only reconciles guilds not reconciled for this long
+RECONCILE_INTERVAL = 24 * 3600
+
+
+async def iter_guild_members(guild):
+    if guild.chunked:
+        for member in guild.members:
+            yield member
+    else:
+        async for member in guild.fetch_members(limit=None):
+            yield member
+
+
+def read_reconcile_times():
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT guild_id, reconciled_at FROM invitereconcile")).all())
+
+
+def write_member_reconciliation(guild_id, member_ids, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Diff member_ids against serveruser and fix left_guild and the invitee counters.
+
+    The ids are loaded into a temporary table in chunks and the diff runs as
+    set-based UPDATEs on one connection. stayed_invitees and left_invitees are
+    recomputed from the invited_by edges, including resetting inviters whose
+    invitees are all gone. invites_count also counts raid joins that couldn't
+    be attributed to an invitee, so it is only raised to the attributed total.
+    """
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TEMP TABLE IF NOT EXISTS reconcile_members (user_id TEXT PRIMARY KEY)"))
+        conn.execute(text("DELETE FROM reconcile_members"))
+        try:
+            for offset in range(0, len(member_ids), chunk_size):
+                conn.execute(text("INSERT OR IGNORE INTO reconcile_members (user_id) VALUES (:user_id)"),
+                             [{'user_id': str(member_id)} for member_id in member_ids[offset:offset + chunk_size]])
+
+            params = {'guild_id': guild_id}
+            marked_left = conn.execute(text('''
+                UPDATE serveruser SET left_guild = 1
+                WHERE server_id = :guild_id AND left_guild = 0
+                AND user_id NOT IN (SELECT user_id FROM reconcile_members)
+            '''), params).rowcount
+            marked_present = conn.execute(text('''
+                UPDATE serveruser SET left_guild = 0
+                WHERE server_id = :guild_id AND left_guild = 1
+                AND user_id IN (SELECT user_id FROM reconcile_members)
+            '''), params).rowcount
+            counters_fixed = conn.execute(text('''
+                UPDATE serveruser
+                SET stayed_invitees = counts.stayed, left_invitees = counts.left_count,
+                    invites_count = MAX(serveruser.invites_count, counts.stayed + counts.left_count)
+                FROM (
+                    SELECT inviter.id,
+                           COALESCE(invitees.stayed, 0) AS stayed,
+                           COALESCE(invitees.left_count, 0) AS left_count
+                    FROM serveruser AS inviter
+                    LEFT JOIN (
+                        SELECT invited_by,
+                               SUM(CASE WHEN left_guild THEN 0 ELSE 1 END) AS stayed,
+                               SUM(CASE WHEN left_guild THEN 1 ELSE 0 END) AS left_count
+                        FROM serveruser
+                        WHERE server_id = :guild_id AND invited_by IS NOT NULL
+                        GROUP BY invited_by
+                    ) AS invitees ON inviter.user_id = CAST(invitees.invited_by AS TEXT)
+                    WHERE inviter.server_id = :guild_id
+                ) AS counts
+                WHERE serveruser.id = counts.id
+                AND (serveruser.stayed_invitees != counts.stayed OR serveruser.left_invitees != counts.left_count
+                     OR serveruser.invites_count < counts.stayed + counts.left_count)
+            '''), params).rowcount
+            conn.execute(text('''
+                INSERT INTO invitereconcile (guild_id, reconciled_at) VALUES (:guild_id, :now)
+                ON CONFLICT (guild_id) DO UPDATE SET reconciled_at = excluded.reconciled_at
+            '''), {'guild_id': guild_id, 'now': int(time.time())})
+            conn.commit()
+        except Exception:
+            # All three passes land together or not at all, otherwise left_guild and the counters disagree
+            conn.rollback()
+            raise
+        finally:
+            conn.execute(text("DROP TABLE IF EXISTS reconcile_members"))
+            conn.commit()
+
+    return {
+        'members': len(member_ids),
+        'marked_left': marked_left,
+        'marked_present': marked_present,
+        'counters_fixed': counters_fixed,
+    }
+
+
+async def reconcile_guild_members(guild, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Collect the guild's live member ids, then reconcile serveruser with them in a worker thread.
+
+    The ids are kept in a compact array while fetch_members pages through the
+    guild, so no connection is held and nothing blocks the event loop.
+    """
+    member_ids = array('Q')
+    async for member in iter_guild_members(guild):
+        member_ids.append(member.id)
+    return await asyncio.to_thread(write_member_reconciliation, guild.id, member_ids, chunk_size)
+
+
+RAID_BATCH_INTERVAL = 5
+MEMBER_EVENT_COOLDOWN = 2
+
+
+def assign_raid_invitees(members, used_invites):
+    """Map each batch member to an (inviter_id, code) edge.
+
+    Members are handed out in join order, each invite taking as many as its
+    use count rose by. Members left over once the deltas run out stay
+    unattributed, so the edges never claim more joins than the invites saw.
+    """
+    slots = [(invite.inviter.id if invite.inviter else None, invite.code)
+             for invite, delta in used_invites for _ in range(delta)]
+    return {member.id: slot for member, slot in zip(members, slots)}
+
+
+def store_raid_batch(guild_id, members, edges, invite_deltas):
+    """Write a whole batch of raid joins with a handful of bulk statements.
+
+    `edges` maps member ids to (inviter_id, code); every inviter's stayed
+    count is raised by the edges written for it, so reconciliation agrees.
+    """
+    now = datetime.utcnow()
+    users = [{
+        'discord_id': str(member.id),
+        'global_join_date': now,
+        'username': member.name,
+        'avatar': str(member.avatar),
+        'account_creation_date': member.created_at.replace(tzinfo=None),
+    } for member in members]
+    server_users = [{
+        'id': f"{member.id}_{guild_id}",
+        'user_id': str(member.id),
+        'server_id': guild_id,
+        'join_date': member.joined_at.replace(tzinfo=None) if member.joined_at else now,
+        'invited_by': edges.get(member.id, (None, None))[0],
+        'invite_code': edges.get(member.id, (None, None))[1],
+    } for member in members]
+    stayed = {}
+    for inviter_id, _ in edges.values():
+        if inviter_id:
+            stayed[inviter_id] = stayed.get(inviter_id, 0) + 1
+
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT OR IGNORE INTO user (discord_id, global_join_date, username, avatar, account_creation_date)
+            VALUES (:discord_id, :global_join_date, :username, :avatar, :account_creation_date)
+        '''), users)
+        conn.execute(text('''
+            INSERT OR IGNORE INTO serveruser (id, user_id, server_id, join_date, invited_by, invite_code)
+            VALUES (:id, :user_id, :server_id, :join_date, :invited_by, :invite_code)
+        '''), server_users)
+        conn.execute(text('''
+            UPDATE serveruser SET left_guild = 0,
+                invited_by = COALESCE(invited_by, :invited_by),
+                invite_code = COALESCE(:invite_code, invite_code)
+            WHERE id = :id
+        '''), server_users)
+        for inviter_id, delta in invite_deltas.items():
+            params = {'id': f"{inviter_id}_{guild_id}", 'user_id': str(inviter_id), 'server_id': guild_id, 'join_date': now,
+                      'delta': delta, 'stayed': stayed.get(inviter_id, 0)}
+            conn.execute(text('''
+                INSERT OR IGNORE INTO serveruser (id, user_id, server_id, join_date)
+                VALUES (:id, :user_id, :server_id, :join_date)
+            '''), params)
+            conn.execute(text('''
+                UPDATE serveruser SET invites_count = invites_count + :delta, stayed_invitees = stayed_invitees + :stayed
+                WHERE id = :id
+            '''), params)
+
 
 class InviteTracker(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.invite_uses = {}
-        self.event_timestamps = {}
-
-    async def update_invite_uses(self):
-        for guild in self.bot.guilds:
+        self.member_events = {}
+        self.referrals = ReferralIndex()
+        self.reconciling = set()
+        self.join_rates = JoinRateMonitor()
+        self.raid_queues = {}
+        self.raid_tasks = {}
+        self.reconcile_task = None
+
+    async def update_invite_uses(self, guilds=None):
+        for guild in self.bot.guilds if guilds is None else guilds:
             try:
                 invites = await guild.invites()
                 self.invite_uses[guild.id] = {invite.code: invite.uses for invite in invites}
@@ -33,29 +387,146 @@ class InviteTracker(commands.Cog):
             except Exception as e:
                 print(f"An unexpected error occurred while updating invites for guild: {guild.name} ({guild.id}): {e}")
 
+    def debounce_stats(self):
+        values = {}
+        for shard_id, store in self.member_events.items():
+            stats = store.stats()
+            values[(shard_id, "hit")] = stats['hits']
+            values[(shard_id, "miss")] = stats['misses']
+        return values
+
+    def shard_guilds(self, shard_id):
+        return [guild for guild in self.bot.guilds if guild.shard_id == shard_id]
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        await self.update_invite_uses()
-
-    def debounce_event(self, event_key, cooldown=2):
-        current_time = time.time()
-        if event_key in self.event_timestamps:
-            last_time = self.event_timestamps[event_key]
-            if current_time - last_time < cooldown:
-                return True
-        self.event_timestamps[event_key] = current_time
-        return False
+        await self.update_invite_uses([guild])
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.invite_uses.pop(guild.id, None)
+        self.referrals.invalidate(guild.id)
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        # A shard that (re)connects only rewarms the invite cache of its own guilds
+        await self.update_invite_uses(self.shard_guilds(shard_id))
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id):
+        await self.update_invite_uses(self.shard_guilds(shard_id))
+
+    async def reconcile_guild(self, guild):
+        if guild.id in self.reconciling:
+            return None
+        self.reconciling.add(guild.id)
+        try:
+            result = await reconcile_guild_members(guild)
+            self.referrals.invalidate(guild.id)
+            print(f"Reconciled {guild.name} ({guild.id}): {result}")
+            return result
+        except discord.Forbidden:
+            print(f"Missing permissions to fetch members for guild: {guild.name} ({guild.id})")
+        except Exception as e:
+            print(f"An unexpected error occurred while reconciling guild: {guild.name} ({guild.id}): {e}")
+            traceback.print_exc()
+        finally:
+            self.reconciling.discard(guild.id)
+        return None
+
+    async def reconcile_all_guilds(self, interval=RECONCILE_INTERVAL):
+        """Reconcile the guilds not reconciled within `interval` seconds; /reconcile_invites runs one on demand."""
+        reconciled_at = await asyncio.to_thread(read_reconcile_times)
+        cutoff = time.time() - interval
+        stale = [guild for guild in self.bot.guilds if reconciled_at.get(guild.id, 0) <= cutoff]
+        print(f"Reconciling invite data of {len(stale)} guilds, {len(self.bot.guilds) - len(stale)} were reconciled recently")
+        for guild in stale:
+            await self.reconcile_guild(guild)
+
+    async def cog_unload(self):
+        # Joins still queued for a raid batch are stored rather than dropped with the task
+        queued = [(self.bot.get_guild(guild_id), members[:]) for guild_id, members in self.raid_queues.items() if members]
+        tasks = [*self.raid_tasks.values(), *self.referrals.loading.values()]
+        if self.reconcile_task is not None:
+            tasks.append(self.reconcile_task)
+            self.reconcile_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for guild, members in queued:
+            if guild is not None:
+                await self.process_raid_batch(guild, members)
+
+    def debounce_event(self, guild, event_key):
+        # One store per shard, so a shard's state stays with the process that owns the shard
+        store = self.member_events.get(guild.shard_id)
+        if store is None:
+            store = self.member_events[guild.shard_id] = DebounceStore(cooldown=MEMBER_EVENT_COOLDOWN, max_size=50_000)
+        return store.hit((guild.id, event_key))
+
+    async def process_raid_queue(self, guild):
+        queue = self.raid_queues[guild.id]
+        try:
+            while queue or self.join_rates.in_raid(guild.id):
+                await asyncio.sleep(RAID_BATCH_INTERVAL)
+                if not queue:
+                    continue
+                members = queue[:]
+                queue.clear()
+                await self.process_raid_batch(guild, members)
+        finally:
+            self.raid_tasks.pop(guild.id, None)
+            self.raid_queues.pop(guild.id, None)
+
+    async def process_raid_batch(self, guild, members):
+        # One invite fetch per batch instead of one per join; per-code deltas credit the inviters.
+        invite_deltas = {}
+        used_invites = []
+        try:
+            invites = await guild.invites()
+            previous_uses = self.invite_uses.get(guild.id, {})
+            for invite in invites:
+                delta = invite.uses - previous_uses.get(invite.code, 0)
+                if delta > 0:
+                    used_invites.append((invite, delta))
+                    self.join_rates.record_invite_use(guild.id, invite.code, delta)
+                    if invite.inviter:
+                        invite_deltas[invite.inviter.id] = invite_deltas.get(invite.inviter.id, 0) + delta
+            self.invite_uses[guild.id] = {invite.code: invite.uses for invite in invites}
+        except discord.Forbidden:
+            print(f"Missing permissions to fetch invites for guild: {guild.name} ({guild.id})")
+        except Exception as e:
+            print(f"An unexpected error occurred while fetching invites for guild: {guild.name} ({guild.id}): {e}")
+
+        # Every stayed invitee credited to an inviter gets a matching invited_by edge
+        edges = assign_raid_invitees(members, used_invites)
+
+        try:
+            await asyncio.to_thread(store_raid_batch, guild.id, members, edges, invite_deltas)
+            for member in members:
+                self.referrals.record_join(guild.id, member.id, edges.get(member.id, (None, None))[0])
+            print(f"Stored raid batch of {len(members)} joins for guild: {guild.name} ({guild.id})")
+        except Exception as e:
+            print(f"Failed to store raid batch for guild: {guild.name} ({guild.id}): {e}")
+            traceback.print_exc()
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
         event_key = f"join-{member.id}"
-        if self.debounce_event(event_key):
+        if self.debounce_event(member.guild, event_key):
+            return
+
+        guild = member.guild
+        account_age_days = (datetime.now(timezone.utc) - member.created_at).days
+        if self.join_rates.record_join(guild.id, account_age_days):
+            self.raid_queues.setdefault(guild.id, []).append(member)
+            if guild.id not in self.raid_tasks:
+                self.raid_tasks[guild.id] = asyncio.create_task(self.process_raid_queue(guild))
             return
 
         print(f"Joined {member.name}")
 
         try:
-            guild = member.guild
 
             try:
                 await asyncio.sleep(2)
@@ -84,6 +555,7 @@ class InviteTracker(commands.Cog):
 
             if used_invite:
                 inviter = used_invite.inviter
+                self.join_rates.record_invite_use(guild.id, used_invite.code)
                 print(f'{member.name} joined using invite: {used_invite.code}, invited by: {inviter.name if inviter else "Unknown"}')
 
                 # Ensure the invitee is created or retrieved
@@ -98,7 +570,8 @@ class InviteTracker(commands.Cog):
                     'invited_by': inviter_id,
                 }
                 server_user = await get_or_create(ServerUser, **server_user_data)
-                await update_instance(ServerUser, {'user_id': db_user.discord_id, 'server_id': guild.id}, left_guild=False)
+                await update_instance(ServerUser, {'user_id': db_user.discord_id, 'server_id': guild.id}, left_guild=False, invite_code=used_invite.code)
+                self.referrals.record_join(guild.id, member.id, server_user.invited_by or inviter_id)
 
                 if inviter_id:
                     # Ensure the inviter ServerUser instance is created or retrieved
@@ -122,27 +595,33 @@ class InviteTracker(commands.Cog):
             traceback.print_exc()
 
     @commands.Cog.listener()
-    async def on_member_remove(self, member):
-        event_key = f"leave-{member.id}"
-        if self.debounce_event(event_key):
+    async def on_raw_member_remove(self, payload):
+        # The raw event fires whether or not the member was cached, so leaves don't depend on chunking
+        guild = self.bot.get_guild(payload.guild_id)
+        user = payload.user
+        if guild is None:
+            return
+        event_key = f"leave-{user.id}"
+        if self.debounce_event(guild, event_key):
             return
 
-        print(f"Left {member.name}")
+        print(f"Left {user.name}")
 
         try:
-            server_user = await get_or_create(ServerUser, user_id=member.id, server_id=member.guild.id)
+            server_user = await get_or_create(ServerUser, user_id=user.id, server_id=guild.id)
             if server_user:
-                await update_instance(ServerUser, {'user_id': member.id, 'server_id': member.guild.id}, left_guild=True)
+                await update_instance(ServerUser, {'user_id': user.id, 'server_id': guild.id}, left_guild=True)
+                self.referrals.record_leave(guild.id, user.id)
 
                 if server_user.invited_by:
-                    inviter_server_user = await get_or_create(ServerUser, user_id=server_user.invited_by, server_id=member.guild.id)
+                    inviter_server_user = await get_or_create(ServerUser, user_id=server_user.invited_by, server_id=guild.id)
                     if inviter_server_user:
-                        await update_instance(ServerUser, {'user_id': server_user.invited_by, 'server_id': member.guild.id},
+                        await update_instance(ServerUser, {'user_id': server_user.invited_by, 'server_id': guild.id},
                                               stayed_invitees=inviter_server_user.stayed_invitees - 1,
                                               left_invitees=inviter_server_user.left_invitees + 1)
 
                     # Logging the update
-                    updated_inviter_server_user = await get_or_create(ServerUser, user_id=server_user.invited_by, server_id=member.guild.id)
+                    updated_inviter_server_user = await get_or_create(ServerUser, user_id=server_user.invited_by, server_id=guild.id)
 
         except Exception as e:
             error_message = str(e)
@@ -198,6 +677,105 @@ class InviteTracker(commands.Cog):
         finally:
             session.close()
 
+    @app_commands.command(name="invite_tree", description="Shows the full downstream referral tree of a user")
+    @app_commands.describe(user="The inviter to inspect", depth="Maximum number of levels to walk")
+    async def invite_tree(self, interaction: discord.Interaction, user: discord.Member, depth: int = 25):
+        try:
+            guild_id = interaction.guild.id
+            depth = max(1, min(depth, 100))
+            if self.referrals.ensure_loaded(guild_id):
+                levels = self.referrals.subtree_levels(guild_id, user.id, depth)
+                source = "index"
+            else:
+                levels = await asyncio.to_thread(subtree_levels_from_db, guild_id, user.id, depth)
+                source = "database"
+
+            total = sum(level[0] for level in levels)
+            stayed = sum(level[1] for level in levels)
+            embed = discord.Embed(title="🌳 Referral Tree", description=f"Downstream invites of {user.mention}", color=discord.Color.blue())
+            embed.add_field(name="📏 Depth", value=len(levels), inline=True)
+            embed.add_field(name="👥 Total Descendants", value=total, inline=True)
+            embed.add_field(name="✅ Stayed / ❌ Left", value=f"{stayed} / {total - stayed}", inline=True)
+            if levels:
+                lines = [f"Level {i}: {count} (Stayed: {level_stayed}, Left: {level_left})"
+                         for i, (count, level_stayed, level_left) in enumerate(levels[:15], start=1)]
+                if len(levels) > 15:
+                    lines.append(f"... {len(levels) - 15} more levels")
+                embed.add_field(name="📊 Per Level", value="\n".join(lines), inline=False)
+            embed.set_footer(text=f"Source: {source}")
+            await interaction.response.send_message(embed=embed)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+            embed = discord.Embed(title="Error", description="Failed to retrieve the referral tree.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="invite_chain", description="Shows the chain of inviters above a user")
+    @app_commands.describe(user="The member to trace back")
+    async def invite_chain(self, interaction: discord.Interaction, user: discord.Member):
+        try:
+            guild_id = interaction.guild.id
+            if self.referrals.ensure_loaded(guild_id):
+                chain = self.referrals.chain(guild_id, user.id, 100)
+                source = "index"
+            else:
+                chain = await asyncio.to_thread(chain_from_db, guild_id, user.id, 100)
+                source = "database"
+
+            embed = discord.Embed(title="🔗 Invite Chain", description=f"Inviters above {user.mention}", color=discord.Color.blue())
+            if chain:
+                lines = [f"{i}. <@{inviter_id}>" for i, inviter_id in enumerate(chain[:25], start=1)]
+                if len(chain) > 25:
+                    lines.append(f"... {len(chain) - 25} more")
+                embed.add_field(name=f"⬆️ {len(chain)} levels", value="\n".join(lines), inline=False)
+            else:
+                embed.add_field(name="⬆️ 0 levels", value="No known inviter", inline=False)
+            embed.set_footer(text=f"Source: {source}")
+            await interaction.response.send_message(embed=embed)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+            embed = discord.Embed(title="Error", description="Failed to retrieve the invite chain.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="join_stats", description="Shows recent join rates for this server")
+    async def join_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        stats = self.join_rates.snapshot(interaction.guild.id)
+        embed = discord.Embed(title="📈 Join Rates", color=discord.Color.red() if stats['raid'] else discord.Color.blue())
+        embed.add_field(name=f"⚡ Last {self.join_rates.burst_window}s", value=stats['last_burst'], inline=True)
+        embed.add_field(name="⏱️ Last Minute", value=stats['last_minute'], inline=True)
+        embed.add_field(name="🕐 Last Hour", value=f"{stats['last_hour']} (Peak: {stats['peak_minute']}/min)", inline=True)
+        codes = "\n".join(f"{code}: {count}" for code, count in stats['codes'][:10]) or "No invite uses in the last minute"
+        embed.add_field(name="🎟️ Invite Codes (last minute)", value=codes, inline=False)
+        ages = "\n".join(f"{label}: {count}" for label, count in stats['ages'].items())
+        embed.add_field(name="🎂 Account Age (last minute)", value=ages, inline=False)
+        embed.add_field(name="🚨 Raid Mode", value="Active" if stats['raid'] else "Inactive", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="reconcile_invites", description="Resync left/stayed invite data with the current member list")
+    async def reconcile_invites(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        result = await self.reconcile_guild(interaction.guild)
+        if result is None:
+            embed = discord.Embed(title="Error", description="Reconciliation is already running or failed.", color=discord.Color.red())
+        else:
+            embed = discord.Embed(title="🔄 Invite Reconciliation", color=discord.Color.green())
+            embed.add_field(name="👥 Members Scanned", value=result['members'], inline=True)
+            embed.add_field(name="❌ Marked Left", value=result['marked_left'], inline=True)
+            embed.add_field(name="✅ Marked Present", value=result['marked_present'], inline=True)
+            embed.add_field(name="🎟️ Counters Fixed", value=result['counters_fixed'], inline=True)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
     @app_commands.command(name="manage_invites", description="Manage invites for a user")
     @app_commands.describe(user="The user to manage invites for")
     async def manage_invites(self, interaction: discord.Interaction, user: discord.Member):
@@ -260,6 +838,7 @@ class InviteManagerView(discord.ui.View):
         try:
             session.query(ServerUser).filter_by(user_id=self.user.id, server_id=self.user.guild.id).delete()
             session.commit()
+            self.cog.referrals.invalidate(self.user.guild.id)
             embed = discord.Embed(title="Invite Manager", description=f"Deleted invite data for {self.user.display_name}")
             await interaction.response.edit_message(embed=embed)
         finally:
@@ -276,9 +855,15 @@ class InviteManagerView(discord.ui.View):
 
 async def setup(bot, restart_fn):
     await setup_invite_tracker_columns()
-    await bot.add_cog(InviteTracker(bot))
-    await InviteTracker(bot).update_invite_uses()
+    await setup_reconcile_columns()
+    cog = InviteTracker(bot)
+    await bot.add_cog(cog)
+    metrics.gauge('invite_event_debounce_lookups', 'Member event debounce lookups by shard and result', cog.debounce_stats, labels=('shard', 'result'))
+    metrics.gauge('invite_uses_cached_guilds', 'Guilds with a cached invite use snapshot', lambda: len(cog.invite_uses))
+    await cog.update_invite_uses()
+    cog.reconcile_task = asyncio.create_task(cog.reconcile_all_guilds())
 
 __intents__ = ["guilds", "members"]
+__member_cache__ = []
 __dependencies__ = ["database"]
 __version__ = "1.0.0"
@@ -0,0 +1,128 @@
+# modules/join_rate.py
+
+from collections import OrderedDict
+import time
+
+
+class RingCounter:
+    """Counts events in fixed-size time buckets, overwriting the oldest bucket as time moves on."""
+
+    __slots__ = ('resolution', 'counts', 'stamps')
+
+    def __init__(self, size, resolution=1.0):
+        self.resolution = resolution
+        self.counts = [0] * size
+        self.stamps = [-1] * size
+
+    def add(self, now, amount=1):
+        bucket = int(now // self.resolution)
+        index = bucket % len(self.counts)
+        if self.stamps[index] != bucket:
+            self.stamps[index] = bucket
+            self.counts[index] = 0
+        self.counts[index] += amount
+
+    def total(self, now, buckets=None):
+        size = len(self.counts)
+        buckets = size if buckets is None else min(buckets, size)
+        newest = int(now // self.resolution)
+        total = 0
+        for bucket in range(newest - buckets + 1, newest + 1):
+            index = bucket % size
+            if self.stamps[index] == bucket:
+                total += self.counts[index]
+        return total
+
+    def peak(self, now):
+        newest = int(now // self.resolution)
+        oldest = newest - len(self.counts) + 1
+        return max((count for count, stamp in zip(self.counts, self.stamps) if oldest <= stamp <= newest), default=0)
+
+
+AGE_BUCKETS = [(1, "< 1 day"), (7, "< 7 days"), (30, "< 30 days"), (None, "older")]
+
+
+def age_bucket(account_age_days):
+    for limit, label in AGE_BUCKETS:
+        if limit is None or account_age_days < limit:
+            return label
+
+
+class GuildJoinRates:
+    __slots__ = ('seconds', 'minutes', 'codes', 'ages', 'raid_until')
+
+    def __init__(self, max_codes):
+        self.seconds = RingCounter(60, 1)
+        self.minutes = RingCounter(60, 60)
+        self.codes = OrderedDict()
+        self.ages = {label: RingCounter(60, 1) for _, label in AGE_BUCKETS}
+        self.raid_until = 0.0
+
+
+class JoinRateMonitor:
+    """Sliding-window join counters per guild with a simple raid threshold.
+
+    A guild enters raid mode when joins in the last `burst_window` seconds reach
+    `burst_threshold` or joins in the last minute reach `minute_threshold`, and
+    leaves it `raid_cooldown` seconds after the last crossing.
+    """
+
+    def __init__(self, burst_threshold=10, burst_window=10, minute_threshold=30, raid_cooldown=60, max_codes=256, clock=time.monotonic):
+        self.burst_threshold = burst_threshold
+        self.burst_window = burst_window
+        self.minute_threshold = minute_threshold
+        self.raid_cooldown = raid_cooldown
+        self.max_codes = max_codes
+        self.clock = clock
+        self.guilds = {}
+
+    def get_guild(self, guild_id):
+        rates = self.guilds.get(guild_id)
+        if rates is None:
+            rates = self.guilds[guild_id] = GuildJoinRates(self.max_codes)
+        return rates
+
+    def record_join(self, guild_id, account_age_days=None):
+        """Count a join and return True if the guild is (now) in raid mode."""
+        now = self.clock()
+        rates = self.get_guild(guild_id)
+        rates.seconds.add(now)
+        rates.minutes.add(now)
+        if account_age_days is not None:
+            rates.ages[age_bucket(account_age_days)].add(now)
+
+        if (rates.seconds.total(now, self.burst_window) >= self.burst_threshold
+                or rates.seconds.total(now, 60) >= self.minute_threshold):
+            if rates.raid_until <= now:
+                print(f"Raid mode enabled for guild {guild_id}")
+            rates.raid_until = now + self.raid_cooldown
+        return rates.raid_until > now
+
+    def record_invite_use(self, guild_id, code, amount=1):
+        rates = self.get_guild(guild_id)
+        counter = rates.codes.get(code)
+        if counter is None:
+            counter = rates.codes[code] = RingCounter(60, 1)
+            if len(rates.codes) > self.max_codes:
+                rates.codes.popitem(last=False)
+        else:
+            rates.codes.move_to_end(code)
+        counter.add(self.clock(), amount)
+
+    def in_raid(self, guild_id):
+        rates = self.guilds.get(guild_id)
+        return rates is not None and rates.raid_until > self.clock()
+
+    def snapshot(self, guild_id):
+        now = self.clock()
+        rates = self.get_guild(guild_id)
+        codes = [(code, counter.total(now)) for code, counter in rates.codes.items()]
+        return {
+            'last_burst': rates.seconds.total(now, self.burst_window),
+            'last_minute': rates.seconds.total(now, 60),
+            'last_hour': rates.minutes.total(now),
+            'peak_minute': rates.minutes.peak(now),
+            'codes': sorted((item for item in codes if item[1]), key=lambda item: item[1], reverse=True),
+            'ages': {label: counter.total(now) for label, counter in rates.ages.items()},
+            'raid': rates.raid_until > now,
+        }
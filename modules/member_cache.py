@@ -0,0 +1,91 @@
+# modules/member_cache.py
+
+import asyncio
+import sys
+import time
+
+import discord
+
+SIZE_SAMPLE = 100
+# References to objects shared by every member of a guild, which would be counted once per member
+SHARED_ATTRIBUTES = {'guild', '_state'}
+
+
+def member_cache_policy(manifests, intents):
+    """Derive the member cache flags and startup chunking from the modules' manifests.
+
+    Modules declare the member cache flags they rely on in `__member_cache__`
+    (e.g. ["joined"] or ["voice"]) and whether they need every member of a
+    guild in `__chunk_guilds__` ("startup", "lazy" or None). A module that
+    requests the members intent without declaring its cache needs keeps the
+    full cache and startup chunking.
+    """
+    flags = discord.MemberCacheFlags.none()
+    chunk_at_startup = False
+    for module, manifest in manifests.items():
+        declared = manifest.get("member_cache")
+        if declared is None:
+            if "members" in manifest["intents"]:
+                print(f"Module {module} doesn't declare __member_cache__, caching all members")
+                return discord.MemberCacheFlags.from_intents(intents), True
+            continue
+        for flag in declared:
+            if not hasattr(flags, flag):
+                print(f"Module {module} requests unknown member cache flag: {flag}")
+            elif flag == "joined" and not intents.members:
+                print(f"Module {module} requests the joined member cache without the members intent")
+            else:
+                setattr(flags, flag, True)
+        if manifest.get("chunk_guilds") == "startup":
+            chunk_at_startup = True
+    return flags, chunk_at_startup
+
+
+class GuildChunker:
+    """Chunks a guild's member list the first time a module needs all of it."""
+
+    def __init__(self, concurrency=2):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.locks = {}
+        self.timings = {}
+
+    async def ensure_chunked(self, guild):
+        if guild.chunked:
+            return
+        lock = self.locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            if guild.chunked:
+                return
+            async with self.semaphore:
+                start = time.perf_counter()
+                await guild.chunk(cache=True)
+                self.timings[guild.id] = time.perf_counter() - start
+                print(f"Chunked {guild.name} ({guild.id}): {len(guild.members)} members in {self.timings[guild.id]:.2f}s")
+        self.locks.pop(guild.id, None)
+
+
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if slot in SHARED_ATTRIBUTES:
+                continue
+            value = getattr(obj, slot, None)
+            if value is not None:
+                size += sys.getsizeof(value)
+    return size
+
+
+def guild_memory_report(guilds):
+    """Per guild: cached members, total members, whether it is chunked and the estimated cache size in bytes."""
+    report = []
+    for guild in guilds:
+        members = guild.members
+        sample = members[:SIZE_SAMPLE]
+        per_member = sum(object_size(member) for member in sample) / len(sample) if sample else 0
+        report.append((guild, len(members), guild.member_count or 0, guild.chunked, int(per_member * len(members))))
+    report.sort(key=lambda row: row[4], reverse=True)
+    return report
+
+
+chunker = GuildChunker()
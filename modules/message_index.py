@@ -0,0 +1,97 @@
+# modules/message_index.py
+
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+import asyncio
+
+import discord
+
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+
+
+class MessageIndex:
+    """Bounded per-guild index of recent (channel_id, message_id) pairs per author.
+
+    Each author keeps at most `per_author` messages, and each guild at most
+    `max_authors` authors; the least recently active author is dropped first.
+    """
+
+    def __init__(self, per_author=50, max_authors=2000, concurrency=3):
+        self.per_author = per_author
+        self.max_authors = max_authors
+        self.guilds = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    def add(self, guild_id, channel_id, author_id, message_id):
+        authors = self.guilds.get(guild_id)
+        if authors is None:
+            authors = self.guilds[guild_id] = OrderedDict()
+        messages = authors.get(author_id)
+        if messages is None:
+            messages = authors[author_id] = deque(maxlen=self.per_author)
+            if len(authors) > self.max_authors:
+                authors.popitem(last=False)
+        else:
+            authors.move_to_end(author_id)
+        messages.append((channel_id, message_id))
+
+    def discard(self, guild_id, author_id, message_id):
+        messages = self.guilds.get(guild_id, {}).get(author_id)
+        if messages:
+            for entry in messages:
+                if entry[1] == message_id:
+                    messages.remove(entry)
+                    break
+
+    def pop_author(self, guild_id, author_id):
+        messages = self.guilds.get(guild_id, {}).pop(author_id, None) or ()
+        by_channel = {}
+        for channel_id, message_id in messages:
+            by_channel.setdefault(channel_id, []).append(message_id)
+        return by_channel
+
+    async def purge_author(self, guild, author_id):
+        """Bulk-delete an author's indexed messages in every channel.
+
+        Returns the number actually deleted, or None if nothing was indexed for
+        the author. If a chunk fails because some of its messages are already
+        gone, that chunk is retried one message at a time.
+        """
+        by_channel = self.pop_author(guild.id, author_id)
+        if not by_channel:
+            return None
+        oldest_allowed = discord.utils.time_snowflake(datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE)
+
+        async def purge_channel(channel_id, message_ids):
+            channel = guild.get_channel_or_thread(channel_id)
+            message_ids = [message_id for message_id in message_ids if message_id > oldest_allowed]
+            if channel is None or not message_ids:
+                return 0
+            deleted = 0
+            async with self.semaphore:
+                for start in range(0, len(message_ids), BULK_DELETE_LIMIT):
+                    chunk = [channel.get_partial_message(message_id) for message_id in message_ids[start:start + BULK_DELETE_LIMIT]]
+                    try:
+                        await channel.delete_messages(chunk)
+                        deleted += len(chunk)
+                    except discord.NotFound:
+                        deleted += await delete_each(chunk)
+                    except discord.HTTPException as e:
+                        print(f"Failed to delete messages in channel {channel_id}: {e}")
+            return deleted
+
+        async def delete_each(messages):
+            deleted = 0
+            for message in messages:
+                try:
+                    await message.delete()
+                    deleted += 1
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    print(f"Failed to delete message {message.id}: {e}")
+            return deleted
+
+        results = await asyncio.gather(*(purge_channel(channel_id, ids) for channel_id, ids in by_channel.items()))
+        return sum(results)
@@ -0,0 +1,147 @@
+# modules/metrics.py
+
+import discord
+from discord.ext import commands
+from modules.metrics_registry import metrics
+from collections import OrderedDict
+import traceback
+import asyncio
+import math
+import time
+import os
+
+# Each cluster process serves on its own port: METRICS_PORT + cluster id
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108)) + int(os.environ.get("BOT_CLUSTER_ID", 0))
+LAG_INTERVAL = 0.5
+MAX_PENDING_COMMANDS = 10_000
+
+event_seconds = metrics.histogram('discord_event_handler_seconds', 'Time spent in each event handler', labels=('event',))
+command_seconds = metrics.histogram('app_command_seconds', 'Slash command latency from interaction to completion', labels=('command', 'status'))
+rest_seconds = metrics.histogram('discord_rest_request_seconds', 'Discord REST request latency by route', labels=('method', 'route'))
+rest_errors = metrics.counter('discord_rest_errors_total', 'Discord REST requests that failed, by route and status', labels=('method', 'route', 'status'))
+loop_lag_seconds = metrics.histogram('event_loop_lag_seconds', 'How late the event loop woke a sleeping task',
+                                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+class Metrics(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.server = None
+        self.lag_task = None
+        self.last_lag = 0.0
+        self.pending_commands = OrderedDict()
+        self.original_run_event = None
+        self.original_request = None
+        self.original_on_error = None
+
+    async def start(self):
+        self.instrument()
+        metrics.gauge('event_loop_lag_last_seconds', 'Most recent event loop lag measurement', lambda: self.last_lag)
+        metrics.gauge('discord_gateway_latency_seconds', 'Heartbeat latency to the Discord gateway', lambda: 0.0 if math.isnan(self.bot.latency) else self.bot.latency)
+        metrics.gauge('discord_guilds', 'Guilds visible to this process', lambda: len(self.bot.guilds))
+        self.lag_task = asyncio.create_task(self.measure_loop_lag())
+        try:
+            self.server = await asyncio.start_server(self.handle_scrape, METRICS_HOST, METRICS_PORT)
+            print(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"Failed to start metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
+
+    def instrument(self):
+        bot = self.bot
+        self.original_run_event = bot._run_event
+        self.original_request = bot.http.request
+        self.original_on_error = bot.tree.on_error
+        original_run_event, original_request, original_on_error = self.original_run_event, self.original_request, self.original_on_error
+
+        async def run_event(coro, event_name, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                await original_run_event(coro, event_name, *args, **kwargs)
+            finally:
+                event_seconds.observe(time.perf_counter() - start, event=event_name)
+
+        async def request(route, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original_request(route, **kwargs)
+            except discord.HTTPException as e:
+                rest_errors.inc(method=route.method, route=route.path, status=e.status)
+                raise
+            finally:
+                rest_seconds.observe(time.perf_counter() - start, method=route.method, route=route.path)
+
+        async def on_error(interaction, error):
+            self.finish_command(interaction, interaction.command, "error")
+            await original_on_error(interaction, error)
+
+        bot._run_event = run_event
+        bot.http.request = request
+        bot.tree.on_error = on_error
+
+    def restore(self):
+        if self.original_run_event is not None:
+            self.bot._run_event = self.original_run_event
+            self.bot.http.request = self.original_request
+            self.bot.tree.on_error = self.original_on_error
+            self.original_run_event = None
+
+    def finish_command(self, interaction, command, status):
+        start = self.pending_commands.pop(interaction.id, None)
+        if start is not None:
+            name = command.qualified_name if command is not None else "unknown"
+            command_seconds.observe(time.perf_counter() - start, command=name, status=status)
+
+    async def measure_loop_lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.last_lag = max(time.perf_counter() - start - LAG_INTERVAL, 0.0)
+            loop_lag_seconds.observe(self.last_lag)
+
+    async def handle_scrape(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", metrics.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not Found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Failed to serve metrics: {e}")
+            traceback.print_exc()
+        finally:
+            writer.close()
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction):
+        if interaction.type == discord.InteractionType.application_command:
+            self.pending_commands[interaction.id] = time.perf_counter()
+            if len(self.pending_commands) > MAX_PENDING_COMMANDS:
+                self.pending_commands.popitem(last=False)
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction, command):
+        self.finish_command(interaction, command, "ok")
+
+    async def cog_unload(self):
+        self.restore()
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def setup(bot, restart_fn):
+    cog = Metrics(bot)
+    await bot.add_cog(cog)
+    await cog.start()
+
+__version__ = "1.0.0"
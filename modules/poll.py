@@ -1,31 +1,359 @@
+# modules/poll.py
+
 import discord
 from discord.ext import commands
 from discord import app_commands
+from modules.database import add_column, add_index, SessionLocal, engine
+from modules.sharding import owns_guild
+from sqlalchemy import Integer, BigInteger, Boolean, Text, text
+import traceback
+import asyncio
+import json
+import time
+
+MAX_OPTIONS = 10
+FLUSH_INTERVAL = 5
+EDIT_INTERVAL = 5
+BAR_WIDTH = 20
+
+async def setup_poll_columns():
+    await add_column('poll', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('poll', 'guild_id', BigInteger, default=0, nullable=False)
+    await add_column('poll', 'channel_id', BigInteger, default=0, nullable=False)
+    await add_column('poll', 'message_id', BigInteger, nullable=True)
+    await add_column('poll', 'created_by', BigInteger, nullable=True)
+    await add_column('poll', 'question', Text, default='', nullable=False)
+    await add_column('poll', 'options', Text, default='[]', nullable=False)
+    await add_column('poll', 'closed', Boolean, default=False, nullable=False, final_column=True)
+
+async def setup_poll_vote_columns():
+    await add_column('pollvote', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('pollvote', 'poll_id', Integer, default=0, nullable=False)
+    await add_column('pollvote', 'user_id', BigInteger, default=0, nullable=False)
+    await add_column('pollvote', 'option', Integer, default=0, nullable=False, final_column=True)
+    # One vote per user and poll; write_votes upserts on it
+    add_index('pollvote', 'ux_pollvote_poll_user', 'poll_id', 'user_id', unique=True)
+
+async def setup_poll_tables():
+    await setup_poll_columns()
+    await setup_poll_vote_columns()
+    global PollRecord, Pollvote
+    # The table's model is named Poll, like the cog
+    from modules.dynamic_models import Poll as PollRecord, Pollvote
+
+
+class PollState:
+    """Live tallies of one open poll; votes not yet written to the database are kept in `pending`."""
+
+    __slots__ = ('poll_id', 'guild_id', 'channel_id', 'message_id', 'created_by', 'question', 'options',
+                 'votes', 'counts', 'pending', 'last_edit', 'edit_task', 'closed')
+
+    def __init__(self, poll_id, guild_id, channel_id, message_id, created_by, question, options, votes=None):
+        self.poll_id = poll_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.created_by = created_by
+        self.question = question
+        self.options = options
+        self.votes = votes or {}
+        self.counts = [0] * len(options)
+        for option in self.votes.values():
+            self.counts[option] += 1
+        self.pending = {}
+        self.last_edit = 0.0
+        self.edit_task = None
+        self.closed = False
+
+    def vote(self, user_id, option):
+        """Record a vote and return the user's choice afterwards; voting for the same option again retracts it."""
+        previous = self.votes.get(user_id)
+        if previous is not None:
+            self.counts[previous] -= 1
+        if previous == option:
+            del self.votes[user_id]
+            self.pending[user_id] = None
+            return None
+        self.votes[user_id] = option
+        self.counts[option] += 1
+        self.pending[user_id] = option
+        return option
+
+    def embed(self, final=False):
+        total = sum(self.counts)
+        lines = []
+        for index, (option, count) in enumerate(zip(self.options, self.counts)):
+            share = count / total if total else 0
+            bar = "█" * round(share * BAR_WIDTH) + "░" * (BAR_WIDTH - round(share * BAR_WIDTH))
+            lines.append(f"**{index + 1}. {option}**\n`{bar}` {count} ({share:.0%})")
+        title = f"📊 {self.question}" if not final else f"📊 Results: {self.question}"
+        embed = discord.Embed(title=title, description="\n".join(lines), color=discord.Color.blue() if not final else discord.Color.green())
+        embed.set_footer(text=f"{total} votes" + (" · poll closed" if final else " · click again to remove your vote"))
+        return embed
+
+
+class PollView(discord.ui.View):
+    """Persistent buttons for a poll; the custom ids survive restarts, so the view is re-registered on startup."""
+
+    def __init__(self, engine, state):
+        super().__init__(timeout=None)
+        for index, option in enumerate(state.options):
+            button = discord.ui.Button(label=option[:80], style=discord.ButtonStyle.secondary,
+                                       custom_id=f"poll:{state.poll_id}:{index}", row=index // 5)
+            button.callback = self.make_callback(engine, state.poll_id, index)
+            self.add_item(button)
+
+    @staticmethod
+    def make_callback(engine, poll_id, index):
+        async def callback(interaction: discord.Interaction):
+            state = engine.polls.get(poll_id)
+            if state is None or state.closed:
+                await interaction.response.send_message("This poll is closed.", ephemeral=True)
+                return
+            choice = state.vote(interaction.user.id, index)
+            engine.schedule_edit(state)
+            message = "Your vote was removed." if choice is None else f"You voted for **{state.options[choice]}**."
+            await interaction.response.send_message(message, ephemeral=True)
+        return callback
+
+
+class PollEngine:
+    """Keeps open polls in memory, writes votes in batches and rate-limits result edits per poll."""
+
+    def __init__(self, bot, flush_interval=FLUSH_INTERVAL, edit_interval=EDIT_INTERVAL):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.edit_interval = edit_interval
+        self.polls = {}
+        self.flush_task = None
+
+    def start(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.run_flusher())
+
+    async def stop(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        for state in self.polls.values():
+            if state.edit_task is not None:
+                state.edit_task.cancel()
+                state.edit_task = None
+        await self.flush()
+
+    def create_poll(self, guild_id, channel_id, created_by, question, options):
+        session = SessionLocal()
+        try:
+            poll = PollRecord(guild_id=guild_id, channel_id=channel_id, created_by=created_by, question=question,
+                              options=json.dumps(options), closed=False)
+            session.add(poll)
+            session.commit()
+            state = PollState(poll.id, guild_id, channel_id, None, created_by, question, options)
+        finally:
+            session.close()
+        self.polls[state.poll_id] = state
+        return state
+
+    def set_message(self, state, message_id):
+        state.message_id = message_id
+        session = SessionLocal()
+        try:
+            session.query(PollRecord).filter_by(id=state.poll_id).update({'message_id': message_id})
+            session.commit()
+        finally:
+            session.close()
+
+    def load_open_polls(self):
+        session = SessionLocal()
+        try:
+            polls = session.query(PollRecord).filter_by(closed=False).all()
+            votes = {}
+            if polls:
+                rows = session.query(Pollvote.poll_id, Pollvote.user_id, Pollvote.option).filter(
+                    Pollvote.poll_id.in_([poll.id for poll in polls])).all()
+                for poll_id, user_id, option in rows:
+                    votes.setdefault(poll_id, {})[user_id] = option
+            return [PollState(poll.id, poll.guild_id, poll.channel_id, poll.message_id, poll.created_by, poll.question,
+                              json.loads(poll.options), votes.get(poll.id)) for poll in polls]
+        finally:
+            session.close()
+
+    async def restore(self):
+        for state in await asyncio.to_thread(self.load_open_polls):
+            # Another cluster flushes and edits the polls of guilds it owns
+            if not owns_guild(self.bot, state.guild_id):
+                continue
+            self.polls[state.poll_id] = state
+            if state.message_id:
+                self.bot.add_view(PollView(self, state), message_id=state.message_id)
+        print(f"Restored {len(self.polls)} open polls")
+
+    def find_by_message(self, message_id):
+        return next((state for state in self.polls.values() if state.message_id == message_id), None)
+
+    def load_poll_by_message(self, message_id):
+        session = SessionLocal()
+        try:
+            poll = session.query(PollRecord).filter_by(message_id=message_id).first()
+            if poll is None:
+                return None
+            votes = {user_id: option for user_id, option in session.query(Pollvote.user_id, Pollvote.option).filter_by(poll_id=poll.id).all()}
+            state = PollState(poll.id, poll.guild_id, poll.channel_id, poll.message_id, poll.created_by, poll.question,
+                              json.loads(poll.options), votes)
+            state.closed = poll.closed
+            return state
+        finally:
+            session.close()
+
+    def write_votes(self, batch):
+        upserts = [{'poll_id': poll_id, 'user_id': user_id, 'option': option}
+                   for poll_id, user_id, option in batch if option is not None]
+        deletes = [{'poll_id': poll_id, 'user_id': user_id} for poll_id, user_id, option in batch if option is None]
+        with engine.begin() as conn:
+            if upserts:
+                conn.execute(text('''
+                    INSERT INTO pollvote (poll_id, user_id, option) VALUES (:poll_id, :user_id, :option)
+                    ON CONFLICT (poll_id, user_id) DO UPDATE SET option = excluded.option
+                '''), upserts)
+            if deletes:
+                conn.execute(text('DELETE FROM pollvote WHERE poll_id = :poll_id AND user_id = :user_id'), deletes)
+
+    async def flush(self):
+        batch = []
+        for state in self.polls.values():
+            if state.pending:
+                batch.extend((state.poll_id, user_id, option) for user_id, option in state.pending.items())
+                state.pending = {}
+        if not batch:
+            return 0
+        try:
+            await asyncio.to_thread(self.write_votes, batch)
+        except Exception as e:
+            print(f"Failed to write {len(batch)} poll votes: {e}")
+            traceback.print_exc()
+            # Put the votes back unless a newer vote of the same user is already pending
+            for poll_id, user_id, option in batch:
+                state = self.polls.get(poll_id)
+                if state is not None:
+                    state.pending.setdefault(user_id, option)
+            return 0
+        return len(batch)
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def schedule_edit(self, state):
+        if state.edit_task is None and state.message_id:
+            state.edit_task = asyncio.create_task(self.edit_results(state))
+
+    async def edit_results(self, state):
+        # Votes arriving while this task waits are folded into the same edit
+        try:
+            delay = state.last_edit + self.edit_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        # From here on a new vote schedules the next edit instead of being folded into this one
+        state.last_edit = time.monotonic()
+        state.edit_task = None
+        channel = self.bot.get_channel(state.channel_id)
+        if channel is None or state.closed:
+            return
+        try:
+            await channel.get_partial_message(state.message_id).edit(embed=state.embed())
+        except discord.NotFound:
+            pass
+        except Exception as e:
+            print(f"Failed to update poll #{state.poll_id}: {e}")
+
+    async def close_poll(self, state):
+        state.closed = True
+        if state.edit_task is not None:
+            state.edit_task.cancel()
+            state.edit_task = None
+        await self.flush()
+        session = SessionLocal()
+        try:
+            session.query(PollRecord).filter_by(id=state.poll_id).update({'closed': True})
+            session.commit()
+        finally:
+            session.close()
+        self.polls.pop(state.poll_id, None)
+
 
 class Poll(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.engine = PollEngine(bot)
+
+    async def cog_unload(self):
+        await self.engine.stop()
 
     @app_commands.command(name="createpoll", description="Create a poll")
-    @app_commands.describe(question="The poll question")
-    async def create_poll(self, interaction: discord.Interaction, question: str):
-        poll_message = await interaction.response.send_message(f"Poll created: {question}\nReact with 👍 or 👎", ephemeral=False)
-        poll_message = await interaction.original_response()
-        await poll_message.add_reaction('👍')
-        await poll_message.add_reaction('👎')
+    @app_commands.describe(question="The poll question", options=f"Up to {MAX_OPTIONS} options separated by | (default: Yes | No)")
+    async def create_poll(self, interaction: discord.Interaction, question: str, options: str = "Yes | No"):
+        if interaction.guild is None:
+            await interaction.response.send_message("Polls only exist in servers.", ephemeral=True)
+            return
+        choices = [option.strip() for option in options.split("|") if option.strip()]
+        if not 2 <= len(choices) <= MAX_OPTIONS:
+            await interaction.response.send_message(f"A poll needs between 2 and {MAX_OPTIONS} options.", ephemeral=True)
+            return
+
+        try:
+            state = self.engine.create_poll(interaction.guild.id, interaction.channel.id, interaction.user.id, question, choices)
+            await interaction.response.send_message(embed=state.embed(), view=PollView(self.engine, state))
+            poll_message = await interaction.original_response()
+            self.engine.set_message(state, poll_message.id)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            traceback.print_exc()
+            if not interaction.response.is_done():
+                await interaction.response.send_message(f"Failed to create poll: {e}", ephemeral=True)
 
     @app_commands.command(name="endpoll", description="End a poll")
     @app_commands.describe(message_id="The ID of the poll message")
-    async def end_poll(self, interaction: discord.Interaction, message_id: int):
-        poll_message = await interaction.channel.fetch_message(message_id)
-        if not poll_message:
+    async def end_poll(self, interaction: discord.Interaction, message_id: str):
+        if interaction.guild is None:
+            await interaction.response.send_message("Polls only exist in servers.", ephemeral=True)
+            return
+        if not message_id.isdigit():
+            await interaction.response.send_message("Poll message not found!", ephemeral=True)
+            return
+        state = self.engine.find_by_message(int(message_id))
+        if state is None:
+            state = await asyncio.to_thread(self.engine.load_poll_by_message, int(message_id))
+        if state is None or state.guild_id != interaction.guild.id:
             await interaction.response.send_message("Poll message not found!", ephemeral=True)
             return
+        # Closing is permanent, so only the poll's creator or a moderator may do it
+        if interaction.user.id != state.created_by and not interaction.user.guild_permissions.manage_messages:
+            embed = discord.Embed(title="Permission Denied", description="Only the poll's creator or members with Manage Messages can end it.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        if not state.closed:
+            await self.engine.close_poll(state)
+        await interaction.response.send_message(embed=state.embed(final=True))
 
-        thumbs_up = discord.utils.get(poll_message.reactions, emoji='👍')
-        thumbs_down = discord.utils.get(poll_message.reactions, emoji='👎')
+        # The results come from the database, so a deleted poll message doesn't lose them
+        channel = self.bot.get_channel(state.channel_id)
+        if channel is not None:
+            try:
+                await channel.get_partial_message(state.message_id).edit(embed=state.embed(final=True), view=None)
+            except discord.HTTPException:
+                pass
 
-        await interaction.response.send_message(f"Poll results:\n👍: {thumbs_up.count - 1}\n👎: {thumbs_down.count - 1}", ephemeral=False)
+async def setup(bot, restart_fn):
+    await setup_poll_tables()
+    cog = Poll(bot)
+    await bot.add_cog(cog)
+    await cog.engine.restore()
+    cog.engine.start()
 
-async def setup(bot):
-    await bot.add_cog(Poll(bot))
+__intents__ = ["guilds"]
+__dependencies__ = ["database"]
+__version__ = "2.0.0"
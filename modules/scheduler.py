@@ -0,0 +1,86 @@
+# modules/scheduler.py
+
+from datetime import datetime
+import asyncio
+import heapq
+import itertools
+import traceback
+
+MAX_SLEEP = 3600
+
+
+class TimerScheduler:
+    """Runs callbacks at UTC deadlines from a single heap and a single sleeping task.
+
+    Scheduling the same key again replaces the earlier timer; cancelled and
+    replaced entries are skipped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        # The loop only keeps weak references to tasks, so running callbacks are held here until they finish
+        self.fire_tasks = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in self.fire_tasks:
+            task.cancel()
+        self.fire_tasks.clear()
+
+    def schedule(self, key, when, callback, *args):
+        seq = next(self.counter)
+        self.entries[key] = seq
+        heapq.heappush(self.heap, (when, seq, key, callback, args))
+        if self.heap[0][1] == seq:
+            self.wakeup.set()
+
+    def cancel(self, key):
+        return self.entries.pop(key, None) is not None
+
+    def drop_stale(self):
+        while self.heap and self.entries.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+    async def run(self):
+        while True:
+            self.drop_stale()
+            if not self.heap:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            delay = (self.heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                # Re-check at least hourly so wall clock adjustments are picked up
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, key, callback, args = heapq.heappop(self.heap)
+            del self.entries[key]
+            task = asyncio.create_task(self.fire(key, callback, args))
+            self.fire_tasks.add(task)
+            task.add_done_callback(self.fire_tasks.discard)
+
+    async def fire(self, key, callback, args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            print(f"Scheduled task {key} failed: {e}")
+            traceback.print_exc()
@@ -0,0 +1,20 @@
+# modules/sharding.py
+
+
+def shard_for_guild(guild_id, shard_count):
+    # Discord routes a guild to shard (guild_id >> 22) % shard_count
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(bot, guild_id):
+    """Return True if this process's shards receive the guild's events.
+
+    In cluster mode every worker shares one database, so state loaded from it
+    at startup (timers, jobs, polls) must be filtered to the worker's own guilds.
+    A bot without explicit shard ids runs every shard and owns every guild.
+    """
+    shard_ids = getattr(bot, 'shard_ids', None)
+    shard_count = getattr(bot, 'shard_count', None)
+    if not shard_ids or not shard_count:
+        return True
+    return shard_for_guild(guild_id, shard_count) in shard_ids
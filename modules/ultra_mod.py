@@ -3,12 +3,82 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from modules.database import get_or_create, update_instance, add_column, SessionLocal
+from modules.database import get_or_create, add_column, add_index, SessionLocal
 from modules.dynamic_models import User, ServerUser
-from sqlalchemy import Column, Integer, Boolean, String
+from modules.audit_log import AuditLog
+from modules.message_index import MessageIndex
+from modules.scheduler import TimerScheduler
+from modules.member_cache import chunker
+from modules.sharding import owns_guild
+from sqlalchemy import Column, Integer, Boolean, String, Text, BigInteger, DateTime, cast, func
+from sqlalchemy.orm import aliased
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import asyncio
+import re
+
+audit_log = AuditLog()
+message_index = MessageIndex()
+
+MODERATION_ROLES = {
+    "Muted": {'send_messages': False, 'speak': False},
+    "Locked Out": {'send_messages': False, 'speak': False, 'connect': False},
+}
+OVERWRITE_CONCURRENCY = 5
+
+
+class RoleOverwriteSync:
+    """Keeps moderation role overwrites in place, touching only channels that are missing them."""
+
+    def __init__(self, concurrency=OVERWRITE_CONCURRENCY):
+        self.roles = {}
+        self.synced = set()
+        self.locks = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    @staticmethod
+    def is_current(channel, role, permissions):
+        overwrite = channel.overwrites_for(role)
+        return all(getattr(overwrite, name) == value for name, value in permissions.items())
+
+    async def ensure_role(self, guild, role_name, permissions):
+        role = guild.get_role(self.roles.get((guild.id, role_name), 0))
+        if role is None:
+            role = discord.utils.get(guild.roles, name=role_name)
+            if role is None:
+                role = await guild.create_role(name=role_name)
+            self.roles[(guild.id, role_name)] = role.id
+
+        key = (guild.id, role.id)
+        if key not in self.synced:
+            lock = self.locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                if key not in self.synced and await self.apply(guild.channels, role, permissions):
+                    self.synced.add(key)
+        return role
+
+    async def apply(self, channels, role, permissions):
+        stale = [channel for channel in channels if not self.is_current(channel, role, permissions)]
+        if not stale:
+            return True
+
+        async def update(channel):
+            async with self.semaphore:
+                overwrite = channel.overwrites_for(role)
+                overwrite.update(**permissions)
+                await channel.set_permissions(role, overwrite=overwrite)
+
+        results = await asyncio.gather(*(update(channel) for channel in stale), return_exceptions=True)
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed:
+            print(f"Failed to update {len(failed)}/{len(stale)} channel overwrites for role {role.name}: {failed[0]}")
+        return not failed
+
+    def invalidate(self, guild_id, role_id=None):
+        self.synced = {key for key in self.synced if key[0] != guild_id or (role_id is not None and key[1] != role_id)}
+
+
+overwrite_sync = RoleOverwriteSync()
 
 async def setup_server_user_columns():
     await add_column('serveruser', 'warnings', Integer, default=0, nullable=False)
@@ -18,92 +88,485 @@ async def setup_server_user_columns():
     await add_column('serveruser', 'locked_out', Boolean, default=False, nullable=False)
     await add_column('serveruser', 'notes', String, default='', nullable=True, final_column=True)
 
+async def setup_note_columns():
+    await add_column('servernote', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('servernote', 'server_id', BigInteger, default=0, nullable=False)
+    await add_column('servernote', 'user_id', String, default='', nullable=False)
+    await add_column('servernote', 'author_id', String, nullable=True)
+    await add_column('servernote', 'created_at', DateTime, nullable=True)
+    await add_column('servernote', 'content', Text, nullable=True, final_column=True)
+    add_index('servernote', 'ix_servernote_server_user', 'server_id', 'user_id', 'id')
+
+async def setup_mass_action_columns():
+    await add_column('massactionjob', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('massactionjob', 'guild_id', BigInteger, default=0, nullable=False)
+    await add_column('massactionjob', 'channel_id', BigInteger, nullable=True)
+    await add_column('massactionjob', 'moderator_id', String, nullable=True)
+    await add_column('massactionjob', 'action', String, default='', nullable=False)
+    await add_column('massactionjob', 'targets', Text, default='', nullable=False)
+    await add_column('massactionjob', 'cursor', Integer, default=0, nullable=False)
+    await add_column('massactionjob', 'status', String, default='pending', nullable=False)
+    await add_column('massactionjob', 'created_at', DateTime, nullable=True, final_column=True)
+
+async def setup_timed_punishment_columns():
+    await add_column('timedpunishment', 'id', Integer, nullable=False, primary_key=True)
+    await add_column('timedpunishment', 'guild_id', BigInteger, default=0, nullable=False)
+    await add_column('timedpunishment', 'user_id', String, default='', nullable=False)
+    await add_column('timedpunishment', 'action', String, default='', nullable=False)
+    await add_column('timedpunishment', 'expires_at', DateTime, nullable=True)
+    await add_column('timedpunishment', 'active', Boolean, default=True, nullable=False, final_column=True)
+    add_index('timedpunishment', 'ix_timedpunishment_active', 'active', 'expires_at')
+
+# Each model is imported once its table exists
+async def setup_server_note():
+    await setup_note_columns()
+    global Servernote
+    from modules.dynamic_models import Servernote
+    migrate_legacy_notes()
+
+async def setup_mass_action_jobs():
+    await setup_mass_action_columns()
+    global Massactionjob
+    from modules.dynamic_models import Massactionjob
+
+async def setup_timed_punishments():
+    await setup_timed_punishment_columns()
+    global Timedpunishment
+    from modules.dynamic_models import Timedpunishment
+
+def migrate_legacy_notes():
+    # Notes used to be appended to ServerUser.notes as newline separated text
+    session = SessionLocal()
+    try:
+        rows = session.query(ServerUser).filter(ServerUser.notes != None, ServerUser.notes != '').all()
+        if not rows:
+            return
+        now = datetime.utcnow()
+        for server_user in rows:
+            for line in server_user.notes.split("\n"):
+                if line.strip():
+                    session.add(Servernote(server_id=server_user.server_id, user_id=str(server_user.user_id), author_id=None, created_at=now, content=line))
+            server_user.notes = ''
+        session.commit()
+        print(f"Migrated notes of {len(rows)} server users to the servernote table")
+    except Exception as e:
+        session.rollback()
+        print(f"Failed to migrate notes: {e}")
+        traceback.print_exc()
+    finally:
+        session.close()
+
+MASS_ACTION_FLAGS = {'ban': {'banned': True}, 'kick': {}, 'mute': {'muted': True}}
+MASS_ACTION_VERBS = {'ban': "Banned", 'kick': "Kicked", 'mute': "Muted"}
+MASS_ACTION_LIMIT = 5000
+
+
+class MassActionRunner:
+    """Runs mass moderation jobs in batches, persisting progress so jobs resume after a restart.
+
+    Requests within a batch share a small concurrency limit and batches are spaced
+    out, leaving discord.py's per-route rate limiter room instead of tripping 429s.
+    """
+
+    def __init__(self, batch_size=25, concurrency=5, batch_pause=1.0):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.batch_pause = batch_pause
+        self.bot = None
+        self.tasks = {}
+        self.resume_task = None
+
+    def create_job(self, guild_id, channel_id, moderator_id, action, targets):
+        session = SessionLocal()
+        try:
+            job = Massactionjob(guild_id=guild_id, channel_id=channel_id, moderator_id=str(moderator_id), action=action,
+                                targets=",".join(str(target) for target in targets), cursor=0, status='pending',
+                                created_at=datetime.utcnow())
+            session.add(job)
+            session.commit()
+            return job.id
+        finally:
+            session.close()
+
+    def start(self, job_id):
+        if job_id not in self.tasks:
+            self.tasks[job_id] = asyncio.create_task(self.run_job(job_id))
+
+    def resume(self):
+        self.resume_task = asyncio.create_task(self.resume_jobs())
+
+    async def stop(self):
+        # Cancelled jobs keep their saved cursor and status, so the next load resumes them
+        tasks = list(self.tasks.values())
+        if self.resume_task is not None:
+            tasks.append(self.resume_task)
+            self.resume_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def load_unfinished_jobs(self):
+        session = SessionLocal()
+        try:
+            return session.query(Massactionjob.id, Massactionjob.guild_id).filter(Massactionjob.status.in_(('pending', 'running'))).all()
+        finally:
+            session.close()
+
+    async def resume_jobs(self):
+        for job_id, guild_id in self.load_unfinished_jobs():
+            # Other clusters resume the jobs of their own guilds
+            if not owns_guild(self.bot, guild_id):
+                continue
+            print(f"Resuming mass action job #{job_id}")
+            self.start(job_id)
+
+    def load_job(self, job_id):
+        session = SessionLocal()
+        try:
+            job = session.query(Massactionjob).filter_by(id=job_id).first()
+            if job is None:
+                return None
+            return {column: getattr(job, column) for column in ('guild_id', 'channel_id', 'moderator_id', 'action', 'targets', 'cursor')}
+        finally:
+            session.close()
+
+    def save_progress(self, job_id, guild_id, action, done_ids, cursor, status):
+        session = SessionLocal()
+        try:
+            if done_ids and MASS_ACTION_FLAGS[action]:
+                session.query(ServerUser).filter(
+                    ServerUser.server_id == guild_id, ServerUser.user_id.in_([str(user_id) for user_id in done_ids])
+                ).update(MASS_ACTION_FLAGS[action], synchronize_session=False)
+            session.query(Massactionjob).filter_by(id=job_id).update({'cursor': cursor, 'status': status})
+            session.commit()
+        finally:
+            session.close()
+
+    async def run_job(self, job_id):
+        try:
+            job = self.load_job(job_id)
+            guild = self.bot.get_guild(job['guild_id']) if job else None
+            if guild is None:
+                print(f"Mass action job #{job_id} cannot run: guild not available")
+                return
+            action = job['action']
+            targets = [int(target) for target in job['targets'].split(",") if target]
+            cursor = job['cursor']
+            moderator_id = int(job['moderator_id']) if job['moderator_id'] else None
+            channel = guild.get_channel(job['channel_id']) if job['channel_id'] else None
+            progress = await channel.send(f"⏳ Mass {action} job #{job_id}: {cursor}/{len(targets)}") if channel else None
+            failed = 0
+
+            while cursor < len(targets):
+                batch = targets[cursor:cursor + self.batch_size]
+                done_ids = await self.apply_batch(guild, action, batch)
+                failed += len(batch) - len(done_ids)
+                cursor += len(batch)
+                status = 'done' if cursor >= len(targets) else 'running'
+                self.save_progress(job_id, guild.id, action, done_ids, cursor, status)
+                for user_id in done_ids:
+                    audit_log.log(guild.id, user_id, f"{MASS_ACTION_VERBS[action]} User (mass job #{job_id})", moderator_id=moderator_id)
+                if progress:
+                    await progress.edit(content=f"⏳ Mass {action} job #{job_id}: {cursor}/{len(targets)} ({failed} failed)")
+                if status == 'running':
+                    await asyncio.sleep(self.batch_pause)
+
+            if progress:
+                await progress.edit(content=f"✅ Mass {action} job #{job_id} finished: {len(targets) - failed}/{len(targets)} ({failed} failed)")
+        except Exception as e:
+            print(f"Mass action job #{job_id} failed: {e}")
+            traceback.print_exc()
+        finally:
+            self.tasks.pop(job_id, None)
+
+    async def apply_batch(self, guild, action, batch):
+        if action == 'ban' and hasattr(guild, 'bulk_ban'):
+            try:
+                result = await guild.bulk_ban([discord.Object(id=user_id) for user_id in batch])
+                return [user.id for user in result.banned]
+            except discord.HTTPException as e:
+                print(f"Bulk ban failed, falling back to single bans: {e}")
+
+        role = None
+        if action == 'mute':
+            role = await overwrite_sync.ensure_role(guild, "Muted", MODERATION_ROLES["Muted"])
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def apply(user_id):
+            async with semaphore:
+                try:
+                    if action == 'ban':
+                        await guild.ban(discord.Object(id=user_id))
+                    elif action == 'kick':
+                        await guild.kick(discord.Object(id=user_id))
+                    else:
+                        await self.bot.http.add_role(guild.id, user_id, role.id)
+                    return user_id
+                except discord.HTTPException as e:
+                    print(f"Mass {action} failed for user {user_id} in guild {guild.id}: {e}")
+                    return None
+
+        results = await asyncio.gather(*(apply(user_id) for user_id in batch))
+        return [user_id for user_id in results if user_id is not None]
+
+
+mass_actions = MassActionRunner()
+
+
+TIMED_PUNISHMENTS = {
+    'mute': ("Muted", {'muted': False}),
+    'lockout': ("Locked Out", {'locked_out': False}),
+    'ban': (None, {'banned': False}),
+}
+
+
+class TimedPunishments:
+    """Timed mutes, lockouts and bans stored in the timedpunishment table and expired by a TimerScheduler."""
+
+    def __init__(self):
+        self.bot = None
+        self.scheduler = TimerScheduler()
+
+    def load_active(self):
+        session = SessionLocal()
+        try:
+            return session.query(Timedpunishment.id, Timedpunishment.guild_id, Timedpunishment.user_id,
+                                 Timedpunishment.action, Timedpunishment.expires_at).filter_by(active=True).all()
+        finally:
+            session.close()
+
+    def start(self, bot):
+        self.bot = bot
+        self.scheduler.start()
+        # Only this process's guilds, so each punishment is lifted once however many clusters run
+        rows = [row for row in self.load_active() if owns_guild(bot, row[1])]
+        for punishment_id, guild_id, user_id, action, expires_at in rows:
+            self.scheduler.schedule((guild_id, int(user_id), action), expires_at, self.expire, punishment_id, guild_id, int(user_id), action)
+        print(f"Loaded {len(rows)} pending timed punishments")
+
+    def add(self, guild_id, user_id, action, expires_at):
+        session = SessionLocal()
+        try:
+            session.query(Timedpunishment).filter_by(guild_id=guild_id, user_id=str(user_id), action=action, active=True).update({'active': False})
+            punishment = Timedpunishment(guild_id=guild_id, user_id=str(user_id), action=action, expires_at=expires_at, active=True)
+            session.add(punishment)
+            session.commit()
+            punishment_id = punishment.id
+        finally:
+            session.close()
+        self.scheduler.schedule((guild_id, user_id, action), expires_at, self.expire, punishment_id, guild_id, user_id, action)
+
+    async def expire(self, punishment_id, guild_id, user_id, action):
+        role_name, flags = TIMED_PUNISHMENTS[action]
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            try:
+                if action == 'ban':
+                    await guild.unban(discord.Object(id=user_id))
+                else:
+                    role = discord.utils.get(guild.roles, name=role_name)
+                    if role is not None:
+                        await self.bot.http.remove_role(guild_id, user_id, role.id)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                print(f"Failed to lift {action} for user {user_id} in guild {guild_id}: {e}")
+
+        session = SessionLocal()
+        try:
+            session.query(Timedpunishment).filter_by(id=punishment_id).update({'active': False})
+            session.query(ServerUser).filter_by(user_id=str(user_id), server_id=guild_id).update(flags)
+            session.commit()
+        finally:
+            session.close()
+        audit_log.log(guild_id, user_id, f"Timed {action} expired")
+
+
+timed_punishments = TimedPunishments()
+
+
+async def resolve_mass_targets(interaction, user_ids, invite_code, joined_within_minutes, account_age_days):
+    guild = interaction.guild
+    if user_ids:
+        targets = {int(user_id) for user_id in re.findall(r"\d{15,20}", user_ids)}
+    elif invite_code or joined_within_minutes:
+        session = SessionLocal()
+        try:
+            query = session.query(ServerUser.user_id).filter(ServerUser.server_id == guild.id, ServerUser.left_guild == False)
+            if invite_code:
+                query = query.filter(ServerUser.invite_code == invite_code)
+            if joined_within_minutes:
+                query = query.filter(ServerUser.join_date >= datetime.utcnow() - timedelta(minutes=joined_within_minutes))
+            targets = {int(user_id) for (user_id,) in query.all()}
+        finally:
+            session.close()
+    elif account_age_days:
+        await chunker.ensure_chunked(guild)
+        targets = {member.id for member in guild.members}
+    else:
+        return None
+
+    if account_age_days:
+        newest_allowed = datetime.now(timezone.utc) - timedelta(days=account_age_days)
+        targets = {user_id for user_id in targets if discord.utils.snowflake_time(user_id) > newest_allowed}
+
+    protected = {interaction.user.id, guild.owner_id, interaction.client.user.id}
+    return sorted(targets - protected)
+
+
+class AdminSnapshot:
+    """Panel state for one member, loaded once and then kept in sync by the panel's own actions."""
+
+    fields = ('warnings', 'automod', 'muted', 'banned', 'locked_out', 'invited_by')
+
+    def __init__(self, server_user, user, inviter_name, note_count, latest_note):
+        for field in self.fields:
+            setattr(self, field, getattr(server_user, field))
+        self.global_join_date = user.global_join_date
+        self.inviter_name = inviter_name or "Unknown"
+        self.note_count = note_count or 0
+        self.latest_note = latest_note
+
+    def update(self, **values):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+
+def load_admin_snapshot(user_id, guild_id):
+    session = SessionLocal()
+    try:
+        Inviter = aliased(User)
+        notes = session.query(Servernote).filter(
+            Servernote.server_id == ServerUser.server_id, Servernote.user_id == ServerUser.user_id
+        ).correlate(ServerUser)
+        note_count = notes.with_entities(func.count(Servernote.id)).scalar_subquery()
+        latest_note = notes.with_entities(Servernote.content).order_by(Servernote.id.desc()).limit(1).scalar_subquery()
+        row = session.query(ServerUser, User, Inviter.username, note_count, latest_note).join(
+            User, User.discord_id == ServerUser.user_id
+        ).outerjoin(
+            Inviter, Inviter.discord_id == cast(ServerUser.invited_by, String)
+        ).filter(
+            ServerUser.user_id == str(user_id), ServerUser.server_id == guild_id
+        ).first()
+        return AdminSnapshot(*row) if row else None
+    finally:
+        session.close()
+
+
+def update_server_user(user_id, guild_id, **values):
+    session = SessionLocal()
+    try:
+        session.query(ServerUser).filter_by(user_id=str(user_id), server_id=guild_id).update(values)
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        print(f"Failed to update ServerUser: {e}")
+        traceback.print_exc()
+        return False
+    finally:
+        session.close()
+
+
 class AdminUserView(discord.ui.View):
     def __init__(self, user: discord.Member, guild: discord.Guild):
         super().__init__(timeout=120)
         self.user = user
         self.guild = guild
         self.embed = None
+        self.snapshot = None
 
     async def setup(self):
         await self.update_embed()
 
+    async def load_snapshot(self):
+        snapshot = load_admin_snapshot(self.user.id, self.guild.id)
+        if snapshot is None:
+            # First visit: create the rows, then load them in one go
+            await self.get_user_data()
+            await self.get_server_user_data()
+            snapshot = load_admin_snapshot(self.user.id, self.guild.id)
+        self.snapshot = snapshot
+
+    def save(self, **values):
+        # Only mirror the change into the snapshot once it is stored, so the panel never shows an unsaved state
+        if not update_server_user(self.user.id, self.guild.id, **values):
+            return False
+        self.snapshot.update(**values)
+        return True
+
     async def get_user_data(self):
         return await get_or_create(User, discord_id=str(self.user.id))
 
     async def get_server_user_data(self):
         return await get_or_create(ServerUser, user_id=str(self.user.id), server_id=str(self.guild.id))
 
-    def log_action(self, action: str):
-        with open("admin_logs.txt", "a") as log_file:
-            log_file.write(f"{datetime.utcnow()} - {action} - User: {self.user.id} ({self.user.display_name}) - Server: {self.guild.id}\n")
+    def log_action(self, action: str, moderator: discord.abc.User = None):
+        audit_log.log(self.guild.id, self.user.id, action, user_name=self.user.display_name, moderator_id=moderator.id if moderator else None)
 
-    async def ensure_role_exists(self, role_name: str, permissions: dict) -> discord.Role:
-        role = discord.utils.get(self.guild.roles, name=role_name)
-        if not role:
-            role = await self.guild.create_role(name=role_name)
-        for channel in self.guild.channels:
-            await channel.set_permissions(role, overwrite=discord.PermissionOverwrite(**permissions))
-        return role
+    async def ensure_role_exists(self, role_name: str) -> discord.Role:
+        return await overwrite_sync.ensure_role(self.guild, role_name, MODERATION_ROLES[role_name])
 
     @discord.ui.button(label="🔨 Ban User", style=discord.ButtonStyle.danger, custom_id="ban_user", row=0)
     async def ban_user(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.guild.ban(self.user)
-        await update_instance(ServerUser, {'user_id': str(self.user.id), 'server_id': str(self.guild.id)}, banned=True)
-        self.log_action("Banned User")
+        self.save(banned=True)
+        self.log_action("Banned User", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
     @discord.ui.button(label="🔇 Mute User", style=discord.ButtonStyle.secondary, custom_id="mute_user", row=0)
     async def mute_user(self, interaction: discord.Interaction, button: discord.ui.Button):
-        mute_role = await self.ensure_role_exists("Muted", {'send_messages': False, 'speak': False})
+        mute_role = await self.ensure_role_exists("Muted")
         await self.user.add_roles(mute_role)
-        await update_instance(ServerUser, {'user_id': str(self.user.id), 'server_id': str(self.guild.id)}, muted=True)
-        self.log_action("Muted User")
+        self.save(muted=True)
+        self.log_action("Muted User", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
     @discord.ui.button(label="🚫 Kick User", style=discord.ButtonStyle.danger, custom_id="kick_user", row=0)
     async def kick_user(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.guild.kick(self.user)
-        self.log_action("Kicked User")
+        self.log_action("Kicked User", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
     @discord.ui.button(label="⚠️ Warn User", style=discord.ButtonStyle.secondary, custom_id="warn_user", row=0)
     async def warn_user(self, interaction: discord.Interaction, button: discord.ui.Button):
-        server_user_data = await self.get_server_user_data()
-        new_warnings = server_user_data.warnings + 1
-        await update_instance(ServerUser, {'user_id': str(self.user.id), 'server_id': str(self.guild.id)}, warnings=new_warnings)
-        self.log_action(f"Warned User (Total warnings: {new_warnings})")
+        new_warnings = self.snapshot.warnings + 1
+        self.save(warnings=new_warnings)
+        self.log_action(f"Warned User (Total warnings: {new_warnings})", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
     @discord.ui.button(label="🧹 Delete All Messages", style=discord.ButtonStyle.secondary, custom_id="delete_messages", row=1)
     async def delete_messages(self, interaction: discord.Interaction, button: discord.ui.Button):
-        def is_user_message(msg):
-            return msg.author == self.user
-        deleted = await interaction.channel.purge(check=is_user_message)
-        self.log_action(f"Deleted {len(deleted)} messages")
+        deleted = await message_index.purge_author(self.guild, self.user.id)
+        if deleted is None:
+            # Nothing indexed for this user (e.g. after a restart), fall back to scanning this channel
+            def is_user_message(msg):
+                return msg.author == self.user
+            deleted = len(await interaction.channel.purge(check=is_user_message))
+        self.log_action(f"Deleted {deleted} messages", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
     @discord.ui.button(label="🔒 Lock User Out", style=discord.ButtonStyle.danger, custom_id="lock_user", row=1)
     async def lock_user(self, interaction: discord.Interaction, button: discord.ui.Button):
-        lock_role = await self.ensure_role_exists("Locked Out", {'send_messages': False, 'speak': False, 'connect': False})
+        lock_role = await self.ensure_role_exists("Locked Out")
         await self.user.add_roles(lock_role)
-        await update_instance(ServerUser, {'user_id': str(self.user.id), 'server_id': str(self.guild.id)}, locked_out=True)
-        self.log_action("Locked User Out")
+        self.save(locked_out=True)
+        self.log_action("Locked User Out", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
     @discord.ui.button(label="⚙️ Toggle Automod", style=discord.ButtonStyle.primary, custom_id="toggle_automod", row=1)
     async def toggle_automod(self, interaction: discord.Interaction, button: discord.ui.Button):
-        server_user_data = await self.get_server_user_data()
-        new_status = not server_user_data.automod
-        await update_instance(ServerUser, {'user_id': str(self.user.id), 'server_id': str(self.guild.id)}, automod=new_status)
+        new_status = not self.snapshot.automod
+        self.save(automod=new_status)
+        interaction.client.dispatch('automod_toggle', self.guild.id, self.user.id, new_status)
         status = "enabled" if new_status else "disabled"
-        self.log_action(f"Automod {status}")
+        self.log_action(f"Automod {status}", interaction.user)
         await self.update_embed()
         await interaction.followup.edit_message(interaction.message.id, embed=self.embed, view=self)
 
@@ -117,20 +580,30 @@ class AdminUserView(discord.ui.View):
 
     @discord.ui.button(label="📝 Add Note", style=discord.ButtonStyle.secondary, custom_id="add_note", row=2)
     async def add_note(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = AddNoteModal(user_id=str(self.user.id), server_id=str(self.guild.id))
+        modal = AddNoteModal(user_id=str(self.user.id), server_id=self.guild.id, panel=self)
         await interaction.response.send_modal(modal)
 
+    @discord.ui.button(label="📒 View Notes", style=discord.ButtonStyle.secondary, custom_id="view_notes", row=2)
+    async def view_notes(self, interaction: discord.Interaction, button: discord.ui.Button):
+        view = NotesView(self.user, self.guild.id)
+        await interaction.response.send_message(embed=view.render_page(), view=view, ephemeral=True)
+
     async def update_embed(self):
-        user_data = await self.get_user_data()
-        server_user_data = await self.get_server_user_data()
-        date_joined = user_data.global_join_date.strftime("%Y-%m-%d")
-        invited_by = await self.get_inviter(server_user_data.invited_by)
-        warnings = server_user_data.warnings
-        automod_status = "🟢 Enabled" if server_user_data.automod else "🔴 Disabled"
-        muted_status = "🔇 Muted" if server_user_data.muted else "🔊 Not Muted"
-        banned_status = "⛔ Banned" if server_user_data.banned else "✅ Not Banned"
-        locked_out_status = "🔒 Locked Out" if server_user_data.locked_out else "🔓 Not Locked Out"
-        notes = server_user_data.notes if server_user_data.notes else "No notes available"
+        if self.snapshot is None:
+            await self.load_snapshot()
+        snapshot = self.snapshot
+        date_joined = snapshot.global_join_date.strftime("%Y-%m-%d")
+        invited_by = snapshot.inviter_name if snapshot.invited_by else "Unknown"
+        warnings = snapshot.warnings
+        automod_status = "🟢 Enabled" if snapshot.automod else "🔴 Disabled"
+        muted_status = "🔇 Muted" if snapshot.muted else "🔊 Not Muted"
+        banned_status = "⛔ Banned" if snapshot.banned else "✅ Not Banned"
+        locked_out_status = "🔒 Locked Out" if snapshot.locked_out else "🔓 Not Locked Out"
+        if snapshot.note_count:
+            latest = snapshot.latest_note if len(snapshot.latest_note) <= 200 else snapshot.latest_note[:197] + "..."
+            notes = f"{snapshot.note_count} note(s), latest: {latest}"
+        else:
+            notes = "No notes available"
 
         self.embed = discord.Embed(
             title=f"🔧 Admin User Panel - {self.user.display_name}",
@@ -148,34 +621,70 @@ class AdminUserView(discord.ui.View):
         self.embed.add_field(name="🔒 Locked Out Status", value=locked_out_status, inline=True)
         self.embed.add_field(name="📝 Notes", value=notes, inline=False)
 
-    async def get_inviter(self, invited_by_id):
-        if invited_by_id:
-            session = SessionLocal()
-            try:
-                inviter_user = session.query(User).filter_by(discord_id=str(invited_by_id)).first()
-                return inviter_user.username if inviter_user else "Unknown"
-            except Exception as e:
-                print(f"Failed to get inviter: {e}")
-                traceback.print_exc()
-                return "Unknown"
-            finally:
-                session.close()
-        return "Unknown"
-
 class AddNoteModal(discord.ui.Modal, title="Add Note"):
     note = discord.ui.TextInput(label="Note", style=discord.TextStyle.paragraph)
 
-    def __init__(self, user_id: str, server_id: str):
+    def __init__(self, user_id: str, server_id: int, panel: AdminUserView = None):
         super().__init__()
         self.user_id = user_id
         self.server_id = server_id
+        self.panel = panel
 
     async def on_submit(self, interaction: discord.Interaction):
-        server_user_data = await get_or_create(ServerUser, user_id=self.user_id, server_id=self.server_id)
-        new_notes = (server_user_data.notes + "\n" if server_user_data.notes else "") + self.note.value
-        await update_instance(ServerUser, {'user_id': self.user_id, 'server_id': self.server_id}, notes=new_notes)
+        session = SessionLocal()
+        try:
+            session.add(Servernote(server_id=self.server_id, user_id=self.user_id, author_id=str(interaction.user.id),
+                                   created_at=datetime.utcnow(), content=self.note.value))
+            session.commit()
+        finally:
+            session.close()
+        if self.panel is not None and self.panel.snapshot is not None:
+            self.panel.snapshot.update(note_count=self.panel.snapshot.note_count + 1, latest_note=self.note.value)
         await interaction.response.send_message(f"Note added: {self.note.value}", ephemeral=True)
 
+class NotesView(discord.ui.View):
+    page_size = 5
+
+    def __init__(self, user: discord.Member, guild_id: int):
+        super().__init__(timeout=120)
+        self.user = user
+        self.guild_id = guild_id
+        self.page = 0
+
+    def render_page(self):
+        session = SessionLocal()
+        try:
+            query = session.query(Servernote).filter_by(server_id=self.guild_id, user_id=str(self.user.id))
+            total = query.count()
+            pages = max(1, (total + self.page_size - 1) // self.page_size)
+            self.page = max(0, min(self.page, pages - 1))
+            notes = query.order_by(Servernote.id.desc()).offset(self.page * self.page_size).limit(self.page_size).all()
+
+            embed = discord.Embed(title=f"📒 Notes - {self.user.display_name}", color=discord.Color.blue())
+            if not notes:
+                embed.description = "No notes available"
+            for note in notes:
+                author = f"<@{note.author_id}>" if note.author_id else "Unknown"
+                created = note.created_at.strftime("%Y-%m-%d %H:%M") if note.created_at else "Unknown date"
+                content = note.content if len(note.content) <= 1000 else note.content[:997] + "..."
+                embed.add_field(name=f"#{note.id} - {created}", value=f"{content}\n— {author}", inline=False)
+            embed.set_footer(text=f"Page {self.page + 1}/{pages} ({total} notes)")
+            self.previous_page.disabled = self.page == 0
+            self.next_page.disabled = self.page >= pages - 1
+            return embed
+        finally:
+            session.close()
+
+    @discord.ui.button(label="⬅️ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=self.render_page(), view=self)
+
+    @discord.ui.button(label="➡️ Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=self.render_page(), view=self)
+
 class UltraMod(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -191,9 +700,160 @@ class UltraMod(commands.Cog):
             print(e)
             traceback.print_exc()
 
+    @app_commands.command(name='modlog', description='Show the moderation history of a user')
+    @app_commands.describe(user='The user to look up', limit='Number of entries to show')
+    async def modlog(self, interaction: discord.Interaction, user: discord.User, limit: int = 10):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        try:
+            entries = await audit_log.history(interaction.guild.id, user.id, max(1, min(limit, 25)))
+            embed = discord.Embed(title=f"📜 Moderation Log - {user.display_name}", color=discord.Color.blue())
+            if not entries:
+                embed.description = "No moderation actions recorded."
+            for entry in reversed(entries):
+                moderator = f"<@{entry['moderator_id']}>" if entry['moderator_id'] else "Unknown"
+                embed.add_field(name=entry['time'][:19].replace('T', ' '), value=f"{entry['action']} (by {moderator})", inline=False)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+
+    async def start_mass_action(self, interaction, action, user_ids, invite_code, joined_within_minutes, account_age_days):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            targets = await resolve_mass_targets(interaction, user_ids, invite_code, joined_within_minutes, account_age_days)
+            if targets is None:
+                await interaction.followup.send("Provide user IDs or at least one filter.", ephemeral=True)
+                return
+            if not targets:
+                await interaction.followup.send("No members matched.", ephemeral=True)
+                return
+            if len(targets) > MASS_ACTION_LIMIT:
+                await interaction.followup.send(f"{len(targets)} members matched, narrow the filter to at most {MASS_ACTION_LIMIT}.", ephemeral=True)
+                return
+
+            job_id = mass_actions.create_job(interaction.guild.id, interaction.channel.id, interaction.user.id, action, targets)
+            mass_actions.start(job_id)
+            await interaction.followup.send(f"Queued mass {action} job #{job_id} for {len(targets)} members.", ephemeral=True)
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            await interaction.followup.send(f"Failed to start mass {action}: {e}", ephemeral=True)
+
+    @app_commands.command(name='massban', description='Ban many members by ID or filter')
+    @app_commands.describe(user_ids='Space or comma separated user IDs', invite_code='Members who joined with this invite',
+                           joined_within_minutes='Members who joined in the last N minutes', account_age_days='Accounts younger than N days')
+    async def massban(self, interaction: discord.Interaction, user_ids: str = None, invite_code: str = None,
+                      joined_within_minutes: int = None, account_age_days: int = None):
+        await self.start_mass_action(interaction, 'ban', user_ids, invite_code, joined_within_minutes, account_age_days)
+
+    @app_commands.command(name='masskick', description='Kick many members by ID or filter')
+    @app_commands.describe(user_ids='Space or comma separated user IDs', invite_code='Members who joined with this invite',
+                           joined_within_minutes='Members who joined in the last N minutes', account_age_days='Accounts younger than N days')
+    async def masskick(self, interaction: discord.Interaction, user_ids: str = None, invite_code: str = None,
+                       joined_within_minutes: int = None, account_age_days: int = None):
+        await self.start_mass_action(interaction, 'kick', user_ids, invite_code, joined_within_minutes, account_age_days)
+
+    @app_commands.command(name='massmute', description='Mute many members by ID or filter')
+    @app_commands.describe(user_ids='Space or comma separated user IDs', invite_code='Members who joined with this invite',
+                           joined_within_minutes='Members who joined in the last N minutes', account_age_days='Accounts younger than N days')
+    async def massmute(self, interaction: discord.Interaction, user_ids: str = None, invite_code: str = None,
+                       joined_within_minutes: int = None, account_age_days: int = None):
+        await self.start_mass_action(interaction, 'mute', user_ids, invite_code, joined_within_minutes, account_age_days)
+
+    async def apply_timed_punishment(self, interaction, user, action, minutes):
+        if not interaction.user.guild_permissions.administrator:
+            embed = discord.Embed(title="Permission Denied", description="You are missing Administrator permission(s) to run this command.", color=discord.Color.red())
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+        if minutes <= 0:
+            await interaction.response.send_message("Duration must be at least one minute.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            role_name, flags = TIMED_PUNISHMENTS[action]
+            if action == 'ban':
+                await interaction.guild.ban(user)
+            else:
+                role = await overwrite_sync.ensure_role(interaction.guild, role_name, MODERATION_ROLES[role_name])
+                await user.add_roles(role)
+            update_server_user(user.id, interaction.guild.id, **{flag: True for flag in flags})
+            expires_at = datetime.utcnow() + timedelta(minutes=minutes)
+            timed_punishments.add(interaction.guild.id, user.id, action, expires_at)
+            audit_log.log(interaction.guild.id, user.id, f"Timed {action} for {minutes} minutes", user_name=user.display_name, moderator_id=interaction.user.id)
+            await interaction.followup.send(f"Applied {action} to {user.mention} until {expires_at.strftime('%Y-%m-%d %H:%M')} UTC.", ephemeral=True)
+        except Exception as e:
+            print(e)
+            traceback.print_exc()
+            await interaction.followup.send(f"Failed to apply {action}: {e}", ephemeral=True)
+
+    @app_commands.command(name='tempmute', description='Mute a user for a number of minutes')
+    @app_commands.describe(user='The user to mute', minutes='Duration in minutes')
+    async def tempmute(self, interaction: discord.Interaction, user: discord.Member, minutes: int):
+        await self.apply_timed_punishment(interaction, user, 'mute', minutes)
+
+    @app_commands.command(name='templock', description='Lock a user out for a number of minutes')
+    @app_commands.describe(user='The user to lock out', minutes='Duration in minutes')
+    async def templock(self, interaction: discord.Interaction, user: discord.Member, minutes: int):
+        await self.apply_timed_punishment(interaction, user, 'lockout', minutes)
+
+    @app_commands.command(name='tempban', description='Ban a user for a number of minutes')
+    @app_commands.describe(user='The user to ban', minutes='Duration in minutes')
+    async def tempban(self, interaction: discord.Interaction, user: discord.Member, minutes: int):
+        await self.apply_timed_punishment(interaction, user, 'ban', minutes)
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.guild is not None:
+            message_index.add(message.guild.id, message.channel.id, message.author.id, message.id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        if payload.guild_id is not None and payload.cached_message is not None:
+            message_index.discard(payload.guild_id, payload.cached_message.author.id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        for role_name, permissions in MODERATION_ROLES.items():
+            role = discord.utils.get(channel.guild.roles, name=role_name)
+            if role is not None:
+                await overwrite_sync.apply([channel], role, permissions)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if before.overwrites != after.overwrites:
+            overwrite_sync.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        overwrite_sync.invalidate(role.guild.id, role.id)
+
+    async def cog_unload(self):
+        timed_punishments.scheduler.stop()
+        await mass_actions.stop()
+        await audit_log.stop()
+
 async def setup(bot, restart_fn):
     await setup_server_user_columns()  # Ensure the server user columns are set up
+    await setup_server_note()
+    await setup_mass_action_jobs()
+    await setup_timed_punishments()
+    audit_log.start()
+    mass_actions.bot = bot
+    timed_punishments.start(bot)
     await bot.add_cog(UltraMod(bot))
+    mass_actions.resume()
 
 __dependencies__ = ["database", "invite_tracker"]
+__member_cache__ = []
+__chunk_guilds__ = "lazy"
 __version__ = "1.0.0"
@@ -0,0 +1,150 @@
+# modules/watchdog.py
+
+import discord
+from discord.ext import commands
+from discord import app_commands
+from modules.metrics_registry import metrics
+import traceback
+import threading
+import asyncio
+import time
+import sys
+import os
+
+BLOCK_THRESHOLD = float(os.environ.get("WATCHDOG_THRESHOLD", 0.25))
+CHECK_INTERVAL = 0.05
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_SITES = 10
+
+blocked_seconds = metrics.counter('event_loop_blocked_seconds_total', 'Time the event loop was blocked, by the call site it was stuck in', labels=('site',))
+block_durations = metrics.histogram('event_loop_block_duration_seconds', 'Duration of each event loop blocking episode',
+                                    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+
+def call_site(stack):
+    """The innermost frame in the bot's own code, falling back to the innermost frame."""
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(PROJECT_ROOT) and path != os.path.abspath(__file__) and "site-packages" not in path:
+            return f"{os.path.relpath(path, PROJECT_ROOT)}:{frame.lineno} in {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+class LoopWatchdog:
+    """Watches the event loop from a separate thread and samples its stack while it is blocked.
+
+    Every CHECK_INTERVAL the thread schedules a no-op on the loop; if it hasn't
+    run after `threshold` seconds, the loop thread's current frame is captured
+    and the blocked time is charged to its call site.
+    """
+
+    def __init__(self, loop, thread_id, threshold=BLOCK_THRESHOLD, interval=CHECK_INTERVAL):
+        self.loop = loop
+        self.thread_id = thread_id
+        self.threshold = threshold
+        self.interval = interval
+        self.pinged_at = None
+        self.last_lag = 0.0
+        self.episode_sites = {}
+        self.last_sample = None
+        self.blocked = {}
+        self.samples = {}
+        self.stacks = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="loop-watchdog", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def pong(self):
+        if self.pinged_at is not None:
+            self.last_lag = time.monotonic() - self.pinged_at
+        self.pinged_at = None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            pinged_at = self.pinged_at
+            now = time.monotonic()
+            if pinged_at is None:
+                if self.episode_sites:
+                    self.end_episode()
+                self.pinged_at = now
+                try:
+                    self.loop.call_soon_threadsafe(self.pong)
+                except RuntimeError:
+                    return  # The loop was closed
+            elif now - pinged_at >= self.threshold:
+                self.sample(now, now - pinged_at)
+
+    def sample(self, now, lag):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        del frame
+        site = call_site(stack)
+        elapsed = lag if self.last_sample is None else now - self.last_sample
+        self.last_sample = now
+
+        with self.lock:
+            self.blocked[site] = self.blocked.get(site, 0.0) + elapsed
+            self.samples[site] = self.samples.get(site, 0) + 1
+            if site not in self.stacks:
+                self.stacks[site] = "".join(traceback.format_list(stack[-8:]))
+        blocked_seconds.inc(elapsed, site=site)
+
+        if not self.episode_sites:
+            print(f"Event loop blocked for {lag:.2f}s at {site}:\n{self.stacks[site]}")
+        self.episode_sites[site] = self.episode_sites.get(site, 0.0) + elapsed
+
+    def end_episode(self):
+        duration = sum(self.episode_sites.values())
+        worst = max(self.episode_sites, key=self.episode_sites.get)
+        block_durations.observe(duration)
+        print(f"Event loop was blocked for {duration:.2f}s, mostly at {worst}")
+        self.episode_sites = {}
+        self.last_sample = None
+
+    def report(self, limit=REPORT_SITES):
+        with self.lock:
+            sites = sorted(self.blocked.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [(site, seconds, self.samples[site], self.stacks[site]) for site, seconds in sites]
+
+
+class Watchdog(commands.Cog):
+    def __init__(self, bot, watchdog):
+        self.bot = bot
+        self.watchdog = watchdog
+
+    async def cog_unload(self):
+        self.watchdog.stop()
+
+    @app_commands.command(name="blocking_report", description="Show where the event loop was blocked the longest")
+    async def blocking_report(self, interaction: discord.Interaction):
+        # The samples cover the whole process, so they would show other guilds' activity to a server admin
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("Only the bot owner can view the blocking report.", ephemeral=True)
+            return
+
+        embed = discord.Embed(title="⏱️ Event Loop Blocking", color=discord.Color.orange())
+        embed.description = f"Threshold {self.watchdog.threshold:.2f}s, last loop lag {self.watchdog.last_lag * 1000:.1f} ms"
+        sites = self.watchdog.report()
+        if not sites:
+            embed.description += "\nThe event loop has not been blocked."
+        for site, seconds, samples, _ in sites:
+            embed.add_field(name=site[:256], value=f"{seconds:.2f}s blocked over {samples} samples", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot, restart_fn):
+    # setup runs on the loop thread, which is the thread the watchdog samples
+    watchdog = LoopWatchdog(asyncio.get_running_loop(), threading.get_ident())
+    watchdog.start()
+    await bot.add_cog(Watchdog(bot, watchdog))
+
+__version__ = "1.0.0"
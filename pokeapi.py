@@ -1,22 +1,274 @@
-#write a script to get the data from the pokeapi and store it in a json file
-import requests
+# Ingest the PokeAPI pokemon list and detail documents into the pokedexentry table, resuming from a checkpoint
+import argparse
+import asyncio
 import json
-import sqlite3
+import os
+import random
+import re
+import sys
+import time
 
-# Define the URL for the PokeAPI
-url = "https://pokeapi.co/api/v2/pokemon?limit=100000&offset=0"
+import aiohttp
 
-# Make a GET request to the PokeAPI
-response = requests.get(url)
+DEFAULT_BASE_URL = os.environ.get("POKEAPI_BASE_URL", "https://pokeapi.co/api/v2")
+CHECKPOINT_PATH = "pokedex_ingest.checkpoint.json"
+MAX_RETRIES = 5
+ID_RE = re.compile(r"/(\d+)/?$")
 
-# Check if the request was successful
-if response.status_code == 200:
-    # Parse the JSON data
-    data = response.json()
 
-    # Open a JSON file for writing
-    with open('pokemon_data.json', 'w') as file:
-        json.dump(data, file, indent=4)
-    print("Data has been written to pokemon_data.json")
-else:
-    print("Failed to retrieve data from the PokeAPI")
+def load_checkpoint(path, base_url):
+    try:
+        with open(path, "r") as file:
+            checkpoint = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return set()
+    if checkpoint.get("base_url") != base_url:
+        print(f"Ignoring checkpoint for {checkpoint.get('base_url')}")
+        return set()
+    return set(checkpoint["done"])
+
+
+def save_checkpoint(path, base_url, done):
+    # Write to a temporary file and rename, so an interrupted run never leaves a truncated checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump({"base_url": base_url, "done": sorted(done)}, file)
+    os.replace(temporary, path)
+
+
+async def fetch_json(http, url, stats):
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with http.get(url) as response:
+                if response.status == 429 or response.status >= 500:
+                    stats["retries"] += 1
+                    delay = float(response.headers.get("Retry-After", 0)) or 2 ** attempt + random.random()
+                    await asyncio.sleep(delay)
+                    continue
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            stats["retries"] += 1
+            await asyncio.sleep(2 ** attempt + random.random())
+    raise RuntimeError(f"Giving up on {url} after {MAX_RETRIES} attempts")
+
+
+def english_description(species):
+    for entry in species.get("flavor_text_entries", []):
+        if entry["language"]["name"] == "en":
+            return " ".join(entry["flavor_text"].split())
+    return None
+
+
+async def fetch_entry(http, base_url, pokemon_id, descriptions, stats):
+    """Fetch one pokemon and reduce it to a pokedexentry row; the full documents are dropped right away."""
+    pokemon = await fetch_json(http, f"{base_url}/pokemon/{pokemon_id}/", stats)
+    row = {
+        "pokemon_id": pokemon["id"],
+        "name": pokemon["name"],
+        "type": "/".join(slot["type"]["name"] for slot in sorted(pokemon["types"], key=lambda slot: slot["slot"])),
+        "description": None,
+    }
+    species_url = pokemon.get("species", {}).get("url")
+    del pokemon
+    if descriptions and species_url:
+        row["description"] = english_description(await fetch_json(http, species_url, stats))
+    return row
+
+
+def write_batch(engine, rows):
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT OR REPLACE INTO pokedexentry (pokemon_id, name, type, description)
+            VALUES (:pokemon_id, :name, :type, :description)
+        '''), rows)
+
+
+async def skip_restart():
+    # add_column asks the bot to restart after a table's final column; write_batch uses raw SQL, so the script doesn't need one
+    pass
+
+
+async def ingest(args):
+    from modules import database
+    from modules.pokedex import setup_pokedex_columns
+    engine = database.engine
+    database.init_db()
+    if database.restart_program_fn is None:
+        database.restart_program_fn = skip_restart
+    await setup_pokedex_columns()
+
+    base_url = args.base_url.rstrip("/")
+    done = set() if args.restart else load_checkpoint(args.checkpoint, base_url)
+    stats = {"fetched": 0, "written": 0, "retries": 0, "failed": 0}
+    start = time.perf_counter()
+
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=args.concurrency)) as http:
+        listing = await fetch_json(http, f"{base_url}/pokemon?limit={args.limit}&offset=0", stats)
+        pokemon_ids = [int(ID_RE.search(result["url"]).group(1)) for result in listing["results"]]
+        del listing
+        pending = [pokemon_id for pokemon_id in pokemon_ids if pokemon_id not in done]
+        print(f"{len(pokemon_ids)} pokemon listed, {len(pokemon_ids) - len(pending)} already ingested, {len(pending)} to fetch")
+
+        ids = asyncio.Queue()
+        for pokemon_id in pending:
+            ids.put_nowait(pokemon_id)
+        # Bounded, so fetchers wait for the writer instead of piling up rows
+        rows = asyncio.Queue(maxsize=args.batch_size * 2)
+
+        async def fetcher():
+            while True:
+                try:
+                    pokemon_id = ids.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await rows.put(await fetch_entry(http, base_url, pokemon_id, args.descriptions, stats))
+                    stats["fetched"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"Failed to fetch pokemon {pokemon_id}: {e}")
+
+        async def flush(batch):
+            await asyncio.to_thread(write_batch, engine, batch)
+            done.update(row["pokemon_id"] for row in batch)
+            save_checkpoint(args.checkpoint, base_url, done)
+            stats["written"] += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"Wrote {stats['written']}/{len(pending)} entries ({stats['written'] / elapsed:.0f}/s)")
+
+        async def writer():
+            batch = []
+            while True:
+                row = await rows.get()
+                if row is None:
+                    break
+                batch.append(row)
+                if len(batch) >= args.batch_size:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+
+        writer_task = asyncio.create_task(writer())
+        fetchers = asyncio.gather(*(fetcher() for _ in range(args.concurrency)))
+        await asyncio.wait({fetchers, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+        if writer_task.done():
+            # The writer only stops early when a write fails; nothing drains the queue anymore,
+            # so stop the fetchers instead of leaving them blocked on it and re-raise the error
+            fetchers.cancel()
+            await asyncio.gather(fetchers, return_exceptions=True)
+            await writer_task
+        await rows.put(None)
+        await writer_task
+
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {stats['written']} entries in {elapsed:.1f}s ({stats['retries']} retries, {stats['failed']} failed)")
+    return stats
+
+
+def fixture_documents(count):
+    types = ["grass", "poison", "fire", "water", "bug", "normal", "electric", "psychic"]
+    rng = random.Random(count)
+    pokemon, species = {}, {}
+    for pokemon_id in range(1, count + 1):
+        slots = rng.sample(types, rng.randint(1, 2))
+        pokemon[pokemon_id] = {
+            "id": pokemon_id,
+            "name": f"fixturemon-{pokemon_id}",
+            "types": [{"slot": slot + 1, "type": {"name": name}} for slot, name in enumerate(slots)],
+            "species": {"url": f"/pokemon-species/{pokemon_id}/"},
+            # Real detail documents are hundreds of KB, mostly moves
+            "moves": [{"move": {"name": f"move-{number}"}} for number in range(80)],
+        }
+        species[pokemon_id] = {"flavor_text_entries": [
+            {"flavor_text": f"Der Fixturemon {pokemon_id}.", "language": {"name": "de"}},
+            {"flavor_text": f"Fixture pokemon\nnumber {pokemon_id}.", "language": {"name": "en"}},
+        ]}
+    return pokemon, species
+
+
+async def start_fixture_server(count, port, failure_rate):
+    """Serve a small fake PokeAPI on localhost, failing a share of requests with 429/500 to exercise retries."""
+    from aiohttp import web
+    pokemon, species = fixture_documents(count)
+    rng = random.Random(port)
+
+    def base(request):
+        return f"http://{request.host}/api/v2"
+
+    def maybe_fail():
+        if rng.random() < failure_rate:
+            if rng.random() < 0.5:
+                return web.Response(status=429, headers={"Retry-After": "0.1"})
+            return web.Response(status=500)
+        return None
+
+    async def listing(request):
+        limit = int(request.query.get("limit", 20))
+        results = [{"name": entry["name"], "url": f"{base(request)}/pokemon/{pokemon_id}/"} for pokemon_id, entry in list(pokemon.items())[:limit]]
+        return web.json_response({"count": len(pokemon), "next": None, "previous": None, "results": results})
+
+    async def detail(request):
+        failure = maybe_fail()
+        if failure is not None:
+            return failure
+        entry = pokemon.get(int(request.match_info["pokemon_id"]))
+        if entry is None:
+            raise web.HTTPNotFound()
+        return web.json_response(dict(entry, species={"url": base(request) + entry["species"]["url"]}))
+
+    async def species_detail(request):
+        failure = maybe_fail()
+        if failure is not None:
+            return failure
+        entry = species.get(int(request.match_info["pokemon_id"]))
+        if entry is None:
+            raise web.HTTPNotFound()
+        return web.json_response(entry)
+
+    app = web.Application()
+    app.router.add_get("/api/v2/pokemon", listing)
+    app.router.add_get("/api/v2/pokemon/{pokemon_id}/", detail)
+    app.router.add_get("/api/v2/pokemon-species/{pokemon_id}/", species_detail)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def main_async(args):
+    runner = None
+    if args.fixture:
+        runner = await start_fixture_server(args.fixture, args.fixture_port, args.fixture_failure_rate)
+        args.base_url = f"http://127.0.0.1:{args.fixture_port}/api/v2"
+        print(f"Serving {args.fixture} fixture pokemon at {args.base_url}")
+    try:
+        await ingest(args)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load the PokeAPI into the pokedexentry table.")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="PokeAPI base URL (or set POKEAPI_BASE_URL)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel requests")
+    parser.add_argument("--batch-size", type=int, default=200, help="Rows per insert transaction")
+    parser.add_argument("--limit", type=int, default=100_000, help="Maximum number of pokemon to list")
+    parser.add_argument("--no-descriptions", dest="descriptions", action="store_false", help="Skip the species requests for descriptions")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and ingest everything again")
+    parser.add_argument("--fixture", type=int, metavar="COUNT", help="Ingest from a local fixture server with COUNT pokemon instead")
+    parser.add_argument("--fixture-port", type=int, default=8765)
+    parser.add_argument("--fixture-failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
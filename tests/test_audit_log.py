@@ -0,0 +1,55 @@
+# tests/test_audit_log.py
+
+import asyncio
+import os
+
+from modules.audit_log import AuditLog
+
+
+def write_entries(directory, entries, **options):
+    async def run():
+        audit_log = AuditLog(directory=directory, **options)
+        audit_log.start()
+        for guild_id, user_id, action in entries:
+            audit_log.log(guild_id, user_id, action)
+        await audit_log.stop()
+        return audit_log
+    return asyncio.run(run())
+
+
+def history(audit_log, guild_id, user_id, limit=10):
+    return [entry['action'] for entry in asyncio.run(audit_log.history(guild_id, user_id, limit))]
+
+
+def test_history_per_user(tmp_path):
+    audit_log = write_entries(str(tmp_path), [(1, 10, "warned"), (1, 11, "muted"), (1, 10, "kicked"), (2, 10, "banned")])
+    assert history(audit_log, 1, 10) == ["warned", "kicked"]
+    assert history(audit_log, 1, 10, limit=1) == ["kicked"]
+    assert history(audit_log, 2, 10) == ["banned"]
+    assert history(audit_log, 3, 10) == []
+
+
+def test_index_is_reloaded_from_sidecar_files(tmp_path):
+    write_entries(str(tmp_path), [(1, 10, f"action {number}") for number in range(5)])
+    audit_log = AuditLog(directory=str(tmp_path))
+    audit_log.load_index()
+    assert history(audit_log, 1, 10) == [f"action {number}" for number in range(5)]
+
+
+def test_segments_rotate_and_old_ones_are_removed(tmp_path):
+    # Every batch of one entry fills a segment, so each entry gets its own
+    audit_log = AuditLog(directory=str(tmp_path), max_bytes=1, backup_count=2, batch_size=1)
+    audit_log.load_index()
+    for number in range(5):
+        positions = audit_log.write_batch([{'guild_id': 1, 'user_id': 10, 'action': f"action {number}"}])
+        for guild_id, user_id, segment, offset in positions:
+            audit_log.add_to_index(guild_id, user_id, segment, offset)
+    assert audit_log.list_segments() == [4, 5]
+    assert sorted(os.listdir(tmp_path)) == ["modlog-000004.idx", "modlog-000004.log", "modlog-000005.idx", "modlog-000005.log"]
+    # Entries of removed segments are skipped
+    assert history(audit_log, 1, 10) == ["action 3", "action 4"]
+
+
+def test_per_user_limit(tmp_path):
+    audit_log = write_entries(str(tmp_path), [(1, 10, f"action {number}") for number in range(10)], per_user_limit=3)
+    assert history(audit_log, 1, 10) == ["action 7", "action 8", "action 9"]
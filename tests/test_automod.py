@@ -0,0 +1,150 @@
+# tests/test_automod.py
+
+import asyncio
+import threading
+import time
+
+from sqlalchemy import inspect
+
+from modules.database import engine
+from modules import automod
+from modules.automod import AutomodEngine, CompiledRules
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_automodrule_table():
+    asyncio.run(automod.setup_automod_columns())
+    columns = {column['name']: column for column in inspect(engine).get_columns('automodrule')}
+    assert set(columns) == {'id', 'guild_id', 'kind', 'pattern'}
+    assert columns['id']['primary_key']
+
+
+def test_words_and_phrases():
+    rules = CompiledRules([(1, "word", "Spam"), (2, "word", "buy now"), (3, "word", "")])
+    assert rules.match("this is SPAM") == "blocked word: spam"
+    assert rules.match("spammer") is None
+    assert rules.match("Buy now, cheap") == "blocked word: Buy now"
+    assert rules.match("buy nowhere") is None
+    assert rules.match("hello") is None
+
+
+def test_regex_rules_report_their_id():
+    rules = CompiledRules([(4, "regex", r"free (nitro|gift)"), (5, "regex", r"(?P<code>[A-Z]{16})")])
+    assert rules.match("get FREE gift here") == "matched rule #4"
+    assert rules.match("ABCDEFGHIJKLMNOP") == "matched rule #5"
+    assert rules.match("nothing") is None
+
+
+def test_rules_that_cannot_be_combined_are_matched_separately():
+    rules = CompiledRules([
+        (6, "regex", r"(\w)\1{4}"),
+        (7, "regex", r"(?i)shout"),
+        (8, "regex", r"(?P<x>foo)"),
+        (9, "regex", r"(?P<x>bar)"),
+        (10, "regex", r"("),
+    ])
+    assert [rule_id for rule_id, _ in rules.separate] == [6, 7, 9]
+    assert set(rules.groups.values()) == {8}
+    assert rules.match("aaaaa") == "matched rule #6"
+    assert rules.match("SHOUT") == "matched rule #7"
+    assert rules.match("foo") == "matched rule #8"
+    assert rules.match("bar") == "matched rule #9"
+    assert rules.match("(") is None
+
+
+def test_engine_spam_and_exemptions():
+    clock = FakeClock()
+    engine = AutomodEngine(spam_messages=3, spam_window=5, clock=clock)
+    engine.set_rules(1, [(1, "word", "spam")])
+    assert engine.check(1, 10, "spam") == "blocked word: spam"
+    clock.now += 10
+    assert engine.check(1, 10, "hi") is None
+    assert engine.check(1, 10, "hi") is None
+    assert engine.check(1, 10, "hi") == "sending messages too fast"
+
+    engine.set_automod(1, 10, False)
+    assert engine.check(1, 10, "spam") is None
+    engine.set_automod(1, 10, True)
+    clock.now += 10
+    assert engine.check(1, 10, "spam") == "blocked word: spam"
+    assert engine.check(2, 10, "spam") is None
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content, delete_after=None):
+        self.sent.append(content)
+
+
+class FakeAuthor:
+    bot = False
+    id = 10
+    mention = "<@10>"
+    display_name = "spammer"
+
+
+class FakeGuild:
+    id = 34
+
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.id = 1
+        self.guild = FakeGuild()
+        self.author = FakeAuthor()
+        self.channel = channel
+        self.content = content
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+def test_rules_load_once_off_the_event_loop(monkeypatch):
+    loads = []
+
+    def load_guild_rules(guild_id):
+        loads.append((guild_id, threading.get_ident()))
+        time.sleep(0.05)
+        return [(1, "word", "spam")], []
+
+    monkeypatch.setattr(automod, "load_guild_rules", load_guild_rules)
+
+    async def run():
+        cog = automod.Automod(None)
+        channel = FakeChannel()
+        messages = [FakeMessage(channel, "spam"), FakeMessage(channel, "hello"), FakeMessage(channel, "spam")]
+        await asyncio.gather(*(cog.on_message(message) for message in messages))
+        return messages, cog
+
+    messages, cog = asyncio.run(run())
+    assert len(loads) == 1
+    assert loads[0][1] != threading.get_ident()
+    assert [message.deleted for message in messages] == [True, False, True]
+    assert cog.loading == {}
+
+
+def test_one_notice_per_user_and_window(monkeypatch):
+    monkeypatch.setattr(automod, "load_guild_rules", lambda guild_id: ([], []))
+
+    async def run():
+        cog = automod.Automod(None)
+        channel = FakeChannel()
+        messages = [FakeMessage(channel, f"message {number}") for number in range(10)]
+        for message in messages:
+            await cog.on_message(message)
+        return messages, channel
+
+    messages, channel = asyncio.run(run())
+    # The fifth message within the spam window and every one after it are removed
+    assert [message.deleted for message in messages] == [False] * 4 + [True] * 6
+    assert channel.sent == ["<@10>, your message was removed (sending messages too fast)."]
@@ -0,0 +1,71 @@
+# tests/test_cluster.py
+
+import subprocess
+import sys
+
+import pytest
+
+from cluster import Cluster, shard_ranges, wait_for_ready
+
+
+def test_shard_ranges_are_contiguous_and_balanced():
+    assert shard_ranges(10, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert shard_ranges(4, 4) == [[0], [1], [2], [3]]
+    assert shard_ranges(1, 1) == [[0]]
+
+
+def test_shard_ranges_never_start_empty_clusters():
+    assert shard_ranges(2, 8) == [[0], [1]]
+
+
+def test_only_the_primary_writes_the_ready_file(monkeypatch):
+    monkeypatch.setenv("BOT_CLUSTER_WORKER", "1")
+    primary = Cluster(0, [0, 1], 4, fake_gateway=False, ready_file="/tmp/ready")
+    worker = Cluster(1, [2, 3], 4, fake_gateway=True, ready_file="/tmp/ready")
+
+    env = primary.environment()
+    assert env["BOT_SHARD_IDS"] == "0,1"
+    assert env["BOT_SHARD_COUNT"] == "4"
+    assert env["BOT_CLUSTER_READY_FILE"] == "/tmp/ready"
+    assert "BOT_CLUSTER_WORKER" not in env
+    assert "BOT_FAKE_GATEWAY" not in env
+
+    env = worker.environment()
+    assert env["BOT_CLUSTER_ID"] == "1"
+    assert env["BOT_SHARD_IDS"] == "2,3"
+    assert env["BOT_CLUSTER_WORKER"] == "1"
+    assert env["BOT_FAKE_GATEWAY"] == "1"
+    assert "BOT_CLUSTER_READY_FILE" not in env
+
+
+def start_primary(code):
+    primary = Cluster(0, [0], 1, fake_gateway=True)
+    primary.process = subprocess.Popen([sys.executable, "-c", code])
+    return primary
+
+
+def test_wait_for_ready_returns_once_the_primary_signals(tmp_path):
+    ready_file = tmp_path / "ready"
+    primary = start_primary(f"import time; time.sleep(0.2); open({str(ready_file)!r}, 'w').write('1'); time.sleep(5)")
+    try:
+        wait_for_ready(primary, str(ready_file), timeout=10)
+        assert primary.process.poll() is None
+    finally:
+        primary.stop()
+        primary.process.wait()
+
+
+def test_wait_for_ready_fails_when_the_primary_exits(tmp_path):
+    primary = start_primary("raise SystemExit(3)")
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        wait_for_ready(primary, str(tmp_path / "ready"), timeout=10)
+
+
+def test_wait_for_ready_times_out(tmp_path):
+    primary = start_primary("import time; time.sleep(5)")
+    try:
+        with pytest.raises(RuntimeError, match="not ready after"):
+            wait_for_ready(primary, str(tmp_path / "ready"), timeout=0.2)
+    finally:
+        primary.stop()
+        primary.process.wait()
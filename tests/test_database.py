@@ -0,0 +1,26 @@
+# tests/test_database.py
+
+import asyncio
+
+import pytest
+from sqlalchemy import Integer
+
+from modules.database import add_column, setup_timings, timed_table_setup
+
+
+def test_table_setup_time_accumulates_per_table():
+    asyncio.run(add_column("TimingProbe", "id", Integer, primary_key=True))
+    first = setup_timings["columns timingprobe"]
+    asyncio.run(add_column("TimingProbe", "value", Integer, default=0, final_column=True))
+    assert setup_timings["columns timingprobe"] > first
+
+
+def test_failed_table_setup_is_still_timed():
+    @timed_table_setup
+    async def fail(table_name):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("locked")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fail("FailingProbe"))
+    assert setup_timings["columns failingprobe"] >= 0.01
@@ -0,0 +1,59 @@
+# tests/test_debounce.py
+
+from modules.debounce import DebounceStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_within_cooldown():
+    clock = FakeClock()
+    store = DebounceStore(cooldown=2, clock=clock)
+    assert store.hit("a") is False
+    assert store.hit("a") is True
+    assert "a" in store
+    clock.now = 2.0
+    assert "a" not in store
+    assert store.hit("a") is False
+    assert store.stats()['hits'] == 1
+    assert store.stats()['misses'] == 2
+
+
+def test_expired_keys_are_purged():
+    clock = FakeClock()
+    store = DebounceStore(cooldown=1, clock=clock)
+    for key in range(10):
+        store.hit(key)
+    clock.now = 5.0
+    store.hit("new")
+    assert len(store) == 1
+    assert store.stats()['expired'] == 10
+
+
+def test_per_key_cooldown():
+    clock = FakeClock()
+    store = DebounceStore(cooldown=10, clock=clock)
+    store.hit("short", cooldown=1)
+    store.hit("long")
+    clock.now = 1.5
+    assert store.hit("short") is False
+    assert store.hit("long") is True
+
+
+def test_full_store_evicts_closest_to_expiry():
+    clock = FakeClock()
+    store = DebounceStore(cooldown=5, max_size=3, clock=clock)
+    for key in "abc":
+        store.hit(key)
+        clock.now += 1
+    store.hit("d")
+    assert len(store) == 3
+    assert "a" not in store
+    assert all(key in store for key in "bcd")
+    assert store.stats()['evicted'] == 1
+
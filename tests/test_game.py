@@ -0,0 +1,106 @@
+# tests/test_game.py
+
+import asyncio
+
+import pytest
+from sqlalchemy import inspect, text
+
+from modules.database import engine
+from modules import game
+from modules.game import GameSessionStore, ScoreBuffer, attempts_for
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope="module", autouse=True)
+def gamescore_table():
+    asyncio.run(game.setup_game_score_columns())
+
+
+def read_scores(guild_id):
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT user_id, games, wins, best_attempts FROM gamescore WHERE guild_id = :guild_id'),
+                            {'guild_id': guild_id}).all()
+    return {user_id: (games, wins, best) for user_id, games, wins, best in rows}
+
+
+def test_gamescore_table():
+    columns = {column['name']: column for column in inspect(engine).get_columns('gamescore')}
+    assert set(columns) == {'id', 'guild_id', 'user_id', 'games', 'wins', 'best_attempts'}
+    assert str(columns['id']['type']) == 'INTEGER'
+    indexes = {index['name']: index for index in inspect(engine).get_indexes('gamescore')}
+    assert indexes['ux_gamescore_guild_user']['unique']
+    assert indexes['ix_gamescore_guild_wins']['column_names'] == ['guild_id', 'wins']
+
+
+def test_sessions_slide_and_expire():
+    clock = FakeClock()
+    store = GameSessionStore(ttl=10, clock=clock)
+    store.start((1, 1), 5, 10, 4)
+    store.start((1, 2), 7, 10, 4)
+    clock.now = 8
+    assert store.get((1, 1)).answer == 5
+    clock.now = 12
+    # (1, 2) was never touched again, (1, 1) was refreshed at 8
+    assert store.evict_expired() == 1
+    assert store.get((1, 2)) is None
+    assert store.get((1, 1)) is not None
+    clock.now = 30
+    assert store.get((1, 1)) is None
+    assert len(store) == 0
+    assert store.expired == 2
+
+
+def test_session_cap_drops_oldest():
+    store = GameSessionStore(max_sessions=2, clock=FakeClock())
+    for user_id in range(3):
+        store.start((1, user_id), 1, 10, 4)
+    assert len(store) == 2
+    assert store.get((1, 0)) is None
+    assert store.end((1, 2)).answer == 1
+
+
+def test_attempts_allow_a_binary_search():
+    assert attempts_for(2) == 3
+    assert attempts_for(10) == 5
+    assert attempts_for(1_000_000) == 21
+
+
+def test_score_buffer_merges_into_table():
+    scores = ScoreBuffer()
+    scores.record(49, 1, True, 4)
+    scores.record(49, 1, True, 2)
+    scores.record(49, 2, False, 5)
+    assert asyncio.run(scores.flush()) == 2
+    scores.record(49, 1, False, 3)
+    scores.record(49, 1, True, 3)
+    assert asyncio.run(scores.flush()) == 1
+    assert asyncio.run(scores.flush()) == 0
+    assert read_scores(49) == {1: (4, 3, 2), 2: (1, 0, None)}
+
+
+def test_failing_batches_are_retried_then_written_row_by_row():
+    scores = ScoreBuffer(max_attempts=2)
+    scores.record(50, 1, True, 3)
+    scores.record(50, 2, True, 4)
+    write = scores.write
+
+    def failing_write(batch):
+        if (50, 2) in batch:
+            raise RuntimeError("constraint failed")
+        write(batch)
+
+    scores.write = failing_write
+    assert asyncio.run(scores.flush()) == 0
+    assert scores.pending
+    # The second failure splits the batch; only the rejected row is dropped
+    assert asyncio.run(scores.flush()) == 1
+    assert scores.pending == {}
+    assert scores.dropped == 1
+    assert read_scores(50) == {1: (1, 1, 3)}
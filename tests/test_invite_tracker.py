@@ -0,0 +1,205 @@
+# tests/test_invite_tracker.py
+
+from datetime import datetime
+import asyncio
+
+import pytest
+from sqlalchemy import event, inspect, text
+
+from modules.database import engine
+from modules import invite_tracker
+from modules.invite_tracker import (InviteTracker, ReferralIndex, chain_from_db, read_reconcile_times, subtree_levels_from_db,
+                                    write_member_reconciliation)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def invite_columns():
+    asyncio.run(invite_tracker.setup_invite_tracker_columns())
+    asyncio.run(invite_tracker.setup_reconcile_columns())
+
+
+def insert_members(guild_id, members):
+    """members: (user_id, invited_by, left_guild) tuples."""
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT INTO serveruser (id, user_id, server_id, join_date, invited_by, left_guild)
+            VALUES (:id, :user_id, :server_id, :join_date, :invited_by, :left_guild)
+        '''), [{'id': f"{user_id}_{guild_id}", 'user_id': str(user_id), 'server_id': guild_id, 'join_date': datetime.utcnow(),
+                'invited_by': invited_by, 'left_guild': left} for user_id, invited_by, left in members])
+
+
+def read_counters(guild_id):
+    with engine.connect() as conn:
+        rows = conn.execute(text('''
+            SELECT user_id, left_guild, invites_count, stayed_invitees, left_invitees FROM serveruser WHERE server_id = :guild_id
+        '''), {'guild_id': guild_id}).all()
+    return {int(user_id): (bool(left), invites, stayed, left_count) for user_id, left, invites, stayed, left_count in rows}
+
+
+def test_serveruser_invite_columns():
+    columns = {column['name'] for column in inspect(engine).get_columns('serveruser')}
+    assert {'invited_by', 'invites_count', 'left_guild', 'left_invitees', 'stayed_invitees', 'invite_code'} <= columns
+    indexes = {index['name']: index['column_names'] for index in inspect(engine).get_indexes('serveruser')}
+    assert indexes['ix_serveruser_server_invited_by'] == ['server_id', 'invited_by']
+
+
+# 1 invited 2 and 3, 2 invited 4, 4 invited 5; 3 left the guild
+REFERRALS = [(1, None, False), (2, 1, False), (3, 1, True), (4, 2, False), (5, 4, False)]
+
+
+def build_index(guild_id):
+    index = ReferralIndex()
+    index.children[guild_id], index.parents[guild_id], index.left[guild_id] = {}, {}, set()
+    for user_id, invited_by, left in REFERRALS:
+        index.record_join(guild_id, user_id, invited_by)
+        if left:
+            index.record_leave(guild_id, user_id)
+    return index
+
+
+def test_referral_index_matches_database():
+    guild_id = 26
+    insert_members(guild_id, REFERRALS)
+    index = build_index(guild_id)
+
+    assert index.subtree_levels(guild_id, 1, 10) == [(2, 1, 1), (1, 1, 0), (1, 1, 0)]
+    assert index.subtree_levels(guild_id, 1, 2) == [(2, 1, 1), (1, 1, 0)]
+    assert index.chain(guild_id, 5, 10) == [4, 2, 1]
+    assert index.chain(guild_id, 5, 2) == [4, 2]
+
+    for root_id, depth in [(1, 10), (1, 2), (2, 10), (5, 10)]:
+        assert subtree_levels_from_db(guild_id, root_id, depth) == index.subtree_levels(guild_id, root_id, depth)
+    for member_id, depth in [(5, 10), (5, 2), (1, 10)]:
+        assert chain_from_db(guild_id, member_id, depth) == index.chain(guild_id, member_id, depth)
+
+
+def test_referral_index_stops_at_cycles():
+    index = ReferralIndex()
+    index.children[7], index.parents[7], index.left[7] = {}, {}, set()
+    index.record_join(7, 1, 2)
+    index.record_join(7, 2, 1)
+    assert index.chain(7, 1, 10) == [2]
+    assert index.subtree_levels(7, 1, 10) == [(1, 1, 0)]
+
+
+def test_reconciliation_fixes_membership_and_counters():
+    guild_id = 28
+    insert_members(guild_id, [(1, None, False), (2, 1, False), (3, 1, False), (4, 1, True), (5, None, False)])
+    with engine.begin() as conn:
+        # Stale counters: 5 still claims an invitee, 1 recorded more invites than it has invitees
+        conn.execute(text("UPDATE serveruser SET stayed_invitees = 1, invites_count = 1 WHERE id = '5_28'"))
+        conn.execute(text("UPDATE serveruser SET invites_count = 6 WHERE id = '1_28'"))
+
+    result = write_member_reconciliation(guild_id, [1, 2, 4, 5], chunk_size=2)
+    assert result['marked_left'] == 1
+    assert result['marked_present'] == 1
+
+    counters = read_counters(guild_id)
+    assert counters[3][0] is True
+    assert counters[4][0] is False
+    assert counters[1] == (False, 6, 2, 1)
+    assert counters[5] == (False, 1, 0, 0)
+
+
+def test_failed_reconciliation_commits_nothing():
+    guild_id = 280
+    insert_members(guild_id, [(1, None, False), (2, 1, False), (3, 1, False)])
+
+    def fail_counters(conn, cursor, statement, parameters, context, executemany):
+        if "SET stayed_invitees" in statement:
+            raise RuntimeError("database is locked")
+
+    event.listen(engine, "before_cursor_execute", fail_counters)
+    try:
+        with pytest.raises(RuntimeError):
+            write_member_reconciliation(guild_id, [1, 2])
+    finally:
+        event.remove(engine, "before_cursor_execute", fail_counters)
+
+    # 3 would have been marked as left by the first pass
+    assert read_counters(guild_id)[3][0] is False
+    assert write_member_reconciliation(guild_id, [1, 2])['marked_left'] == 1
+
+
+class FakeMember:
+    def __init__(self, member_id):
+        self.id = member_id
+
+
+class FakeGuild:
+    chunked = True
+
+    def __init__(self, guild_id, member_ids):
+        self.id = guild_id
+        self.name = f"guild {guild_id}"
+        self.members = [FakeMember(member_id) for member_id in member_ids]
+
+
+class FakeBot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+
+
+def test_startup_skips_recently_reconciled_guilds():
+    insert_members(281, [(1, None, False), (2, 1, False)])
+    insert_members(282, [(1, None, False), (2, 1, False)])
+    write_member_reconciliation(281, [1, 2])
+    tracker = InviteTracker(FakeBot([FakeGuild(281, [1]), FakeGuild(282, [1])]))
+
+    asyncio.run(tracker.reconcile_all_guilds())
+    assert read_counters(281)[2][0] is False
+    assert read_counters(282)[2][0] is True
+    assert set(read_reconcile_times()) >= {281, 282}
+
+    asyncio.run(tracker.reconcile_all_guilds(interval=-1))
+    assert read_counters(281)[2][0] is True
+
+
+class FakeInviter:
+    def __init__(self, inviter_id):
+        self.id = inviter_id
+
+
+class FakeInvite:
+    def __init__(self, code, inviter_id, uses):
+        self.code = code
+        self.inviter = FakeInviter(inviter_id)
+        self.uses = uses
+
+
+class FakeJoiner(FakeMember):
+    def __init__(self, member_id):
+        super().__init__(member_id)
+        self.name = f"member {member_id}"
+        self.avatar = None
+        self.created_at = datetime(2020, 1, 1)
+        self.joined_at = datetime(2024, 1, 1)
+
+
+class FakeRaidGuild(FakeGuild):
+    def __init__(self, guild_id, member_ids, invites):
+        super().__init__(guild_id, member_ids)
+        self.invites_after = invites
+
+    async def invites(self):
+        return self.invites_after
+
+
+def test_raid_batch_writes_edges_for_credited_invitees():
+    guild_id = 290
+    insert_members(guild_id, [(1, None, False), (2, None, False)])
+    # Two invites were used by the same batch, so neither accounts for all of it
+    guild = FakeRaidGuild(guild_id, [], [FakeInvite("a", 1, 2), FakeInvite("b", 2, 1)])
+    joiners = [FakeJoiner(member_id) for member_id in (10, 11, 12)]
+    tracker = InviteTracker(FakeBot([guild]))
+    tracker.invite_uses[guild_id] = {"a": 0, "b": 0}
+    tracker.referrals.children[guild_id], tracker.referrals.parents[guild_id], tracker.referrals.left[guild_id] = {}, {}, set()
+
+    asyncio.run(tracker.process_raid_batch(guild, joiners))
+    counters = read_counters(guild_id)
+    assert counters[1][1:] == (2, 2, 0)
+    assert counters[2][1:] == (1, 1, 0)
+    assert sorted(tracker.referrals.children[guild_id].items()) == [(1, {10, 11}), (2, {12})]
+
+    write_member_reconciliation(guild_id, [1, 2, 10, 11, 12])
+    assert read_counters(guild_id) == counters
@@ -0,0 +1,79 @@
+# tests/test_join_rate.py
+
+from modules.join_rate import JoinRateMonitor, RingCounter, age_bucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ring_counter_windows():
+    counter = RingCounter(10, resolution=1)
+    counter.add(100.2)
+    counter.add(100.7, 2)
+    counter.add(105.0)
+    assert counter.total(105.5) == 4
+    assert counter.total(105.5, buckets=3) == 1
+    assert counter.peak(105.5) == 3
+
+
+def test_ring_counter_overwrites_old_buckets():
+    counter = RingCounter(10, resolution=1)
+    counter.add(100.0, 5)
+    # Bucket 110 reuses bucket 100's slot
+    counter.add(110.0)
+    assert counter.total(110.0) == 1
+    assert counter.total(200.0) == 0
+    assert counter.peak(200.0) == 0
+
+
+def test_age_bucket():
+    assert age_bucket(0.5) == "< 1 day"
+    assert age_bucket(3) == "< 7 days"
+    assert age_bucket(29) == "< 30 days"
+    assert age_bucket(400) == "older"
+
+
+def test_burst_enables_raid_mode_until_cooldown():
+    clock = FakeClock()
+    monitor = JoinRateMonitor(burst_threshold=5, burst_window=10, minute_threshold=100, raid_cooldown=60, clock=clock)
+    results = [monitor.record_join(1) for _ in range(5)]
+    assert results == [False, False, False, False, True]
+    assert monitor.in_raid(1)
+    assert not monitor.in_raid(2)
+    clock.now += 59
+    assert monitor.in_raid(1)
+    clock.now += 1
+    assert not monitor.in_raid(1)
+
+
+def test_minute_threshold():
+    clock = FakeClock()
+    monitor = JoinRateMonitor(burst_threshold=100, burst_window=10, minute_threshold=6, clock=clock)
+    raid = False
+    for _ in range(6):
+        raid = monitor.record_join(1)
+        clock.now += 9
+    assert raid
+
+
+def test_snapshot():
+    clock = FakeClock()
+    monitor = JoinRateMonitor(max_codes=2, clock=clock)
+    monitor.record_join(1, account_age_days=0.1)
+    monitor.record_join(1, account_age_days=100)
+    monitor.record_invite_use(1, "a", 3)
+    monitor.record_invite_use(1, "b")
+    monitor.record_invite_use(1, "c", 2)
+    snapshot = monitor.snapshot(1)
+    assert snapshot['last_minute'] == 2
+    assert snapshot['last_hour'] == 2
+    # Only the two most recently used codes are kept
+    assert snapshot['codes'] == [("c", 2), ("b", 1)]
+    assert snapshot['ages']["< 1 day"] == 1
+    assert snapshot['ages']["older"] == 1
+    assert snapshot['raid'] is False
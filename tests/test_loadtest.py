@@ -0,0 +1,60 @@
+# tests/test_loadtest.py
+
+from argparse import Namespace
+import asyncio
+import random
+
+from loadtest import FakeRest, generate_events, percentile, read_events, write_events
+
+
+def stream_args(**overrides):
+    args = dict(guilds=3, joins=50, duration=10, leave_ratio=0.2, bursts=1, burst_size=20, messages=40,
+                interactions=10, invites_per_guild=2)
+    args.update(overrides)
+    return Namespace(**args)
+
+
+def test_generated_stream_is_reproducible_and_ordered():
+    events = generate_events(stream_args(), random.Random(3))
+    assert events == generate_events(stream_args(), random.Random(3))
+    assert [event["t"] for event in events] == sorted(event["t"] for event in events)
+
+    counts = {}
+    for event in events:
+        counts[event["type"]] = counts.get(event["type"], 0) + 1
+    assert counts == {"invite_create": 6, "member_join": 70, "member_remove": 14, "message": 40, "interaction": 10}
+
+
+def test_leaves_follow_their_joins():
+    events = generate_events(stream_args(), random.Random(4))
+    joined_at = {(event["guild"], event["user"]): event["t"] for event in events if event["type"] == "member_join"}
+    for event in events:
+        if event["type"] == "member_remove":
+            assert event["t"] > joined_at[(event["guild"], event["user"])]
+
+
+def test_recorded_stream_replays_identically(tmp_path):
+    events = generate_events(stream_args(), random.Random(5))
+    path = tmp_path / "events.jsonl"
+    write_events(path, events)
+    assert read_events(path) == events
+
+
+def test_route_buckets_rate_limit_within_the_window():
+    rest = FakeRest(random.Random(1), latency=0, jitter=0, bucket_limit=2, bucket_window=0.05, rate_limit_chance=0, retry_after=1)
+
+    async def run():
+        for _ in range(3):
+            await rest.request("GET /guilds/{guild_id}/invites", major=1)
+        await rest.request("GET /guilds/{guild_id}/invites", major=2)
+
+    asyncio.run(run())
+    assert rest.calls == {"GET /guilds/{guild_id}/invites": 4}
+    assert rest.rate_limited == {"GET /guilds/{guild_id}/invites": 1}
+    assert 0 < rest.rate_limit_wait <= 0.05
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3, 1, 2, 4], 0.5) == 3
+    assert percentile([3, 1, 2, 4], 0.99) == 4
@@ -0,0 +1,147 @@
+# tests/test_main.py
+
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    # main.py reads config.json from the working directory at import time
+    directory = tmp_path_factory.mktemp("main")
+    (directory / "config.json").write_text(json.dumps({"bot_token": "test", "modules": []}))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        return importlib.import_module("main")
+    finally:
+        os.chdir(cwd)
+
+
+def test_waves_follow_dependencies(main):
+    dependencies = {
+        "invite_tracker": ["database"],
+        "ultra_mod": ["database", "invite_tracker"],
+        "automod": ["database", "ultra_mod"],
+        "game": ["database"],
+    }
+    waves, skipped = main.sort_extensions(["automod", "game", "ultra_mod", "invite_tracker", "database"], dependencies)
+    assert waves == [["database"], ["game", "invite_tracker"], ["ultra_mod"], ["automod"]]
+    assert skipped == {}
+
+
+def test_missing_dependencies_skip_dependents(main):
+    dependencies = {"ultra_mod": ["database", "invite_tracker"], "automod": ["ultra_mod"]}
+    waves, skipped = main.sort_extensions(["database", "ultra_mod", "automod"], dependencies)
+    assert waves == [["database"]]
+    assert skipped == {
+        "ultra_mod": "missing dependencies: invite_tracker",
+        "automod": "missing dependencies: ultra_mod",
+    }
+
+
+def test_cycles_are_reported(main):
+    dependencies = {"a": ["b"], "b": ["c"], "c": ["a"], "d": ["database"]}
+    waves, skipped = main.sort_extensions(["database", "a", "b", "c", "d"], dependencies)
+    assert waves == [["database"], ["d"]]
+    assert skipped == {name: "dependency cycle: a -> b -> c -> a" for name in "abc"}
+
+
+def test_database_is_never_unloaded_or_reloaded(main):
+    for operation in (main.unload_module, main.reload_module):
+        with pytest.raises(ValueError):
+            asyncio.run(operation("database"))
+
+
+def test_signal_cluster_ready_writes_the_ready_file(main, tmp_path, monkeypatch):
+    ready_file = tmp_path / "ready"
+    monkeypatch.delenv("BOT_CLUSTER_READY_FILE", raising=False)
+    main.signal_cluster_ready()
+    assert not ready_file.exists()
+
+    monkeypatch.setenv("BOT_CLUSTER_READY_FILE", str(ready_file))
+    main.signal_cluster_ready()
+    assert ready_file.read_text() == str(os.getpid())
+
+
+def test_manifests_are_read_without_importing(main, tmp_path, monkeypatch):
+    modules = tmp_path / "modules"
+    (modules / "package").mkdir(parents=True)
+    # Importing this module would fail, so the manifest must come from the source alone
+    (modules / "sample.py").write_text(
+        'raise RuntimeError("imported")\n'
+        '__intents__ = ["guilds", "members"]\n'
+        '__dependencies__ = ["database"]\n'
+        '__member_cache__ = ["joined"]\n'
+        '__chunk_guilds__ = "lazy"\n'
+        '__version__ = "1.2.0"\n'
+    )
+    (modules / "package" / "__init__.py").write_text('__version__ = "0.1.0"\n')
+    (modules / "broken.py").write_text('__intents__ = [\n')
+    monkeypatch.chdir(tmp_path)
+
+    manifests = main.read_manifests(["sample", "package", "broken", "missing"])
+    assert manifests == {
+        "sample": {"intents": ["guilds", "members"], "dependencies": ["database"], "version": "1.2.0",
+                   "member_cache": ["joined"], "chunk_guilds": "lazy"},
+        "package": {"intents": [], "dependencies": [], "version": "0.1.0", "member_cache": None, "chunk_guilds": None},
+    }
+
+
+def test_intents_are_aggregated_from_manifests(main):
+    intents = main.aggregate_intents({
+        "a": {"intents": ["members"]},
+        "b": {"intents": ["message_content", "not_an_intent"]},
+    })
+    assert intents.members and intents.message_content
+    assert intents.guilds
+
+
+def test_command_tree_sync_is_skipped_until_the_tree_changes(main, tmp_path, monkeypatch):
+    import discord
+    from discord import app_commands
+
+    synced = []
+
+    async def sync(guild=None):
+        synced.append(guild)
+        return list(main.bot.tree.get_commands(guild=guild))
+
+    async def ping(interaction: discord.Interaction):
+        pass
+
+    monkeypatch.setattr(main, "command_hash_path", str(tmp_path / "hashes.json"))
+    monkeypatch.setattr(main.bot.tree, "sync", sync)
+    monkeypatch.setitem(main.config, "dev_guilds", [])
+
+    asyncio.run(main.sync_command_tree())
+    asyncio.run(main.sync_command_tree())
+    assert synced == [None]
+
+    command = app_commands.Command(name="ping", description="Ping", callback=ping)
+    main.bot.tree.add_command(command)
+    try:
+        asyncio.run(main.sync_command_tree())
+        assert synced == [None, None]
+        asyncio.run(main.sync_command_tree(force=True))
+        assert synced == [None, None, None]
+        assert json.loads((tmp_path / "hashes.json").read_text()) == {f"{main.bot.application_id}:global": main.command_tree_hash()}
+    finally:
+        main.bot.tree.remove_command("ping")
+
+
+def test_startup_phases_are_timed_and_saved(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "startup_profile_path", str(tmp_path / "startup_profile.json"))
+    with pytest.raises(RuntimeError):
+        with main.startup_phase("failing phase"):
+            raise RuntimeError("config missing")
+    assert main.startup_profile["phases"]["failing phase"] >= 0
+
+    main.report_startup()
+    profile = json.loads((tmp_path / "startup_profile.json").read_text())
+    assert {"load config", "read manifests", "create bot", "failing phase"} <= set(profile["phases"])
+    assert "database" in profile
+    assert profile["total"] >= sum(profile["phases"].values())
@@ -0,0 +1,111 @@
+# tests/test_member_cache.py
+
+import asyncio
+
+import discord
+
+from modules.member_cache import GuildChunker, guild_memory_report, member_cache_policy
+
+
+def test_declared_flags_are_combined():
+    intents = discord.Intents.default()
+    intents.members = True
+    manifests = {
+        "invite_tracker": {"intents": ["members"], "member_cache": ["joined"], "chunk_guilds": "lazy"},
+        "voice": {"intents": ["voice_states"], "member_cache": ["voice"]},
+        "game": {"intents": []},
+    }
+    flags, chunk_at_startup = member_cache_policy(manifests, intents)
+    assert flags.joined and flags.voice
+    assert not chunk_at_startup
+
+
+def test_startup_chunking_is_requested_by_any_module():
+    intents = discord.Intents.default()
+    manifests = {"poll": {"intents": [], "member_cache": [], "chunk_guilds": "startup"}}
+    flags, chunk_at_startup = member_cache_policy(manifests, intents)
+    assert flags.value == discord.MemberCacheFlags.none().value
+    assert chunk_at_startup
+
+
+def test_joined_needs_the_members_intent_and_unknown_flags_are_ignored():
+    intents = discord.Intents.default()
+    intents.members = False
+    manifests = {"stats": {"intents": [], "member_cache": ["joined", "online"]}}
+    flags, _ = member_cache_policy(manifests, intents)
+    assert flags.value == discord.MemberCacheFlags.none().value
+
+
+def test_undeclared_members_intent_keeps_the_full_cache():
+    intents = discord.Intents.default()
+    intents.members = True
+    manifests = {
+        "voice": {"intents": [], "member_cache": ["voice"]},
+        "legacy": {"intents": ["members"]},
+    }
+    flags, chunk_at_startup = member_cache_policy(manifests, intents)
+    assert flags.value == discord.MemberCacheFlags.from_intents(intents).value
+    assert chunk_at_startup
+
+
+class FakeGuild:
+    def __init__(self, guild_id, chunked=False):
+        self.id = guild_id
+        self.name = f"guild {guild_id}"
+        self.chunked = chunked
+        self.members = []
+        self.member_count = 3
+        self.chunk_calls = 0
+
+    async def chunk(self, cache=True):
+        self.chunk_calls += 1
+        await asyncio.sleep(0.01)
+        self.members = [object(), object(), object()]
+        self.chunked = True
+
+
+def test_guild_is_chunked_once_under_concurrent_callers():
+    chunker = GuildChunker()
+    guild = FakeGuild(1)
+
+    async def run():
+        await asyncio.gather(*(chunker.ensure_chunked(guild) for _ in range(5)))
+
+    asyncio.run(run())
+    assert guild.chunk_calls == 1
+    assert 1 in chunker.timings
+    assert chunker.locks == {}
+
+
+def test_chunked_guilds_are_skipped_and_concurrency_is_bounded():
+    chunker = GuildChunker(concurrency=1)
+    guilds = [FakeGuild(guild_id) for guild_id in range(3)] + [FakeGuild(3, chunked=True)]
+    running = []
+    peak = []
+
+    for guild in guilds[:3]:
+        original = guild.chunk
+
+        async def chunk(cache=True, original=original):
+            running.append(1)
+            peak.append(len(running))
+            await original(cache)
+            running.pop()
+        guild.chunk = chunk
+
+    async def run():
+        await asyncio.gather(*(chunker.ensure_chunked(guild) for guild in guilds))
+
+    asyncio.run(run())
+    assert max(peak) == 1
+    assert guilds[3].chunk_calls == 0
+    assert set(chunker.timings) == {0, 1, 2}
+
+
+def test_memory_report_orders_by_estimated_size():
+    small, large = FakeGuild(1, chunked=True), FakeGuild(2, chunked=True)
+    small.members = ["a"]
+    large.members = ["a" * 100] * 10
+    report = guild_memory_report([small, large])
+    assert [row[0] for row in report] == [large, small]
+    assert report[0][1:4] == (10, 3, True)
@@ -0,0 +1,118 @@
+# tests/test_message_index.py
+
+from datetime import datetime, timedelta, timezone
+import asyncio
+
+import discord
+
+from modules.message_index import MessageIndex
+
+
+def test_pop_author_groups_by_channel():
+    index = MessageIndex()
+    index.add(1, 100, 10, 1001)
+    index.add(1, 101, 10, 1002)
+    index.add(1, 100, 10, 1003)
+    index.add(1, 100, 11, 1004)
+    assert index.pop_author(1, 10) == {100: [1001, 1003], 101: [1002]}
+    assert index.pop_author(1, 10) == {}
+    assert index.pop_author(2, 11) == {}
+    assert index.pop_author(1, 11) == {100: [1004]}
+
+
+def test_per_author_limit_keeps_newest():
+    index = MessageIndex(per_author=3)
+    for message_id in range(5):
+        index.add(1, 100, 10, message_id)
+    assert index.pop_author(1, 10) == {100: [2, 3, 4]}
+
+
+def test_least_recently_active_author_is_dropped():
+    index = MessageIndex(max_authors=2)
+    index.add(1, 100, 10, 1)
+    index.add(1, 100, 11, 2)
+    index.add(1, 100, 10, 3)
+    index.add(1, 100, 12, 4)
+    assert index.pop_author(1, 11) == {}
+    assert index.pop_author(1, 10) == {100: [1, 3]}
+    assert index.pop_author(1, 12) == {100: [4]}
+
+
+def test_discard():
+    index = MessageIndex()
+    index.add(1, 100, 10, 1)
+    index.add(1, 100, 10, 2)
+    index.discard(1, 10, 1)
+    index.discard(1, 10, 99)
+    index.discard(2, 10, 1)
+    assert index.pop_author(1, 10) == {100: [2]}
+
+
+class FakeResponse:
+    status = 404
+    reason = "Not Found"
+
+
+class FakeMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def delete(self):
+        if self.id in self.channel.missing:
+            raise discord.NotFound(FakeResponse(), "Unknown Message")
+        self.channel.deleted.append([self.id])
+
+
+class FakeChannel:
+    def __init__(self, missing=()):
+        self.deleted = []
+        self.missing = set(missing)
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+    async def delete_messages(self, messages):
+        if any(message.id in self.missing for message in messages):
+            raise discord.NotFound(FakeResponse(), "Unknown Message")
+        self.deleted.append([message.id for message in messages])
+
+
+class FakeGuild:
+    def __init__(self, guild_id, channels):
+        self.id = guild_id
+        self.channels = channels
+
+    def get_channel_or_thread(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+def test_purge_author_bulk_deletes_recent_messages():
+    recent = discord.utils.time_snowflake(datetime.now(timezone.utc))
+    too_old = discord.utils.time_snowflake(datetime.now(timezone.utc) - timedelta(days=15))
+    index = MessageIndex(per_author=500)
+    for offset in range(150):
+        index.add(1, 100, 10, recent + offset)
+    index.add(1, 100, 10, too_old)
+    index.add(1, 101, 10, recent)
+    # Channel 101 is gone; its messages are skipped
+    channel = FakeChannel()
+    guild = FakeGuild(1, {100: channel})
+
+    assert asyncio.run(index.purge_author(guild, 10)) == 150
+    assert [len(chunk) for chunk in channel.deleted] == [100, 50]
+    assert asyncio.run(index.purge_author(guild, 10)) is None
+
+
+def test_purge_author_counts_only_messages_actually_deleted():
+    recent = discord.utils.time_snowflake(datetime.now(timezone.utc))
+    index = MessageIndex(per_author=500)
+    for offset in range(150):
+        index.add(1, 100, 10, recent + offset)
+    # Two messages in the second chunk were already deleted by someone else
+    channel = FakeChannel(missing={recent + 120, recent + 130})
+    guild = FakeGuild(1, {100: channel})
+
+    assert asyncio.run(index.purge_author(guild, 10)) == 148
+    assert len(channel.deleted[0]) == 100
+    assert [len(chunk) for chunk in channel.deleted[1:]] == [1] * 48
@@ -0,0 +1,54 @@
+# tests/test_metrics_registry.py
+
+import pytest
+
+from modules.metrics_registry import MetricsRegistry
+
+
+def test_counter_and_labels():
+    registry = MetricsRegistry()
+    events = registry.counter('events_total', 'Events handled', labels=('event',))
+    events.inc(event='on_message')
+    events.inc(2, event='on_message')
+    events.inc(event='say "hi"\n')
+    output = registry.render()
+    assert '# TYPE events_total counter' in output
+    assert 'events_total{event="on_message"} 3.0' in output
+    assert 'events_total{event="say \\"hi\\"\\n"} 1.0' in output
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 1.0' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3.0' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4.0' in lines
+    assert 'latency_seconds_sum 6.05' in lines
+    assert 'latency_seconds_count 4.0' in lines
+
+
+def test_registering_again_returns_the_existing_metric():
+    registry = MetricsRegistry()
+    first = registry.counter('requests_total', 'Requests')
+    first.inc()
+    assert registry.counter('requests_total', 'Requests') is first
+    with pytest.raises(ValueError):
+        registry.histogram('requests_total', 'Requests')
+
+
+def test_gauges_are_replaced_and_failures_skipped():
+    registry = MetricsRegistry()
+    registry.gauge('open_polls', 'Open polls', lambda: 1)
+    registry.gauge('open_polls', 'Open polls', lambda: 2)
+    registry.gauge('guild_members', 'Members', lambda: {("1",): 10, ("2",): 20}, labels=('guild',))
+    registry.gauge('broken', 'Fails to collect', lambda: 1 / 0)
+    output = registry.render()
+    assert 'open_polls 2.0' in output
+    assert 'guild_members{guild="2"} 20.0' in output
+    assert 'broken' not in output
+
+    registry.unregister('open_polls')
+    assert 'open_polls' not in registry.render()
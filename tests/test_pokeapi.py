@@ -0,0 +1,73 @@
+# tests/test_pokeapi.py
+
+import argparse
+import asyncio
+import json
+import socket
+
+import pytest
+from sqlalchemy import inspect, text
+
+import pokeapi
+from modules.database import engine
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def ingest_args(tmp_path, count, port):
+    return argparse.Namespace(base_url=None, concurrency=4, batch_size=10, limit=count, descriptions=True,
+                              checkpoint=str(tmp_path / "checkpoint.json"), restart=False,
+                              fixture=count, fixture_port=port, fixture_failure_rate=0.0)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert pokeapi.load_checkpoint(path, "https://pokeapi.co/api/v2") == set()
+    pokeapi.save_checkpoint(path, "https://pokeapi.co/api/v2", {3, 1, 2})
+    assert json.load(open(path))["done"] == [1, 2, 3]
+    assert pokeapi.load_checkpoint(path, "https://pokeapi.co/api/v2") == {1, 2, 3}
+    # A checkpoint of another server is ignored, and so is a corrupt one
+    assert pokeapi.load_checkpoint(path, "http://127.0.0.1:8765/api/v2") == set()
+    with open(path, "w") as file:
+        file.write('{"base_url": ')
+    assert pokeapi.load_checkpoint(path, "https://pokeapi.co/api/v2") == set()
+
+
+def test_failed_write_stops_ingest_and_rerun_resumes(tmp_path, monkeypatch):
+    write_batch = pokeapi.write_batch
+    calls = []
+
+    def failing_write_batch(engine, rows):
+        calls.append(len(rows))
+        if len(calls) == 3:
+            raise RuntimeError("disk full")
+        write_batch(engine, rows)
+
+    # ingest creates the table itself on a fresh database
+    assert not inspect(engine).has_table('pokedexentry')
+    # The checkpoint belongs to the base URL, so both runs use the same port
+    port = free_port()
+    monkeypatch.setattr(pokeapi, "write_batch", failing_write_batch)
+    with pytest.raises(RuntimeError, match="disk full"):
+        asyncio.run(pokeapi.main_async(ingest_args(tmp_path, 60, port)))
+    checkpoint = json.load(open(tmp_path / "checkpoint.json"))
+    assert len(checkpoint["done"]) == 20
+
+    written = []
+
+    def recording_write_batch(engine, rows):
+        written.extend(row["pokemon_id"] for row in rows)
+        write_batch(engine, rows)
+
+    monkeypatch.setattr(pokeapi, "write_batch", recording_write_batch)
+    asyncio.run(pokeapi.main_async(ingest_args(tmp_path, 60, port)))
+    # Only what the first run hadn't committed is fetched again
+    assert sorted(written + checkpoint["done"]) == list(range(1, 61))
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT pokemon_id, name, description FROM pokedexentry WHERE pokemon_id <= 60 ORDER BY pokemon_id")).all()
+    assert len(rows) == 60
+    assert rows[0] == (1, "fixturemon-1", "Fixture pokemon number 1.")
@@ -0,0 +1,100 @@
+# tests/test_poll.py
+
+import asyncio
+
+import pytest
+from sqlalchemy import inspect, text
+
+from modules.database import engine
+from modules import poll
+from modules.poll import PollEngine, PollState
+
+
+@pytest.fixture(scope="module", autouse=True)
+def poll_tables():
+    asyncio.run(poll.setup_poll_columns())
+    asyncio.run(poll.setup_poll_vote_columns())
+
+
+def read_votes(poll_id):
+    with engine.connect() as conn:
+        return dict(conn.execute(text('SELECT user_id, option FROM pollvote WHERE poll_id = :poll_id'), {'poll_id': poll_id}).all())
+
+
+def test_poll_tables():
+    columns = {column['name']: column for column in inspect(engine).get_columns('pollvote')}
+    assert set(columns) == {'id', 'poll_id', 'user_id', 'option'}
+    assert str(columns['id']['type']) == 'INTEGER'
+    indexes = {index['name']: index for index in inspect(engine).get_indexes('pollvote')}
+    assert indexes['ux_pollvote_poll_user']['unique']
+    assert {column['name'] for column in inspect(engine).get_columns('poll')} == {
+        'id', 'guild_id', 'channel_id', 'message_id', 'created_by', 'question', 'options', 'closed'}
+
+
+def test_votes_change_and_retract():
+    state = PollState(1, 1, 1, None, 10, "Lunch?", ["Pizza", "Sushi"], votes={20: 1})
+    assert state.counts == [0, 1]
+    assert state.vote(10, 0) == 0
+    assert state.vote(20, 0) == 0
+    assert state.counts == [2, 0]
+    # Voting for the same option again removes the vote
+    assert state.vote(10, 0) is None
+    assert state.counts == [1, 0]
+    assert state.pending == {10: None, 20: 0}
+
+
+def test_embed_shows_totals():
+    state = PollState(1, 1, 1, None, 10, "Lunch?", ["Pizza", "Sushi"], votes={1: 0, 2: 0, 3: 1})
+    embed = state.embed()
+    assert "(67%)" in embed.description
+    assert embed.footer.text.startswith("3 votes")
+    assert state.embed(final=True).title == "📊 Results: Lunch?"
+
+
+def test_flush_upserts_and_deletes_votes():
+    polls = PollEngine(None)
+    state = polls.polls[101] = PollState(101, 1, 1, None, 10, "Q", ["a", "b", "c"])
+    state.vote(1, 0)
+    state.vote(2, 1)
+    assert asyncio.run(polls.flush()) == 2
+    assert read_votes(101) == {1: 0, 2: 1}
+
+    state.vote(1, 2)
+    state.vote(2, 1)
+    state.vote(3, 0)
+    assert asyncio.run(polls.flush()) == 3
+    assert read_votes(101) == {1: 2, 3: 0}
+    assert asyncio.run(polls.flush()) == 0
+
+
+def test_failed_flush_keeps_newer_votes():
+    polls = PollEngine(None)
+    state = polls.polls[102] = PollState(102, 1, 1, None, 10, "Q", ["a", "b"])
+    state.vote(1, 0)
+    state.vote(2, 0)
+
+    def failing_write(batch):
+        # A vote arriving while the batch is being written must win over the batch
+        state.vote(1, 1)
+        raise RuntimeError("database is locked")
+
+    polls.write_votes = failing_write
+    assert asyncio.run(polls.flush()) == 0
+    assert state.pending == {1: 1, 2: 0}
+
+
+class FakeShardedBot:
+    shard_ids = [1]
+    shard_count = 2
+
+    def add_view(self, view, message_id=None):
+        pass
+
+
+def test_cluster_restores_only_polls_of_its_guilds():
+    own_guild, other_guild = (1 << 22) | 1, (2 << 22) | 1
+    polls = PollEngine(FakeShardedBot())
+    polls.load_open_polls = lambda: [PollState(1, own_guild, 1, None, 10, "Q", ["a", "b"]),
+                                     PollState(2, other_guild, 1, None, 10, "Q", ["a", "b"])]
+    asyncio.run(polls.restore())
+    assert list(polls.polls) == [1]
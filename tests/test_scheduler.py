@@ -0,0 +1,119 @@
+# tests/test_scheduler.py
+
+from datetime import datetime, timedelta
+import asyncio
+
+from modules.scheduler import TimerScheduler
+
+
+def run_scheduler(schedule, wait=0.3):
+    """Start a scheduler, let `schedule` add timers, and return the keys fired within `wait` seconds."""
+    fired = []
+
+    async def callback(key):
+        fired.append(key)
+
+    async def run():
+        scheduler = TimerScheduler()
+        scheduler.start()
+        schedule(scheduler, callback)
+        await asyncio.sleep(wait)
+        scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    return fired, scheduler
+
+
+def soon(seconds):
+    return datetime.utcnow() + timedelta(seconds=seconds)
+
+
+def test_timers_fire_in_deadline_order():
+    def schedule(scheduler, callback):
+        scheduler.schedule("late", soon(0.1), callback, "late")
+        scheduler.schedule("past", soon(-5), callback, "past")
+        scheduler.schedule("early", soon(0.05), callback, "early")
+        scheduler.schedule("never", soon(60), callback, "never")
+
+    fired, scheduler = run_scheduler(schedule)
+    assert fired == ["past", "early", "late"]
+    assert len(scheduler) == 1
+
+
+def test_rescheduling_replaces_the_timer():
+    def schedule(scheduler, callback):
+        scheduler.schedule("key", soon(0.05), callback, "first")
+        scheduler.schedule("key", soon(0.1), callback, "second")
+
+    fired, _ = run_scheduler(schedule)
+    assert fired == ["second"]
+
+
+def test_cancel():
+    def schedule(scheduler, callback):
+        scheduler.schedule("kept", soon(0.05), callback, "kept")
+        scheduler.schedule("cancelled", soon(0.05), callback, "cancelled")
+        assert scheduler.cancel("cancelled")
+        assert not scheduler.cancel("unknown")
+
+    fired, scheduler = run_scheduler(schedule)
+    assert fired == ["kept"]
+    assert len(scheduler) == 0
+
+
+def test_failing_callback_does_not_stop_the_scheduler():
+    async def failing():
+        raise RuntimeError("boom")
+
+    def schedule(scheduler, callback):
+        scheduler.schedule("failing", soon(0), failing)
+        scheduler.schedule("after", soon(0.05), callback, "after")
+
+    fired, _ = run_scheduler(schedule)
+    assert fired == ["after"]
+
+
+def test_running_callbacks_are_kept_and_cancelled_on_stop():
+    started = asyncio.Event()
+    cancelled = []
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        scheduler = TimerScheduler()
+        scheduler.start()
+        scheduler.schedule("slow", soon(0), slow)
+        await started.wait()
+        running = len(scheduler.fire_tasks)
+        scheduler.stop()
+        await asyncio.sleep(0)
+        return running, len(scheduler.fire_tasks)
+
+    assert asyncio.run(run()) == (1, 0)
+    assert cancelled == [True]
+
+
+def test_finished_callbacks_are_released():
+    async def run():
+        fired = asyncio.Event()
+
+        async def callback():
+            fired.set()
+
+        scheduler = TimerScheduler()
+        scheduler.start()
+        scheduler.schedule("key", soon(0), callback)
+        await fired.wait()
+        await asyncio.sleep(0)
+        remaining = set(scheduler.fire_tasks)
+        scheduler.stop()
+        return remaining
+
+    assert asyncio.run(run()) == set()
@@ -0,0 +1,34 @@
+# tests/test_sharding.py
+
+from modules.sharding import owns_guild, shard_for_guild
+
+
+class FakeBot:
+    def __init__(self, shard_ids=None, shard_count=None):
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+
+
+def guild_on_shard(shard_id, shard_count, offset=0):
+    return ((shard_id + offset * shard_count) << 22) | 12345
+
+
+def test_shard_for_guild():
+    assert shard_for_guild(guild_on_shard(3, 4), 4) == 3
+    assert shard_for_guild(guild_on_shard(3, 4, offset=5), 4) == 3
+    assert shard_for_guild(81384788765712384, 1) == 0
+
+
+def test_cluster_worker_owns_only_its_shards():
+    bot = FakeBot(shard_ids=[2, 3], shard_count=4)
+    assert owns_guild(bot, guild_on_shard(2, 4))
+    assert owns_guild(bot, guild_on_shard(3, 4, offset=7))
+    assert not owns_guild(bot, guild_on_shard(0, 4))
+    assert not owns_guild(bot, guild_on_shard(1, 4))
+
+
+def test_unsharded_bot_owns_every_guild():
+    assert owns_guild(FakeBot(), guild_on_shard(1, 4))
+    # A plain Bot has shard_count but no shard_ids
+    assert owns_guild(FakeBot(shard_count=1), guild_on_shard(1, 4))
+    assert owns_guild(object(), 1)
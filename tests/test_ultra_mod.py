@@ -0,0 +1,258 @@
+# tests/test_ultra_mod.py
+
+from datetime import datetime, timedelta
+import asyncio
+
+import discord
+from sqlalchemy import inspect
+
+from modules.database import engine
+from modules import ultra_mod
+
+
+def table_columns(table_name):
+    return {column['name'] for column in inspect(engine).get_columns(table_name)}
+
+
+def table_indexes(table_name):
+    return {index['name']: index['column_names'] for index in inspect(engine).get_indexes(table_name)}
+
+
+def test_serveruser_moderation_columns():
+    asyncio.run(ultra_mod.setup_server_user_columns())
+    assert {'warnings', 'automod', 'banned', 'muted', 'locked_out', 'notes'} <= table_columns('serveruser')
+
+
+def test_servernote_table():
+    asyncio.run(ultra_mod.setup_note_columns())
+    assert table_columns('servernote') == {'id', 'server_id', 'user_id', 'author_id', 'created_at', 'content'}
+    assert table_indexes('servernote')['ix_servernote_server_user'] == ['server_id', 'user_id', 'id']
+
+
+def test_massactionjob_table():
+    asyncio.run(ultra_mod.setup_mass_action_columns())
+    assert table_columns('massactionjob') == {'id', 'guild_id', 'channel_id', 'moderator_id', 'action', 'targets', 'cursor', 'status', 'created_at'}
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+        self.reason = "Forbidden"
+
+
+class FakeBulkBanResult:
+    def __init__(self, banned):
+        self.banned = banned
+
+
+class FakeGuild:
+    def __init__(self, guild_id=1, failing=(), bulk_ban_fails=False):
+        self.id = guild_id
+        self.failing = set(failing)
+        self.bulk_ban_fails = bulk_ban_fails
+        self.banned = []
+        self.kicked = []
+
+    async def bulk_ban(self, users):
+        if self.bulk_ban_fails:
+            raise discord.HTTPException(FakeResponse(403), "Missing Permissions")
+        banned = [user for user in users if user.id not in self.failing]
+        self.banned.extend(user.id for user in banned)
+        return FakeBulkBanResult(banned)
+
+    async def ban(self, user):
+        if user.id in self.failing:
+            raise discord.HTTPException(FakeResponse(403), "Missing Permissions")
+        self.banned.append(user.id)
+
+    async def kick(self, user):
+        if user.id in self.failing:
+            raise discord.HTTPException(FakeResponse(403), "Missing Permissions")
+        self.kicked.append(user.id)
+
+
+def test_mass_ban_uses_bulk_ban():
+    guild = FakeGuild(failing={3})
+    done = asyncio.run(ultra_mod.MassActionRunner().apply_batch(guild, 'ban', [1, 2, 3]))
+    assert done == [1, 2]
+    assert guild.banned == [1, 2]
+
+
+def test_mass_ban_falls_back_to_single_bans():
+    guild = FakeGuild(failing={2}, bulk_ban_fails=True)
+    done = asyncio.run(ultra_mod.MassActionRunner().apply_batch(guild, 'ban', [1, 2, 3]))
+    assert done == [1, 3]
+    assert sorted(guild.banned) == [1, 3]
+
+
+def test_mass_kick_skips_failures():
+    guild = FakeGuild(failing={1})
+    done = asyncio.run(ultra_mod.MassActionRunner(concurrency=2).apply_batch(guild, 'kick', [1, 2, 3, 4]))
+    assert done == [2, 3, 4]
+
+
+def test_stop_cancels_running_jobs():
+    async def run():
+        runner = ultra_mod.MassActionRunner()
+        never = asyncio.Event()
+        runner.tasks[1] = asyncio.create_task(never.wait())
+        runner.resume_task = asyncio.create_task(never.wait())
+        tasks = [runner.tasks[1], runner.resume_task]
+        await runner.stop()
+        return tasks, runner.resume_task
+    tasks, resume_task = asyncio.run(run())
+    assert all(task.cancelled() for task in tasks)
+    assert resume_task is None
+
+
+def test_timedpunishment_table():
+    asyncio.run(ultra_mod.setup_timed_punishment_columns())
+    assert table_columns('timedpunishment') == {'id', 'guild_id', 'user_id', 'action', 'expires_at', 'active'}
+    assert table_indexes('timedpunishment')['ix_timedpunishment_active'] == ['active', 'expires_at']
+
+
+class FakeShardedBot:
+    shard_ids = [1]
+    shard_count = 2
+
+
+OWN_GUILD = (1 << 22) | 1
+OTHER_GUILD = (2 << 22) | 1
+
+
+def test_cluster_resumes_only_jobs_of_its_guilds():
+    runner = ultra_mod.MassActionRunner()
+    runner.bot = FakeShardedBot()
+    runner.load_unfinished_jobs = lambda: [(1, OWN_GUILD), (2, OTHER_GUILD), (3, OWN_GUILD)]
+    started = []
+    runner.start = started.append
+    asyncio.run(runner.resume_jobs())
+    assert started == [1, 3]
+
+
+def test_cluster_schedules_only_punishments_of_its_guilds():
+    async def run():
+        punishments = ultra_mod.TimedPunishments()
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        punishments.load_active = lambda: [(1, OWN_GUILD, "10", 'mute', expires_at), (2, OTHER_GUILD, "11", 'ban', expires_at)]
+        punishments.start(FakeShardedBot())
+        punishments.scheduler.stop()
+        return set(punishments.scheduler.entries)
+    assert asyncio.run(run()) == {(OWN_GUILD, 10, 'mute')}
+
+
+class FakeRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+
+
+class FakeChannel:
+    def __init__(self, channel_id, failing=False):
+        self.id = channel_id
+        self.failing = failing
+        self.overwrites = {}
+        self.updates = 0
+
+    def overwrites_for(self, role):
+        allow, deny = self.overwrites.get(role.id, discord.PermissionOverwrite()).pair()
+        return discord.PermissionOverwrite.from_pair(allow, deny)
+
+    async def set_permissions(self, role, overwrite):
+        await asyncio.sleep(0)
+        if self.failing:
+            raise discord.HTTPException(FakeResponse(403), "Missing Permissions")
+        self.updates += 1
+        self.overwrites[role.id] = overwrite
+
+
+class FakeRoleGuild:
+    def __init__(self, channels):
+        self.id = 1
+        self.channels = channels
+        self.roles = []
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def create_role(self, name):
+        role = FakeRole(len(self.roles) + 1, name)
+        self.roles.append(role)
+        return role
+
+
+MUTED = ultra_mod.MODERATION_ROLES["Muted"]
+
+
+def test_overwrites_are_synced_once_and_only_where_missing():
+    current = FakeChannel(1)
+    stale = FakeChannel(2)
+    guild = FakeRoleGuild([current, stale])
+    guild.roles.append(FakeRole(7, "Muted"))
+    current.overwrites[7] = discord.PermissionOverwrite(**MUTED)
+    sync = ultra_mod.RoleOverwriteSync()
+
+    async def run():
+        return await asyncio.gather(*(sync.ensure_role(guild, "Muted", MUTED) for _ in range(3)))
+
+    roles = asyncio.run(run())
+    assert {role.id for role in roles} == {7}
+    assert (current.updates, stale.updates) == (0, 1)
+    assert sync.is_current(stale, roles[0], MUTED)
+
+    # A channel that changed behind the bot's back is only checked again after invalidation
+    stale.overwrites.clear()
+    asyncio.run(sync.ensure_role(guild, "Muted", MUTED))
+    assert stale.updates == 1
+    sync.invalidate(guild.id)
+    asyncio.run(sync.ensure_role(guild, "Muted", MUTED))
+    assert (current.updates, stale.updates) == (0, 2)
+
+
+def test_failed_overwrites_are_retried():
+    failing = FakeChannel(1, failing=True)
+    guild = FakeRoleGuild([failing, FakeChannel(2)])
+    sync = ultra_mod.RoleOverwriteSync()
+
+    role = asyncio.run(sync.ensure_role(guild, "Muted", MUTED))
+    assert [role.name for role in guild.roles] == ["Muted"]
+    assert (guild.id, role.id) not in sync.synced
+
+    failing.failing = False
+    asyncio.run(sync.ensure_role(guild, "Muted", MUTED))
+    assert (guild.id, role.id) in sync.synced
+    assert [channel.updates for channel in guild.channels] == [1, 1]
+
+
+class FakeRecord:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class FakeMember:
+    id = 10
+
+
+def admin_view(monkeypatch, stored):
+    monkeypatch.setattr(ultra_mod, "update_server_user", lambda user_id, guild_id, **values: stored)
+
+    async def create():
+        view = ultra_mod.AdminUserView(FakeMember(), FakeRoleGuild([]))
+        server_user = FakeRecord(warnings=1, automod=True, muted=False, banned=False, locked_out=False, invited_by=None)
+        user = FakeRecord(global_join_date=datetime(2024, 1, 1))
+        view.snapshot = ultra_mod.AdminSnapshot(server_user, user, None, None, None)
+        return view
+    return asyncio.run(create())
+
+
+def test_admin_snapshot_follows_stored_changes(monkeypatch):
+    view = admin_view(monkeypatch, stored=True)
+    assert (view.snapshot.inviter_name, view.snapshot.note_count) == ("Unknown", 0)
+    assert view.save(warnings=2, muted=True)
+    assert (view.snapshot.warnings, view.snapshot.muted) == (2, True)
+
+
+def test_admin_snapshot_ignores_failed_writes(monkeypatch):
+    view = admin_view(monkeypatch, stored=False)
+    assert not view.save(warnings=2)
+    assert view.snapshot.warnings == 1
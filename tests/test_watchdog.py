@@ -0,0 +1,86 @@
+# tests/test_watchdog.py
+
+from traceback import FrameSummary
+import asyncio
+import os
+import threading
+import time
+
+from modules.watchdog import PROJECT_ROOT, LoopWatchdog, Watchdog, call_site
+
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, content=None, embed=None, ephemeral=False):
+        self.sent.append(content if embed is None else embed.title)
+
+
+class FakeInteraction:
+    def __init__(self, user):
+        self.user = user
+        self.response = FakeResponse()
+
+
+class FakeBot:
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def is_owner(self, user):
+        return user == self.owner
+
+
+def blocking_report(user):
+    watchdog = LoopWatchdog(None, None)
+    interaction = FakeInteraction(user)
+    asyncio.run(Watchdog.blocking_report.callback(Watchdog(FakeBot("owner"), watchdog), interaction))
+    return interaction.response.sent
+
+
+def test_blocking_report_is_owner_only():
+    # A guild administrator who doesn't own the bot is refused too
+    assert blocking_report("admin") == ["Only the bot owner can view the blocking report."]
+    assert blocking_report("owner") == ["⏱️ Event Loop Blocking"]
+
+
+def test_call_site_is_the_innermost_project_frame():
+    game = os.path.join(PROJECT_ROOT, "modules", "game.py")
+    stack = [
+        FrameSummary(os.path.join(PROJECT_ROOT, "main.py"), 10, "on_message"),
+        FrameSummary(game, 42, "handle_catch"),
+        FrameSummary("/usr/lib/python3/site-packages/sqlalchemy/orm/query.py", 7, "all"),
+    ]
+    assert call_site(stack) == f"{os.path.join('modules', 'game.py')}:42 in handle_catch"
+    # Without any project frame the innermost frame is used
+    assert call_site(stack[2:]) == "/usr/lib/python3/site-packages/sqlalchemy/orm/query.py:7 in all"
+
+
+def block_loop(seconds):
+    time.sleep(seconds)
+
+
+def test_blocked_time_is_charged_to_the_blocking_call_site():
+    loop = asyncio.new_event_loop()
+    watchdog = LoopWatchdog(loop, threading.get_ident(), threshold=0.1, interval=0.02)
+
+    async def run():
+        await asyncio.sleep(0.1)
+        block_loop(0.5)
+        # Let the watchdog see the loop respond again and close the episode
+        await asyncio.sleep(0.2)
+
+    watchdog.start()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        watchdog.stop()
+        loop.close()
+
+    site, seconds, samples, stack = watchdog.report()[0]
+    assert site.startswith(os.path.join("tests", "test_watchdog.py"))
+    assert site.endswith("in block_loop")
+    assert 0.3 < seconds < 0.7
+    assert samples > 1
+    assert "time.sleep(seconds)" in stack
+    assert watchdog.episode_sites == {}